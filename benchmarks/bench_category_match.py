@@ -0,0 +1,85 @@
+"""Micro-benchmark: per-call cost of category matching at thousands of links.
+
+Compares the compiled, memoized CategoryMatcher with the keyword-dict +
+difflib approach find_closest_heading used before it, on a stream of LLM-style
+category strings with realistic repetition.
+
+    python benchmarks/bench_category_match.py --links 1000 10000 100000
+"""
+import argparse
+import difflib
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pipeline.category_match import CategoryMatcher
+
+HEADINGS = [
+    'Shipbuilding',
+    'Skilled Trades and Welding',
+    'Outreach and Communication and Sales and Pitching',
+    'Startup Operating Principles',
+    'Personal Productivity System',
+    'Robotics and Hardware and Electronics',
+    'Machine Learning and Deep Learning and Foundation Models and Artificial Intelligence',
+    '3D and 3D reconstruction and Spatial Computing',
+    'Unsorted',
+]
+
+RETURNED = [
+    'Shipbuilding', 'shipbuilding', 'Naval ship design', 'Welding', 'skilled trades and welding',
+    'Sales and Pitching', 'outreach, communication, sales, and pitching', 'Startup Operating Principles',
+    'Personal Productivity', 'Robotics, hardware, and electronics', 'Machine Learning', 'AI',
+    'machine learning, deep learning, foundation models, artificial intelligence', '3D reconstruction',
+    'Spatial computing', 'Unsorted', 'Shipbuildng', 'Robotcs and Hardwar', 'Cooking', 'Travel',
+]
+
+
+def legacy_match(returned_category, existing_headings):
+    # The pre-compiled version: table rebuilt per call, substring scan, then difflib
+    category_keywords = {
+        'Shipbuilding': ['shipbuilding', 'ship', 'naval'],
+        'Skilled Trades and Welding': ['skilled', 'trades', 'welding', 'weld', 'skilled trades'],
+        'Outreach and Communication and Sales and Pitching': ['outreach', 'communication', 'sales', 'pitching', 'pitch'],
+        'Startup Operating Principles': ['startup', 'operating', 'principles', 'startup operating'],
+        'Personal Productivity System': ['personal', 'productivity', 'system', 'personal productivity'],
+        'Robotics and Hardware and Electronics': ['robotics', 'hardware', 'electronics'],
+        'Machine Learning and Deep Learning and Foundation Models and Artificial Intelligence': ['machine learning', 'deep learning', 'foundation models', 'artificial intelligence', 'ai', 'ml'],
+        '3D and 3D reconstruction and Spatial Computing': ['3d', 'spatial', 'reconstruction', '3d reconstruction'],
+        'Unsorted': ['unsorted']
+    }
+    returned_category_lower = returned_category.lower()
+    for heading, keywords in category_keywords.items():
+        if any(keyword in returned_category_lower for keyword in keywords):
+            return heading
+    closest_match = difflib.get_close_matches(returned_category, existing_headings, n=1)
+    if closest_match:
+        return closest_match[0]
+    return 'Unsorted'
+
+
+def time_per_call(match, categories):
+    start = time.perf_counter()
+    for category in categories:
+        match(category)
+    return (time.perf_counter() - start) / len(categories)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--links', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'links':>8}  {'legacy us/call':>15}  {'compiled us/call':>17}  {'speedup':>8}")
+    for count in args.links:
+        categories = [rng.choice(RETURNED) for _ in range(count)]
+        legacy = time_per_call(lambda category: legacy_match(category, HEADINGS), categories)
+        # A fresh matcher per size so compile time and a cold memo are included
+        start = time.perf_counter()
+        matcher = CategoryMatcher(HEADINGS, default='Unsorted')
+        compiled = (time.perf_counter() - start) / count + time_per_call(matcher.match, categories)
+        print(f"{count:>8}  {legacy * 1e6:>15.2f}  {compiled * 1e6:>17.2f}  {legacy / compiled:>7.1f}x")
@@ -0,0 +1,148 @@
+"""End-to-end throughput of categorize.main and classify_links, fully offline.
+
+The Google Doc comes from a fake docs_service, pages from a local corpus
+server and completions from the OpenAI stub (with configurable latency and
+token accounting). Each size runs in a fresh subprocess, so peak RSS is that
+run's own. Reports links/sec, p50/p99 latency per stage and peak RSS.
+
+    python benchmarks/bench_pipeline.py --links 100 1000 10000 100000
+    python benchmarks/bench_pipeline.py --target classify --links 1000 --llm-latency 0.5 --llm-only
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+from benchmarks.fakes import FakeDocsService, start_corpus_server, synthetic_document, synthetic_link_file
+from pipeline.stub_server import start_stub_server
+
+TARGETS = ('categorize', 'classify')
+
+
+def timed(samples, stage, func):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            samples[stage].append(time.perf_counter() - start)
+    return wrapper
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[round(p / 100 * (len(ordered) - 1))]
+
+
+def run_categorize(links, corpus_port, fetcher, samples):
+    sys.path.insert(0, os.path.join(ROOT, 'categorize_links'))
+    import categorize
+    from pipeline import engine
+
+    categorize.pages.fetcher = fetcher
+    categorize.docs_service = FakeDocsService(synthetic_document(corpus_port, links))
+    categorize.pages.download = timed(samples, 'fetch', categorize.pages.download)
+    categorize.pages.parse = timed(samples, 'parse', categorize.pages.parse)
+    engine.cached_completion = timed(samples, 'classify', engine.cached_completion)
+    categorize.build_updates = timed(samples, 'update', categorize.build_updates)
+    categorize.main('bench-document')
+    return len(categorize.docs_service.requests)
+
+
+def run_classify(links, corpus_port, fetcher, samples, local):
+    sys.path.insert(0, os.path.join(ROOT, 'categorize_links_text_file'))
+    import batch_classify
+    from pipeline import engine
+
+    synthetic_link_file('links.txt', corpus_port, links)
+    batch_classify.pages.fetcher = fetcher
+    batch_classify.pages.download = timed(samples, 'fetch', batch_classify.pages.download)
+    batch_classify.pages.parse = timed(samples, 'parse', batch_classify.pages.parse)
+    batch_classify.classify_locally = timed(samples, 'route', batch_classify.classify_locally)
+    engine.cached_completion = timed(samples, 'classify', engine.cached_completion)
+    batch_classify.classify_links('links.txt', local=local)
+    with open('classified_links.txt') as f:
+        return sum(1 for _ in f)
+
+
+def child(args):
+    """Run one target at one size in this process and print the measurements as JSON."""
+    workdir = tempfile.mkdtemp(prefix='bench-pipeline-')
+    os.chdir(workdir)
+    # Set before the target module is imported: its clients and limits are built at import time
+    os.environ.update({
+        'OPENAI_BASE_URL': f'http://127.0.0.1:{args.openai_port}/v1',
+        'OPENAI_API_KEY': 'stub',
+        'PIPELINE_CACHE_DIR': os.path.join(workdir, 'cache'),
+        'LLM_CACHE': 'off',
+        'OPENAI_RPM': str(10 ** 9),
+        'OPENAI_TPM': str(10 ** 12),
+    })
+    from pipeline.fetch import Fetcher
+    logging.disable(logging.WARNING)
+
+    # Every page lives on one local host, so per-host politeness would only measure the sleep
+    fetcher = Fetcher(max_workers=args.fetch_workers, per_host=args.fetch_workers, min_interval=0, timeout=30)
+    samples = defaultdict(list)
+    start = time.perf_counter()
+    if args.child == 'categorize':
+        output = run_categorize(args.size, args.corpus_port, fetcher, samples)
+    else:
+        output = run_classify(args.size, args.corpus_port, fetcher, samples, local=not args.llm_only)
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        'elapsed': elapsed,
+        'output': output,
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'stages': {stage: {'count': len(values), 'p50': percentile(values, 50), 'p99': percentile(values, 99)}
+                   for stage, values in samples.items()},
+    }))
+
+
+def main(args):
+    corpus = start_corpus_server()
+    server, state = start_stub_server(latency=args.llm_latency)
+    print(f"{'target':<11} {'links':>7} {'links/s':>9} {'peak MB':>8} {'LLM calls':>9} {'tokens in/out':>15}  stage p50/p99 ms")
+    for target in args.target:
+        for size in args.links:
+            requests, prompt_tokens, completion_tokens = state.requests, state.prompt_tokens, state.completion_tokens
+            command = [sys.executable, os.path.abspath(__file__), '--child', target, '--size', str(size),
+                       '--corpus-port', str(corpus.server_port), '--openai-port', str(server.server_port),
+                       '--fetch-workers', str(args.fetch_workers)]
+            if args.llm_only:
+                command.append('--llm-only')
+            result = json.loads(subprocess.run(command, check=True, capture_output=True, text=True).stdout.splitlines()[-1])
+            stages = '  '.join(f"{stage} {timing['p50'] * 1e3:.1f}/{timing['p99'] * 1e3:.1f}"
+                               for stage, timing in result['stages'].items())
+            tokens = f"{state.prompt_tokens - prompt_tokens}/{state.completion_tokens - completion_tokens}"
+            print(f"{target:<11} {size:>7} {size / result['elapsed']:>9.1f} {result['peak_rss_mb']:>8.1f} "
+                  f"{state.requests - requests:>9} {tokens:>15}  {stages}", flush=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--target', nargs='+', choices=TARGETS, default=list(TARGETS))
+    parser.add_argument('--links', type=int, nargs='+', default=[100, 1000, 10000, 100000])
+    parser.add_argument('--llm-latency', type=float, default=0.05, help="stub seconds per completion")
+    parser.add_argument('--fetch-workers', type=int, default=16)
+    parser.add_argument('--llm-only', action='store_true', help="classify: skip the local classifier")
+    parser.add_argument('--child', choices=TARGETS, help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--corpus-port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--openai-port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+    else:
+        main(args)
@@ -0,0 +1,131 @@
+"""Offline stand-ins for the services the classifiers talk to.
+
+FakeDocsService replaces googleapiclient's Docs service with one synthetic
+document, and start_corpus_server serves a deterministic corpus of HTML pages
+from a local HTTP server. The OpenAI side is pipeline.stub_server.
+"""
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TOPICS = {
+    'Shipbuilding': 'hull keel shipyard naval vessel steel plate launch dry dock frigate',
+    'Skilled Trades and Welding': 'weld bead torch mig tig arc filler joint apprentice trade',
+    'Startup Operating Principles': 'founder startup runway hiring product market fit investors growth',
+    'Personal Productivity System': 'habit focus calendar inbox notes routine priorities review',
+    'Robotics and Hardware and Electronics': 'robot actuator servo sensor pcb firmware motor controller',
+    'Machine Learning and Deep Learning': 'model training gradient transformer dataset inference neural loss',
+}
+
+
+def topic_of(page):
+    return list(TOPICS)[page % len(TOPICS)]
+
+
+def page_html(page):
+    """A few KB of topical HTML for page number page, the same on every request."""
+    words = TOPICS[topic_of(page)].split()
+    paragraphs = []
+    for n in range(12):
+        sentence = ' '.join(words[(page + n + i) % len(words)] for i in range(24))
+        paragraphs.append(f"<p>{sentence.capitalize()}.</p>")
+    return (f"<html><head><title>Page {page}</title><style>p {{margin: 0}}</style></head>"
+            f"<body><nav>Home | About</nav><h1>{topic_of(page)} notes {page}</h1>{''.join(paragraphs)}"
+            f"<script>var page = {page};</script></body></html>").encode('utf-8')
+
+
+class CorpusHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        match = re.fullmatch(r'/page/(\d+)', self.path)
+        if not match:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = page_html(int(match.group(1)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_corpus_server(port=0):
+    """Serve /page/<n> on a background thread; returns the server (see server.server_port)."""
+    server = ThreadingHTTPServer(('127.0.0.1', port), CorpusHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def page_url(port, page):
+    return f'http://127.0.0.1:{port}/page/{page}'
+
+
+class _Request:
+    def __init__(self, response):
+        self.response = response
+
+    def execute(self):
+        return self.response
+
+
+class FakeDocsService:
+    """Serves one document for documents().get() and keeps every batchUpdate request it is sent."""
+
+    def __init__(self, content):
+        self.content = content
+        self.requests = []
+
+    def documents(self):
+        return self
+
+    def get(self, documentId):
+        return _Request({'documentId': documentId, 'body': {'content': self.content}})
+
+    def batchUpdate(self, documentId, body):
+        self.requests.extend(body['requests'])
+        return _Request({'documentId': documentId, 'replies': [{} for _ in body['requests']]})
+
+
+def synthetic_document(port, links, headings=tuple(TOPICS)):
+    """Docs body with the given HEADING_1s, each holding one filed link, then an Unsorted heading with links pages."""
+    content = []
+    index = 1
+
+    def paragraph(text, style='NORMAL_TEXT'):
+        nonlocal index
+        end = index + len(text)
+        content.append({'startIndex': index, 'endIndex': end, 'paragraph': {
+            'elements': [{'startIndex': index, 'endIndex': end, 'textRun': {'content': text}}],
+            'paragraphStyle': {'namedStyleType': style}}})
+        index = end
+
+    for n, heading in enumerate(headings):
+        paragraph(heading + '\n', 'HEADING_1')
+        paragraph(page_url(port, n) + '\n')
+    paragraph('Unsorted\n', 'HEADING_1')
+    for page in range(links):
+        paragraph(page_url(port, len(headings) + page) + '\n')
+    return content
+
+
+def synthetic_link_file(path, port, links, headings=tuple(TOPICS), filed_per_heading=5):
+    """Link file in batch_classify's format: categories with a few filed links each, then unsorted links."""
+    with open(path, 'w') as f:
+        page = 0
+        for heading in headings:
+            f.write(heading + '\n')
+            for _ in range(filed_per_heading):
+                # Pages cycle through the topics, so step a whole cycle to stay on this heading's topic
+                while topic_of(page) != heading:
+                    page += 1
+                f.write(page_url(port, page) + '\n')
+                page += 1
+            f.write('\n')
+        f.write('unsorted\n')
+        for n in range(links):
+            f.write(page_url(port, page + n) + '\n')
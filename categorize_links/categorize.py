@@ -1,6 +1,6 @@
+import argparse
 import re
-import requests
-from bs4 import BeautifulSoup
+import sys
 from openai import OpenAI
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
@@ -11,18 +11,37 @@ from dotenv import load_dotenv
 import os
 import pickle
 import logging
-import difflib
+from doc_index import DocumentIndex, heading_text
+from doc_updates import chunk_updates, plan_updates
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pipeline.batching import batch_tokens, count_tokens, item_output_tokens, max_completion_tokens, pack_batches
+from pipeline.category_match import compiled_matcher
+from pipeline.dead_letter import DeadLetterQueue
+from pipeline.dispatch import Dispatcher
+from pipeline.engine import ClassificationRun, LLMClassifier
+from pipeline.journal import DONE, FAILED, Journal
+from pipeline.llm_cache import LLMCache
+from pipeline.metrics import DOCS_UPDATE_CALLS, DOCS_UPDATE_REQUESTS, METRICS_PATH, REGISTRY, SampledLog
+from pipeline.pages import PageLoader
+from pipeline.seen import SeenIndex
+from pipeline.structured import TOOL_NAME, structured_params, valid_items
 
 # Load environment variables
 load_dotenv()
 
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+# Retries on 429 are left to the dispatcher so every in-flight request backs off together
+client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=0)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+# Full responses and batch contents are too large to log for every batch
+sampled_debug = SampledLog(logger)
 
-# Set up OpenAI API key
+pages = PageLoader(timeout=30)
+llm_cache = LLMCache()
+dispatcher = Dispatcher(max_in_flight=4, rpm=int(os.getenv('OPENAI_RPM', 3500)), tpm=int(os.getenv('OPENAI_TPM', 160000)))
 
 # Set up Google Docs API
 SCOPES = ['https://www.googleapis.com/auth/documents']
@@ -48,330 +67,320 @@ def get_google_creds():
             pickle.dump(creds, token)
     return creds
 
-creds = get_google_creds()
-docs_service = build('docs', 'v1', credentials=creds)
+# Built on first use, so importing this module doesn't start an OAuth flow
+docs_service = None
+
+def get_docs_service():
+    global docs_service
+    if docs_service is None:
+        docs_service = build('docs', 'v1', credentials=get_google_creds())
+    return docs_service
 
 def get_document_content(document_id):
     try:
-        document = docs_service.documents().get(documentId=document_id).execute()
+        document = get_docs_service().documents().get(documentId=document_id).execute()
         return document['body']['content']
     except HttpError as error:
         logger.error(f"An error occurred: {error}")
         return None
 
-def extract_headings_and_links(content):
+def extract_headings_and_links(content, seen=None, source=None):
+    """Links under each HEADING_1; with seen, links claimed elsewhere (or earlier in this document) are left out."""
     headings = {}
     current_heading = "Unsorted"
     for element in content:
         if 'paragraph' in element:
             paragraph = element['paragraph']
             if 'paragraphStyle' in paragraph and paragraph['paragraphStyle'].get('namedStyleType') == 'HEADING_1':
-                current_heading = paragraph['elements'][0]['textRun']['content'].strip()
+                current_heading = heading_text(paragraph)
                 headings[current_heading] = []
                 # logger.info(f"Found heading: {current_heading}")
             elif 'elements' in paragraph:
                 text = paragraph['elements'][0]['textRun']['content']
                 match = re.search(r'(https?://\S+)', text)
-                if match:
+                if match and (seen is None or seen.claim(match.group(1), source)):
                     headings[current_heading].append(match.group(1))
                     logger.info(f"Found link under {current_heading}: {match.group(1)}")
     return headings
 
-def extract_text_from_url(url):
-    try:
-        response = requests.get(url)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        extracted_text = soup.get_text()
-        # logger.info(f"Extracted text from {url}: {extracted_text[:10]}...")  # Log the first 500 characters of the extracted text
-        return extracted_text
-    except Exception as e:
-        logger.error(f"Error extracting text from {url}: {e}")
-        return ""
-
-def batch_categorize_and_summarize(links, headings):
-    prompt = (
+MODEL = "gpt-3.5-turbo"
+# Rounds a link gets to come back with a valid result before it is filed as Unsorted
+MAX_ATTEMPTS = 3
+SYSTEM_PROMPT = "You are a helpful assistant that categorizes and summarizes text."
+
+def categorize_instructions(headings):
+    return (
         f"Categorize each of the following texts into one of these categories exactly as they are written: "
         f"{', '.join(headings)}. If it doesn't fit any category, categorize it as 'Unsorted'. "
         f"Then provide a brief summary (min 90 words, max 100 words) for each. Bias the summary towards towards unique, actionable, new insights.  Do not waste time beginning the summary with phrases like 'this blog,' 'this article', 'this post', 'this content', 'this site', etc.  Skip to the insights "
-        f"For each text, always summarize and categorize in given format: \n\n"
-        f"[number]:\nCategory: [category]\nSummary: [summary]\n\n"
-        f"Always use the brackets [] to wrap the number "
+        f"Record the number, category and summary of every text in a single call to {TOOL_NAME}.\n\n"
     )
+
+def allowed_categories(headings):
+    categories = list(headings)
+    if 'Unsorted' not in categories:
+        categories.append('Unsorted')
+    return categories
+
+def categorize_item_schema(headings):
+    return {
+        'type': 'object',
+        'properties': {
+            'id': {'type': 'integer', 'minimum': 1, 'description': 'The number of the link'},
+            'category': {'type': 'string', 'enum': allowed_categories(headings)},
+            'summary': {'type': 'string', 'minLength': 1},
+        },
+        'required': ['id', 'category', 'summary'],
+    }
+
+def categorize_request(links, headings):
+    prompt = categorize_instructions(headings)
     for i, link in enumerate(links):
         prompt += f"Link {i+1}: {link['text'][:1000]}\n\n"
 
     # logger.info(f"OpenAI API prompt: {prompt}")  # Log the prompt sent to OpenAI
 
-    response = client.chat.completions.create(model="gpt-3.5-turbo",
-    messages=[
-        {"role": "system", "content": "You are a helpful assistant that categorizes and summarizes text."},
-        {"role": "user", "content": prompt}
-    ])
-    result = response.choices[0].message.content
-    logger.info(f"OpenAI API response: {result}")
-
-    # Parse the structured response
+    item_schema = categorize_item_schema(headings)
+    return structured_params({
+        'model': MODEL,
+        'max_tokens': max_completion_tokens(len(links), item_output_tokens(item_schema, MODEL), MODEL),
+        'messages': [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+    }, item_schema, "Record the category and summary of every numbered link")
+
+def parse_categorized_links(result, links, headings):
+    """Split a batch into validated results and the links that need to be re-queued."""
+    sampled_debug(lambda: f"OpenAI API response: {result}")
+
+    matcher = compiled_matcher(tuple(allowed_categories(headings)))
+
+    def normalize(item):
+        # Map near-miss category names onto a heading before validating against the enum
+        if isinstance(item.get('category'), str):
+            return dict(item, category=matcher.match(item['category']) or item['category'])
+        return item
+
+    valid = valid_items(result, categorize_item_schema(headings), len(links), normalize)
     categorized_links = []
-    response_blocks = re.split(r'\[\d+\]:', result)
-    response_blocks = [block.strip() for block in response_blocks if block.strip()]
-    logger.info(f"Split response into {len(response_blocks)} blocks")
-
-    for i, block in enumerate(response_blocks):
-        if i >= len(links):
-            break
-
-        lines = block.split('\n')
-        category = None
-        summary = None
-
-        for line in lines:
-            if line.startswith("Category:"):
-                category = line.split("Category:")[1].strip()
-                logger.info(f"Found category for link {i+1}: {category}")
-            elif line.startswith("Summary:"):
-                summary = line.split("Summary:")[1].strip()
-                logger.info(f"Found summary for link {i+1}: {summary}")
-
-        if category and summary:
-            categorized_link = {
-                'url': links[i]['url'],
-                'category': category,
-                'summary': summary
-            }
-            logger.info(f"Successfully parsed link {i+1}: category: {category}, summary: {summary[:50]}...")
-            categorized_links.append(categorized_link)
-        else:
-            logger.error(f"Unexpected response format for link {i+1}")
-            categorized_link = {
-                'url': links[i]['url'],
-                'category': 'Unsorted',
-                'summary': 'Unable to categorize and summarize this link.'
-            }
-            categorized_links.append(categorized_link)
-
+    failed_links = []
+    for i, link in enumerate(links, 1):
+        item = valid.get(i)
+        if item is None:
+            logger.error(f"No valid result for link {i}, re-queueing {link['url']}")
+            failed_links.append(link)
+            continue
+        logger.info(f"Successfully parsed link {i}: category: {item['category']}, summary: {item['summary'][:50]}...")
+        categorized_links.append({
+            'url': link['url'],
+            'category': item['category'],
+            'summary': item['summary'],
+            'heading': link['heading'],
+            'status': DONE
+        })
+
+    sampled_debug(lambda: f"Categorized links: {categorized_links}")
     logger.info(f"Total categorized links: {len(categorized_links)}")
-    return categorized_links
+    return categorized_links, failed_links
 
 def find_closest_heading(returned_category, existing_headings):
-    # Define unique keywords for each category
-    category_keywords = {
-        'Shipbuilding': ['shipbuilding', 'ship', 'naval'],
-        'Skilled Trades and Welding': ['skilled', 'trades', 'welding', 'weld', 'skilled trades'],
-        'Outreach and Communication and Sales and Pitching': ['outreach', 'communication', 'sales', 'pitching', 'pitch'],
-        'Startup Operating Principles': ['startup', 'operating', 'principles', 'startup operating'],
-        'Personal Productivity System': ['personal', 'productivity', 'system', 'personal productivity'],
-        'Robotics and Hardware and Electronics': ['robotics', 'hardware', 'electronics'],
-        'Machine Learning and Deep Learning and Foundation Models and Artificial Intelligence': ['machine learning', 'deep learning', 'foundation models', 'artificial intelligence', 'ai', 'ml'],
-        '3D and 3D reconstruction and Spatial Computing': ['3d', 'spatial', 'reconstruction', '3d reconstruction'],
-        'Unsorted': ['unsorted']
-    }
-
-    # Convert returned category to lowercase for case-insensitive matching
-    returned_category_lower = returned_category.lower()
-
-    # Check if any of the keywords for each category are in the returned category
-    for heading, keywords in category_keywords.items():
-        if any(keyword in returned_category_lower for keyword in keywords):
-            logger.info(f"Matched category '{returned_category}' to heading: {heading}")
-            return heading
-
-    # If no match found, use difflib as a fallback
-    closest_match = difflib.get_close_matches(returned_category, existing_headings, n=1)
-    if closest_match:
-        logger.info(f"Closest match for category '{returned_category}': {closest_match[0]}")
-        return closest_match[0]
-
-    # If still no match, return 'Unsorted'
-    logger.info(f"No match found for category '{returned_category}'. Categorizing as 'Unsorted'.")
-    return 'Unsorted'
-
-def update_document(document_id, updates):
-    if not updates:
+    # The matcher derives its keywords from the document's own headings and is compiled once per run
+    headings = tuple(existing_headings)
+    if 'Unsorted' not in headings:
+        headings += ('Unsorted',)
+    heading = compiled_matcher(headings, default='Unsorted').match(returned_category)
+    logger.debug(f"Matched category '{returned_category}' to heading: {heading}")
+    return heading
+
+def update_document(document_id, chunks, journal):
+    """Apply the planned requests one bounded batchUpdate at a time, stopping at the first failure.
+
+    The links each applied chunk filed are marked applied in the journal, so a
+    --resume run files only the ones a failed chunk left out.
+    """
+    applied = 0
+    for links, chunk in chunks:
+        try:
+            get_docs_service().documents().batchUpdate(documentId=document_id, body={'requests': chunk}).execute()
+        except HttpError as error:
+            logger.error(f"An error occurred after {applied} batchUpdate calls: {error}; "
+                         f"run again with --resume to file the remaining links")
+            return
+        journal.record(dict(journal.entries[link], applied=True) for link in links)
+        applied += 1
+        DOCS_UPDATE_CALLS.inc()
+        for update in chunk:
+            DOCS_UPDATE_REQUESTS.inc(kind=next(iter(update)))
+    if not applied:
         logger.info("No updates to apply.")
         return
-    try:
-        docs_service.documents().batchUpdate(documentId=document_id, body={'requests': updates}).execute()
-        logger.info("Document updated successfully.")
-    except HttpError as error:
-        logger.error(f"An error occurred: {error}")
-
-def main(document_id):
+    logger.info(f"Document updated successfully in {applied} batchUpdate calls.")
+
+def build_updates(content, headings, results):
+    """Plan the requests filing each categorized link and its summary under its heading, in batchUpdate-sized chunks.
+
+    Results already applied to the document by an earlier run are left out.
+    """
+    doc_index = DocumentIndex(content)
+    placements = []
+    for link_info in results:
+        if link_info.get('applied'):
+            continue
+        link = link_info['url']
+        category = link_info['category']
+        summary = link_info['summary']
+        heading = link_info['heading']
+
+        if doc_index.link_range(link) is None:
+            logger.warning(f"Link not found in document: {link}")
+            continue
+
+        # Falls back to 'Unsorted' when no heading matches
+        closest_heading = find_closest_heading(category, headings)
+        logger.info(f"Preparing to move link from {heading} to {closest_heading}")
+
+        # Find the insert index for the new category
+        insert_index = doc_index.heading_end(closest_heading)
+        if insert_index is None:
+            logger.warning(f"Could not find end index for heading: {closest_heading}")
+            continue
+
+        # To Do: Copy the link to be on a new line under the new heading that it's categorized under, and make sure it's formatted as normal text
+        # Insert its summary as a bullet point as a new line under that link, also formatted as normal text. And then just highlight the original link in red
+        placements.append((insert_index, link, summary))
+
+    return list(chunk_updates(plan_updates(placements)))
+
+def main(document_id, resume=False, bulk=False):
     content = get_document_content(document_id)
     if not content:
         return
 
-    headings_and_links = extract_headings_and_links(content)
-    logger.info(f"Extracted headings and links: {headings_and_links}")
-    updates = []
-
-    for heading, links in headings_and_links.items():
-        link_batches = [links[i:i + 15] for i in range(0, len(links), 15)]
-        for batch in link_batches:
-            logger.info(f"Processing batch of links: {batch}")
-            link_texts = [{'url': link, 'text': extract_text_from_url(link)} for link in batch]
-            categorized_links = batch_categorize_and_summarize(link_texts, headings_and_links.keys())
-            logger.info(f"Categorized links: {categorized_links}")
-
-            for link_info in categorized_links:
-                link = link_info['url']
-                category = link_info['category']
-                summary = link_info['summary']
-
-                # Find the start and end indices of the link in the document content
-                start_index = end_index = None
-                for element in content:
-                    if 'paragraph' in element:
-                        paragraph = element['paragraph']
-                        if 'elements' in paragraph:
-                            for elem in paragraph['elements']:
-                                if 'textRun' in elem and link in elem['textRun']['content']:
-                                    start_index = elem['startIndex']
-                                    end_index = elem['endIndex']
-                                    # logger.info(f"Found link at indices: start={start_index}, end={end_index}")
-                                    break
-                    if start_index and end_index:
-                        break
-
-                if not start_index or not end_index:
-                    logger.warning(f"Link not found in document: {link}")
-                    continue
-
-                closest_heading = find_closest_heading(category, headings_and_links.keys())
-                if not closest_heading:
-                    logger.error(f"Category '{category}' not found in document headings. Skipping link: {link}")
-                    continue
-
-                logger.info(f"Preparing to move link from {heading} to {closest_heading}")
-
-                # Find the insert index for the new category
-                logger.info(f"Finding insert index for category: {closest_heading}")
-                insert_index = None
-                for element in content:
-                    if 'paragraph' in element:
-                        paragraph = element['paragraph']
-                        if 'elements' in paragraph:
-                            for elem in paragraph['elements']:
-                                if 'textRun' in elem and closest_heading in elem['textRun']['content']:
-                                    insert_index = elem['endIndex']
-                                    # logger.info(f"Insert index found at end of heading: {insert_index}")
-                                    break
-                    if insert_index:
-                        break
-                
-                if insert_index is None:
-                    logger.warning(f"Could not find end index for heading: {closest_heading}")
-                    continue
-
-                # To Do: Copy the link to be on a new line under the new heading that it's categorized under, and make sure it's formatted as normal text
-                # Insert its summary as a bullet point as a new line under that link, also formatted as normal text. And then just highlight the original link in red
-                # Copy the link to a new line under the new heading
-                updates.append({
-                    'insertText': {
-                        'location': {'index': insert_index},
-                        'text': f'\n{link}\n'
-                    }
-                })
-                insert_index += len(link) + 2  # +2 for the two newline characters
-
-                # Insert the summary as a bullet point using Google Docs formatting
-                updates.append({
-                    'insertText': {
-                        'location': {'index': insert_index},
-                        'text': f'{summary}\n'
-                    }
-                })
-                updates.append({
-                    'createParagraphBullets': {
-                        'range': {
-                            'startIndex': insert_index,
-                            'endIndex': insert_index + len(summary) + 1
-                        },
-                        'bulletPreset': 'BULLET_DISC_CIRCLE_SQUARE'
-                    }
-                })
-                insert_index += len(summary) + 1  # +1 for the newline
-
-                # Format the copied link and summary as normal text
-                updates.append({
-                    'updateParagraphStyle': {
-                        'range': {
-                            'startIndex': insert_index - len(link) - len(summary) - 3,  # -3 for newlines
-                            'endIndex': insert_index
-                        },
-                        'paragraphStyle': {'namedStyleType': 'NORMAL_TEXT'},
-                        'fields': 'namedStyleType'
-                    }
-                })
-
-                # # Update the insert_index for the next iteration
-                insert_index += len(summary) + len(link) + 2  # +2 for the two newline characters
-
-            # # After processing each batch, mark links under 'Unsorted' as processed
-            # # Find the index of the 'Unsorted' heading
-            # # Initialize a variable to store the index of the 'Unsorted' heading
-            # unsorted_index = None
-            # # Find the end index of the last Heading 1 (assumed to be the Unsorted header)
-            # # Iterate through the content in reverse order
-            # # logger.info("Starting search for 'Unsorted' heading")
-            # for index, element in enumerate(reversed(content)):
-            #     # logger.debug(f"Checking element {index}: {element}")
-            #     # Check if the current element is a paragraph
-            #     if 'paragraph' in element:
-            #         logger.debug(f"Element {index} is a paragraph")
-            #         # Check if the paragraph style is 'HEADING_1'
-            #         if element['paragraph'].get('paragraphStyle', {}).get('namedStyleType') == 'HEADING_1':
-            #             logger.info(f"Found HEADING_1 at reversed index {index}")
-            #             # Log the value of the heading found
-            #             heading_text = element['paragraph']['elements'][0]['textRun']['content'].strip()
-            #             logger.info(f"Found heading: {heading_text}")
-            #             # If it's a 'HEADING_1', set unsorted_index to the end index of the last element in this paragraph
-            #             unsorted_index = element['paragraph']['elements'][-1]['endIndex']
-            #             logger.info(f"Set unsorted_index to {unsorted_index}")
-            #             # Exit the loop as we've found the last 'HEADING_1'
-            #             # logger.info("Exiting loop after finding 'Unsorted' heading")
-            #             # If 'Unsorted' heading is found, process the links under it
-            #             if unsorted_index:
-            #                 logger.info(f"Processing links under 'Unsorted' heading (index: {unsorted_index})")
-            #                 logger.info(f"Searching in Batch: {batch}")
-            #                 for link in batch:
-            #                     logger.info(f"Searching for link: {link}")
-            #                     # Search for each link in the content after the 'Unsorted' heading
-            #                     for element_index, element in enumerate(content[unsorted_index:], start=unsorted_index):
-            #                         # Log the contents of the element
-            #                         logger.info(f"Element contents: {element}")
-
-            #                         # Extract all text from the element
-            #                         element_text = ''.join(elem.get('textRun', {}).get('content', '') for elem in element.get('paragraph', {}).get('elements', []))
-            #                         element_text = element_text.lower()
-            #                         link_lower = link.lower()
-
-            #                         # Check if the link or any part of it is in the element text
-            #                         if link_lower in element_text or any(part in element_text for part in link_lower.split('/')):
-            #                             logger.info(f"Found link '{link}' in element")
-            #                             # Find the start index of the link in the element
-            #                             start_index = element['startIndex'] + element_text.index(link_lower)
-            #                             updates.append({
-            #                                 'insertText': {
-            #                                     'location': {'index': start_index},
-            #                                     'text': '[PROCESSED] '
-            #                                 }
-            #                             })
-            #                             logger.debug(f"Added update to mark '{link}' as processed")
-            #                             break  
-            #             else:
-            #                 logger.warning("'Unsorted' index not found. Unable to process links.")                                  
-            #             break
-
-            # else:
-            #     logger.warning("'Unsorted' heading not found. Unable to process links.")
-
-    try:
-        update_document(document_id, updates)
-    except HttpError as e:
-        logger.error(f"An error occurred: {e}")
+    # Links already filed from another document or link file, or repeated here, are skipped
+    seen = SeenIndex()
+    source = f'doc:{document_id}'
+    headings_and_links = extract_headings_and_links(content, seen, source)
+    seen.flush()
+    logger.info(f"Extracted {sum(len(links) for links in headings_and_links.values())} links under {len(headings_and_links)} headings")
+    logger.debug(f"Extracted headings and links: {headings_and_links}")
+    headings = list(headings_and_links.keys())
+    journal = Journal(f'journal_{document_id}.jsonl', resume=resume)
+    dead_letters = DeadLetterQueue(f'dead_letter_{document_id}.jsonl', resume=resume)
+    overhead_tokens = count_tokens(SYSTEM_PROMPT + categorize_instructions(headings), MODEL)
+    output_tokens = item_output_tokens(categorize_item_schema(headings), MODEL)
+
+    def pending_links():
+        for heading, links in headings_and_links.items():
+            pending = [link for link in links if not journal.is_done(link)]
+            if len(pending) < len(links):
+                logger.info(f"Skipping {len(links) - len(pending)} already journaled links under {heading}")
+            for link in pending:
+                yield {'url': link, 'heading': heading}
+
+    llm = LLMClassifier(client, llm_cache,
+                        request=lambda link_batch: categorize_request(link_batch, headings),
+                        parse=lambda result, link_batch: parse_categorized_links(result, link_batch, headings),
+                        batch_requests_path=f'batch_requests_{document_id}.jsonl')
+
+    run = ClassificationRun(
+        journal, dead_letters,
+        fetch=pages.download,
+        parse=pages.parse,
+        pack=lambda links: pack_batches(links, lambda link: link['text'], MODEL, overhead_tokens, output_tokens),
+        classify=llm.classify,
+        give_up=lambda link: {
+            'url': link['url'],
+            'category': 'Unsorted',
+            'summary': 'Unable to categorize and summarize this link.',
+            'heading': link['heading'],
+            'status': FAILED
+        },
+        bulk=llm.bulk if bulk else None,
+        dispatcher=dispatcher,
+        cost=lambda link_batch: batch_tokens([link['text'] for link in link_batch], MODEL, overhead_tokens, output_tokens),
+        attempts=MAX_ATTEMPTS,
+        fetch_workers=pages.fetcher.max_workers,
+        parse_workers=pages.parse_workers,
+    )
+    run.run(pending_links())
+
+    # # After processing each batch, mark links under 'Unsorted' as processed
+    # # Find the index of the 'Unsorted' heading
+    # # Initialize a variable to store the index of the 'Unsorted' heading
+    # unsorted_index = None
+    # # Find the end index of the last Heading 1 (assumed to be the Unsorted header)
+    # # Iterate through the content in reverse order
+    # # logger.info("Starting search for 'Unsorted' heading")
+    # for index, element in enumerate(reversed(content)):
+    #     # logger.debug(f"Checking element {index}: {element}")
+    #     # Check if the current element is a paragraph
+    #     if 'paragraph' in element:
+    #         logger.debug(f"Element {index} is a paragraph")
+    #         # Check if the paragraph style is 'HEADING_1'
+    #         if element['paragraph'].get('paragraphStyle', {}).get('namedStyleType') == 'HEADING_1':
+    #             logger.info(f"Found HEADING_1 at reversed index {index}")
+    #             # Log the value of the heading found
+    #             heading_text = element['paragraph']['elements'][0]['textRun']['content'].strip()
+    #             logger.info(f"Found heading: {heading_text}")
+    #             # If it's a 'HEADING_1', set unsorted_index to the end index of the last element in this paragraph
+    #             unsorted_index = element['paragraph']['elements'][-1]['endIndex']
+    #             logger.info(f"Set unsorted_index to {unsorted_index}")
+    #             # Exit the loop as we've found the last 'HEADING_1'
+    #             # logger.info("Exiting loop after finding 'Unsorted' heading")
+    #             # If 'Unsorted' heading is found, process the links under it
+    #             if unsorted_index:
+    #                 logger.info(f"Processing links under 'Unsorted' heading (index: {unsorted_index})")
+    #                 logger.info(f"Searching in Batch: {batch}")
+    #                 for link in batch:
+    #                     logger.info(f"Searching for link: {link}")
+    #                     # Search for each link in the content after the 'Unsorted' heading
+    #                     for element_index, element in enumerate(content[unsorted_index:], start=unsorted_index):
+    #                         # Log the contents of the element
+    #                         logger.info(f"Element contents: {element}")
+
+    #                         # Extract all text from the element
+    #                         element_text = ''.join(elem.get('textRun', {}).get('content', '') for elem in element.get('paragraph', {}).get('elements', []))
+    #                         element_text = element_text.lower()
+    #                         link_lower = link.lower()
+
+    #                         # Check if the link or any part of it is in the element text
+    #                         if link_lower in element_text or any(part in element_text for part in link_lower.split('/')):
+    #                             logger.info(f"Found link '{link}' in element")
+    #                             # Find the start index of the link in the element
+    #                             start_index = element['startIndex'] + element_text.index(link_lower)
+    #                             updates.append({
+    #                                 'insertText': {
+    #                                     'location': {'index': start_index},
+    #                                     'text': '[PROCESSED] '
+    #                                 }
+    #                             })
+    #                             logger.debug(f"Added update to mark '{link}' as processed")
+    #                             break  
+    #             else:
+    #                 logger.warning("'Unsorted' index not found. Unable to process links.")                                  
+    #             break
+
+    # else:
+    #     logger.warning("'Unsorted' heading not found. Unable to process links.")
+
+    # update_document logs and stops at a failed batchUpdate itself
+    update_document(document_id, build_updates(content, headings, journal.results()), journal)
+    # Only links now filed in the document are settled; failed ones stay open to other sources
+    seen.settle((entry['url'] for entry in journal.results() if entry.get('applied')), source)
+    seen.flush()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Categorize and summarize the links in a Google Doc")
+    parser.add_argument('--resume', action='store_true', help="skip links already recorded in the run journal")
+    parser.add_argument('--bulk', action='store_true', help="submit all batches through the OpenAI Batch API and wait for the results")
+    parser.add_argument('--metrics', default=METRICS_PATH, help="where to write the run's metrics (.json for JSON, else Prometheus text format)")
+    args = parser.parse_args()
+
     document_id = os.getenv('GOOGLE_DOC_ID')
     logger.info(f"Starting categorization for document ID: {document_id}")
-    main(document_id)
+    try:
+        main(document_id, resume=args.resume, bulk=args.bulk)
+    finally:
+        REGISTRY.write(args.metrics)
     logger.info("Categorization process completed.")
\ No newline at end of file
@@ -0,0 +1,42 @@
+import re
+
+URL_PATTERN = re.compile(r'https?://\S+')
+
+
+def heading_text(paragraph):
+    """The text of a paragraph across all of its text runs, stripped."""
+    return ''.join(elem['textRun']['content'] for elem in paragraph['elements'] if 'textRun' in elem).strip()
+
+
+class DocumentIndex:
+    """Link and heading positions of a Google Docs body, built in a single pass.
+
+    Positions are in the coordinates of the document as it was fetched; the
+    update planner (doc_updates) keeps its requests valid in those coordinates.
+    """
+
+    def __init__(self, content):
+        self.link_ranges = {}
+        self.heading_ends = {}
+        for element in content:
+            paragraph = element.get('paragraph')
+            if not paragraph or 'elements' not in paragraph:
+                continue
+            if paragraph.get('paragraphStyle', {}).get('namedStyleType') == 'HEADING_1':
+                # A heading with mixed formatting is split over several text runs; inserts go after the last
+                self.heading_ends.setdefault(heading_text(paragraph), paragraph['elements'][-1]['endIndex'])
+                continue
+            for elem in paragraph['elements']:
+                if 'textRun' not in elem:
+                    continue
+                for match in URL_PATTERN.finditer(elem['textRun']['content']):
+                    self.link_ranges.setdefault(match.group(0), []).append((elem['startIndex'], elem['endIndex']))
+
+    def link_range(self, url):
+        """(start, end) of the first text run containing url, or None."""
+        ranges = self.link_ranges.get(url)
+        return ranges[0] if ranges else None
+
+    def heading_end(self, heading):
+        """End index of the HEADING_1 paragraph whose text is exactly heading, or None."""
+        return self.heading_ends.get(heading)
@@ -0,0 +1,108 @@
+from collections import defaultdict
+
+# Bounds on a single batchUpdate call, well inside what the Docs API accepts
+MAX_CHUNK_REQUESTS = 500
+MAX_CHUNK_TEXT = 200_000
+
+
+def heading_requests(index, entries):
+    """Requests filing (link, summary) entries at index, all in the coordinates of the document as fetched.
+
+    The entries become one text insert; each summary is then bulleted and the
+    whole block set to normal text.
+    """
+    text = ''.join(f'\n{link}\n{summary}\n' for link, summary in entries)
+    requests = [{'insertText': {'location': {'index': index}, 'text': text}}]
+    offset = index
+    for link, summary in entries:
+        # The summary follows the blank line and the link line
+        start = offset + len(link) + 2
+        requests.append({
+            'createParagraphBullets': {
+                'range': {'startIndex': start, 'endIndex': start + len(summary) + 1},
+                'bulletPreset': 'BULLET_DISC_CIRCLE_SQUARE'
+            }
+        })
+        offset = start + len(summary) + 1
+    requests.append({
+        'updateParagraphStyle': {
+            'range': {'startIndex': index, 'endIndex': index + len(text)},
+            'paragraphStyle': {'namedStyleType': 'NORMAL_TEXT'},
+            'fields': 'namedStyleType'
+        }
+    })
+    return requests
+
+
+def _entry_size(entry):
+    link, summary = entry
+    return len(link) + len(summary) + 3
+
+
+def _runs(entries, max_text):
+    # Consecutive entries whose combined insert fits in max_text
+    run, size = [], 0
+    for entry in entries:
+        if _entry_size(entry) > max_text:
+            raise ValueError(f"The entry for {entry[0]} inserts {_entry_size(entry)} characters, "
+                             f"more than the {max_text} one batchUpdate may carry")
+        if run and size + _entry_size(entry) > max_text:
+            yield run
+            run, size = [], 0
+        run.append(entry)
+        size += _entry_size(entry)
+    if run:
+        yield run
+
+
+def plan_updates(placements, max_text=MAX_CHUNK_TEXT):
+    """Turn (index, link, summary) placements into (links, requests) groups, one group per insert index.
+
+    Groups come in descending index order, so applying them in sequence never
+    moves a position a later group refers to: every index stays the one read
+    from the fetched document, however many links land under the same heading.
+    Links for one index keep the order they were placed in. An index whose
+    insert would exceed max_text gets several groups, last entries first, so
+    each insert lands in front of the one before it.
+    """
+    entries = defaultdict(list)
+    for index, link, summary in placements:
+        entries[index].append((link, summary))
+    return [([link for link, _ in run], heading_requests(index, run))
+            for index in sorted(entries, reverse=True)
+            for run in reversed(list(_runs(entries[index], max_text)))]
+
+
+def _text_size(request):
+    return len(request['insertText']['text']) if 'insertText' in request else 0
+
+
+def chunk_updates(groups, max_requests=MAX_CHUNK_REQUESTS, max_text=MAX_CHUNK_TEXT):
+    """Pack (links, requests) groups, in order, into batchUpdate-sized (links, requests) chunks.
+
+    A group is only split when it has too many requests for a chunk of its own;
+    since the groups are index-stable, the chunks can be sent one after another.
+    A chunk's links are those whose text it inserts, so once it is applied they
+    are in the document even if a later chunk (with the rest of their styling)
+    fails. Text inserts can't be split, so plan_updates must be given the same
+    max_text; a group inserting more raises ValueError.
+    """
+    links, chunk, text = [], [], 0
+    for group_links, group in groups:
+        size = sum(_text_size(request) for request in group)
+        if size > max_text:
+            raise ValueError(f"A group inserts {size} characters, more than max_text ({max_text}); "
+                             f"plan it with plan_updates(placements, max_text={max_text})")
+        if chunk and (len(chunk) + len(group) > max_requests or text + size > max_text):
+            yield links, chunk
+            links, chunk, text = [], [], 0
+        for request in group:
+            if chunk and len(chunk) >= max_requests:
+                yield links, chunk
+                links, chunk, text = [], [], 0
+            if 'insertText' in request:
+                links.extend(group_links)
+            chunk.append(request)
+            text += _text_size(request)
+    if chunk:
+        yield links, chunk
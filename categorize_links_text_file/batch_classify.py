@@ -1,8 +1,24 @@
-import requests
-from bs4 import BeautifulSoup
 from openai import OpenAI
-import time
+import argparse
+import itertools
 import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pipeline.batching import batch_tokens, count_tokens, item_output_tokens, max_completion_tokens, pack_batches
+from pipeline.category_match import compiled_matcher
+from pipeline.dead_letter import DeadLetterQueue
+from pipeline.dispatch import Dispatcher
+from pipeline.engine import ClassificationRun, LLMClassifier
+from pipeline.journal import DONE, FAILED, Journal
+from pipeline.link_file import UNSORTED, LinkFile, is_twitter_link, link_of
+from pipeline.llm_cache import LLMCache
+from pipeline.local_classifier import LocalClassifier
+from pipeline.metrics import METRICS_PATH, REGISTRY, SampledLog
+from pipeline.pages import PageLoader
+from pipeline.seen import SeenIndex
+from pipeline.structured import TOOL_NAME, structured_params, valid_items
 
 # Set up logging
 logging.basicConfig(
@@ -10,68 +26,23 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-def extract_content(url):
-    try:
-        logging.info(f"Fetching content from: {url}")
-        response = requests.get(url, timeout=60)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Remove scripts, styles, etc.
-        for tag in soup(['script', 'style', 'nav', 'header', 'footer']):
-            tag.decompose()
-            
-        content = ' '.join(soup.stripped_strings)
-        logging.info(f"Successfully extracted {len(content)} characters from {url}")
-        return content
-    except Exception as e:
-        logging.error(f"Error extracting content from {url}: {str(e)}")
-        return ""
+# Full prompts are too large to log for every batch
+sampled_debug = SampledLog(logging.getLogger())
 
-def classify_links(filepath):
-    logging.info(f"Starting classification for file: {filepath}")
-    
-    with open(filepath, 'r') as f:
-        lines = f.readlines()
-    
-    # Find unsorted section
-    logging.info("Looking for unsorted section...")
-    unsorted_start = -1
-    for i, line in enumerate(lines):
-        if line.strip().lower() == "unsorted":
-            unsorted_start = i
-            break
-            
-    if unsorted_start == -1:
-        raise ValueError("Could not find unsorted section")
-    
-    # Get valid categories
-    categories = []
-    for line in lines[:unsorted_start]:
-        if line.strip() and not line.startswith('#'):
-            categories.append(line.strip())
-    
-    logging.info(f"Found {len(categories)} categories: {categories}")
-    
-    # Process links in batches of 25
-    links = [l for l in lines[unsorted_start+1:] if l.strip()]
-    logging.info(f"Found {len(links)} links to process")
-    classified_links = {}
-    
-    client = OpenAI()
-    
-    for i in range(0, len(links), 25):
-        batch = links[i:i+25]
-        contents = []
-        
-        logging.info(f"Processing batch {i//25 + 1} of {(len(links)-1)//25 + 1}")
-        
-        for j, link in enumerate(batch):
-            logging.info(f"Processing link {i+j+1} of {len(links)}: {link.strip()}")
-            content = extract_content(link.strip())
-            contents.append(content[:1000])  # Truncate long content
-            time.sleep(1)  # Rate limiting
-            
-        prompt = f"""Given these categories:
+MODEL = "gpt-4-turbo-preview"
+
+# Links per category used to build the local classifier's centroids
+MAX_TRAINING_LINKS = 50
+
+# Rounds a link gets to come back with a valid classification before it stays unsorted
+MAX_ATTEMPTS = 3
+
+pages = PageLoader(timeout=60)
+llm_cache = LLMCache()
+dispatcher = Dispatcher(max_in_flight=4, rpm=int(os.getenv('OPENAI_RPM', 500)), tpm=int(os.getenv('OPENAI_TPM', 150000)))
+
+def build_prompt(categories, contents):
+    return f"""Given these categories:
 {', '.join(categories)}
 
 Classify each content excerpt into exactly one of these categories. You must categorize each URL into exactly one of the following categories, using the exact text shown below:
@@ -88,69 +59,203 @@ Classify each content excerpt into exactly one of these categories. You must cat
 
 Do not create new categories or modify these category names. If a URL doesn't clearly fit into any category, use "unsorted".
 
-Return results as:
-URL1: category1
-URL2: category2
-etc.
+Record the number and category of every URL in a single call to {TOOL_NAME}.
 
 Content excerpts:
 """ + "\n\n".join([f"URL{j+1}: {c}" for j,c in enumerate(contents)])
 
-        logging.info(f"Generated prompt: {prompt}")
-
-        logging.info("Sending batch to OpenAI for classification...")
-        response = client.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[{"role": "user", "content": prompt}]
-        )
-        
-        # Parse classifications
-        results = response.choices[0].message.content.split('\n')
-        logging.info(f"Received {len(results)} classifications from OpenAI")
-        
-        for j, result in enumerate(results):
-            if ':' in result:
-                url_index = int(result.split(':')[0].replace('URL', '')) - 1
-                if url_index < len(batch):  # Ensure we have a valid index
-                    category = result.split(':')[1].strip()
-                    if category in categories:
-                        classified_links.setdefault(category, []).append(batch[url_index].strip() + '\n')
-                        logging.info(f"Classified {batch[url_index].strip()} as {category}")
-                    else:
-                        logging.warning(f"Received invalid category '{category}' for {batch[url_index].strip()}")
+def classify_item_schema(categories):
+    return {
+        'type': 'object',
+        'properties': {
+            'id': {'type': 'integer', 'minimum': 1, 'description': 'The number of the URL'},
+            'category': {'type': 'string', 'enum': list(categories) + ['unsorted']},
+        },
+        'required': ['id', 'category'],
+    }
+
+def classify_request(categories, contents):
+    prompt = build_prompt(categories, contents)
+
+    sampled_debug(lambda: f"Generated prompt: {prompt}")
+
+    item_schema = classify_item_schema(categories)
+    max_tokens = max_completion_tokens(len(contents), item_output_tokens(item_schema, MODEL), MODEL)
+    return structured_params({'model': MODEL, 'max_tokens': max_tokens, 'messages': [{"role": "user", "content": prompt}]},
+                             item_schema, "Record the category of every numbered URL")
+
+def parse_classifications(result, batch, categories):
+    """Split a batch into validated results and the links that need to be re-queued."""
+    # The prompt's category names don't always match the file's headings exactly
+    matcher = compiled_matcher(tuple(categories) + ('unsorted',))
+
+    def normalize(item):
+        if isinstance(item.get('category'), str) and item['category'] not in categories:
+            return dict(item, category=matcher.match(item['category']) or item['category'])
+        return item
+
+    valid = valid_items(result, classify_item_schema(categories), len(batch), normalize)
+    logging.info(f"Received {len(valid)} valid classifications from OpenAI")
+
+    batch_results = []
+    failed_links = []
+    for i, link in enumerate(batch, 1):
+        item = valid.get(i)
+        if item is None:
+            logging.warning(f"No valid classification for {link['url']}, re-queueing")
+            failed_links.append(link)
+            continue
+        batch_results.append({'url': link['url'], 'category': item['category'], 'summary': None, 'status': DONE})
+        logging.info(f"Classified {link['url']} as {item['category']}")
+
+    return batch_results, failed_links
+
+def train_local_classifier(filed_links):
+    examples = {}
+    for category, links in filed_links.items():
+        sample = links[:MAX_TRAINING_LINKS]
+        examples[category] = [content for _, (content, _) in pages.fetcher.imap(pages.text, sample) if content]
+    return LocalClassifier().fit(examples)
+
+def classify_locally(classifier, link):
+    # Links the local classifier is sure about skip the LLM
+    category, similarity, margin = classifier.predict(link['text'])
+    if category is None:
+        return None
+    logging.info(f"Classified {link['url']} as {category} locally (similarity {similarity:.2f}, margin {margin:.2f})")
+    return {'url': link['url'], 'category': category, 'summary': None, 'status': DONE}
+
+def classify_link_file(link_file, filepath, resume=False, bulk=False, local=True):
+    """File the links in link_file's unsorted section under its categories, in place.
+
+    filepath names the run's journal, dead-letter queue and batch request files.
+    """
+    unsorted = link_file.section(UNSORTED)
+    if unsorted is None:
+        raise ValueError("Could not find unsorted section")
+    category_sections = link_file.categories()
+    categories = [section.name for section in category_sections]
+    logging.info(f"Found {len(categories)} categories: {categories}")
+    # Tweets filed under a category have no page to learn from
+    filed_links = {section.name: list(itertools.islice((link for link in section.links() if not is_twitter_link(link)),
+                                                       MAX_TRAINING_LINKS))
+                   for section in category_sections}
     
-    # Reconstruct file
-    logging.info("Reconstructing output file...")
-    new_content = []
-    current_category = None
+    journal = Journal(filepath + '.journal.jsonl', resume=resume)
+    dead_letters = DeadLetterQueue(filepath + '.dead_letter.jsonl', resume=resume)
+    counts = {'links': 0, 'skipped': 0}
+
+    # Filed links claim their items first, so an unsorted copy of one (or a link already
+    # filed from another file or the Google Doc) is skipped instead of fetched again
+    seen = SeenIndex()
+    source = os.path.abspath(filepath)
+    for section in category_sections:
+        seen.settle([link for link in section.links() if seen.claim(link, source)], source)
+
+    def pending_links():
+        for link in seen.unique(unsorted.links(), source):
+            counts['links'] += 1
+            if journal.is_done(link):
+                counts['skipped'] += 1
+                continue
+            yield {'url': link}
+    
+    # Retries on 429 are left to the dispatcher so every in-flight request backs off together
+    client = OpenAI(max_retries=0)
+    overhead_tokens = count_tokens(build_prompt(categories, []), MODEL)
+    output_tokens = item_output_tokens(classify_item_schema(categories), MODEL)
+    classifier = train_local_classifier(filed_links) if local else None
+
+    llm = LLMClassifier(client, llm_cache,
+                        request=lambda batch: classify_request(categories, [link['text'] for link in batch]),
+                        parse=lambda result, batch: parse_classifications(result, batch, categories),
+                        batch_requests_path=filepath + '.batch_requests.jsonl')
+
+    run = ClassificationRun(
+        journal, dead_letters,
+        fetch=pages.download,
+        parse=pages.parse,
+        pack=lambda links: pack_batches(links, lambda link: link['text'], MODEL, overhead_tokens, output_tokens),
+        classify=llm.classify,
+        give_up=lambda link: {'url': link['url'], 'category': None, 'summary': None, 'status': FAILED},
+        route=(lambda link: classify_locally(classifier, link)) if classifier else None,
+        bulk=llm.bulk if bulk else None,
+        dispatcher=dispatcher,
+        cost=lambda batch: batch_tokens([link['text'] for link in batch], MODEL, overhead_tokens, output_tokens),
+        attempts=MAX_ATTEMPTS,
+        fetch_workers=pages.fetcher.max_workers,
+        parse_workers=pages.parse_workers,
+    )
+    run.run(pending_links())
+    logging.info(f"Found {counts['links']} links to process")
+    if counts['skipped']:
+        logging.info(f"Skipped {counts['skipped']} links already classified in the journal")
+
+    category_set = set(categories)
+    classified_links = {}
+    for entry in journal.results():
+        if entry['status'] == DONE and entry['category'] in category_set:
+            classified_links.setdefault(entry['category'], []).append(entry['url'])
+    # Links left unsorted or dead-lettered stay open to the next run, whatever file it reads
+    seen.settle(itertools.chain.from_iterable(classified_links.values()), source)
+    seen.flush()
+    # A classified link moves with its annotation
+    classified_lines = unsorted.link_lines({url for urls in classified_links.values() for url in urls})
+
+    def is_classified(url):
+        entry = journal.entries.get(url)
+        return entry is not None and entry['status'] == DONE and entry['category'] in category_set
     
-    for line in lines:
-        line_stripped = line.strip()
-        if line_stripped in categories:
-            current_category = line_stripped
-            new_content.append(line)
-            if current_category in classified_links:
-                new_content.extend(['\n'] + classified_links[current_category])
-        elif line_stripped == "unsorted":
-            current_category = "unsorted"
-            new_content.append(line)
-            remaining = [l for l in links if not any(l in cat_links for cat_links in classified_links.values())]
-            if remaining:
-                logging.info(f"{len(remaining)} links remained unclassified")
-                new_content.extend(['\n'] + remaining)
-        elif current_category != "unsorted" or not line_stripped:
-            new_content.append(line)
+    # Classified links go right under their category's heading; the rest stay unsorted
+    logging.info("Reconstructing output file...")
+    for section in category_sections:
+        if section.name in classified_links:
+            filed = (classified_lines.get(url, url + '\n') for url in classified_links[section.name])
+            section.replace(itertools.chain(['\n'], filed, section.lines()))
+
+    remaining = 0
+    blank_lines = []
+
+    def unsorted_lines():
+        nonlocal remaining
+        for line in unsorted.lines():
+            if not line.strip():
+                blank_lines.append(line)
+            elif not is_classified(link_of(line)):
+                if not remaining:
+                    yield '\n'
+                remaining += 1
+                yield line
+        yield from blank_lines
+
+    unsorted.replace(unsorted_lines())
+    if remaining:
+        logging.info(f"{remaining} links remained unclassified")
+
+def classify_links(filepath, resume=False, bulk=False, local=True):
+    logging.info(f"Starting classification for file: {filepath}")
+    link_file = LinkFile.load(filepath)
+    classify_link_file(link_file, filepath, resume=resume, bulk=bulk, local=local)
     
     output_file = 'classified_' + filepath
     logging.info(f"Writing results to {output_file}")
-    with open(output_file, 'w') as f:
-        f.writelines(new_content)
+    link_file.save(output_file)
     
     logging.info("Classification complete!")
 
 # Usage
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Classify the unsorted links in a link file")
+    parser.add_argument('filepath', nargs='?', default='sorted_links_ex_twitter_v2.txt')
+    parser.add_argument('--resume', action='store_true', help="skip links already recorded in the run journal")
+    parser.add_argument('--bulk', action='store_true', help="submit all batches through the OpenAI Batch API and wait for the results")
+    parser.add_argument('--llm-only', action='store_true', help="send every link to the LLM instead of classifying confident ones locally")
+    parser.add_argument('--metrics', default=METRICS_PATH, help="where to write the run's metrics (.json for JSON, else Prometheus text format)")
+    args = parser.parse_args()
+
     try:
-        classify_links('sorted_links_ex_twitter_v2.txt')
+        classify_links(args.filepath, resume=args.resume, bulk=args.bulk, local=not args.llm_only)
     except Exception as e:
-        logging.error(f"Program failed with error: {str(e)}")
\ No newline at end of file
+        logging.error(f"Program failed with error: {str(e)}")
+    finally:
+        REGISTRY.write(args.metrics)
\ No newline at end of file
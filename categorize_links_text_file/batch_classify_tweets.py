@@ -1,94 +1,192 @@
 import tweepy
 from openai import OpenAI
-import time
+import argparse
+import itertools
+import logging
+import os
+import sys
 import re
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pipeline.batching import batch_tokens, count_tokens, item_output_tokens, max_completion_tokens, pack_batches
+from pipeline.dead_letter import DeadLetterQueue
+from pipeline.dispatch import Dispatcher
+from pipeline.engine import ClassificationRun, LLMClassifier, Unreadable
+from pipeline.journal import DONE, FAILED, Journal
+from pipeline.link_file import TWITTER, LinkFile, is_twitter_link, link_of
+from pipeline.llm_cache import LLMCache
+from pipeline.metrics import METRICS_PATH, REGISTRY
+from pipeline.seen import SeenIndex
+from pipeline.structured import TOOL_NAME, structured_params, valid_items
+from pipeline.tweet_cache import TweetCache, hydrate_tweets
+
+logger = logging.getLogger(__name__)
+
+MODEL = "gpt-4-turbo-preview"
+
+# Rounds a tweet gets to come back with a valid category before it is left out
+MAX_ATTEMPTS = 3
+
+dispatcher = Dispatcher(max_in_flight=4, rpm=int(os.getenv('OPENAI_RPM', 500)), tpm=int(os.getenv('OPENAI_TPM', 150000)))
+
 def get_tweet_id(url):
     match = re.search(r'status/(\d+)', url)
     return match.group(1) if match else None
 
-def classify_twitter_links(filepath):
-    # Twitter API setup
-    client = tweepy.Client(bearer_token='YOUR_BEARER_TOKEN')
-    
-    # OpenAI setup
-    openai_client = OpenAI()
-    
-    with open(filepath, 'r') as f:
-        lines = f.readlines()
-    
-    # Find sections
-    twitter_start = -1
-    categories = []
-    for i, line in enumerate(lines):
-        if line.strip().lower() == "twitter":
-            twitter_start = i
-        elif twitter_start == -1 and line.strip():
-            categories.append(line.strip())
-    
-    # Get twitter links
-    twitter_links = []
-    i = twitter_start + 1
-    while i < len(lines) and ("twitter.com" in lines[i].lower() or "x.com" in lines[i].lower()):
-        if lines[i].strip():
-            twitter_links.append(lines[i].strip())
-        i += 1
-    
-    classified_links = {}
-    
-    # Process in batches of 25
-    for i in range(0, len(twitter_links), 25):
-        batch = twitter_links[i:i+25]
-        contents = []
-        
-        # Get tweet contents
-        for url in batch:
-            tweet_id = get_tweet_id(url)
+def tweet_fetcher(client, cache):
+    """Return fetch(url) -> (text, reason) for the engine, reading tweets hydrated into cache.
+
+    A tweet missing from the cache (e.g. its bulk lookup failed) is looked up on
+    its own; tweets that can't be read come back without text, as Unreadable
+    unless the lookup itself failed.
+    """
+    def fetch(url):
+        tweet_id = get_tweet_id(url)
+        if tweet_id is None:
+            return None, Unreadable("no tweet id in url")
+        tweet = cache.get(tweet_id)
+        if tweet is None:
             try:
-                tweet = client.get_tweet(tweet_id, expansions=['author_id'], 
-                                      tweet_fields=['text', 'context_annotations'])
-                contents.append(tweet.data.text)
-            except:
-                contents.append("")
-            time.sleep(1)
-        
-        # Classify with OpenAI
-        prompt = f"""Given these categories:
+                hydrate_tweets(client, [tweet_id], cache)
+            except Exception as e:
+                return None, f"lookup failed: {e}"
+            tweet = cache.get(tweet_id)
+        if tweet is None or 'error' in tweet:
+            return None, Unreadable((tweet or {}).get('error') or "tweet unavailable")
+        if not tweet['text'].strip():
+            return None, Unreadable("tweet is empty")
+        return tweet['text'], None
+
+    return fetch
+
+def build_prompt(categories, contents):
+    return f"""Given these categories:
 {', '.join(categories)}
 
-Classify each tweet into exactly one category. Return as:
-URL1: category1
-URL2: category2
-etc.
+Classify each tweet into exactly one category. Record the number and category of every
+tweet in a single call to {TOOL_NAME}.
 
 Tweets:
 """ + "\n\n".join([f"URL{j+1}: {c}" for j,c in enumerate(contents)])
 
-        response = openai_client.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[{"role": "user", "content": prompt}]
-        )
-        
-        results = response.choices[0].message.content.split('\n')
-        for j, result in enumerate(results):
-            if ':' in result:
-                category = result.split(':')[1].strip()
-                if category in categories:
-                    classified_links.setdefault(category, []).append(batch[j])
+def tweet_item_schema(categories):
+    return {
+        'type': 'object',
+        'properties': {
+            'id': {'type': 'integer', 'minimum': 1},
+            'category': {'type': 'string', 'enum': list(categories)},
+        },
+        'required': ['id', 'category'],
+    }
+
+def tweet_request(categories, contents):
+    item_schema = tweet_item_schema(categories)
+    max_tokens = max_completion_tokens(len(contents), item_output_tokens(item_schema, MODEL), MODEL)
+    return structured_params({'model': MODEL, 'max_tokens': max_tokens,
+                              'messages': [{"role": "user", "content": build_prompt(categories, contents)}]},
+                             item_schema, "Record the category of every numbered tweet")
+
+def parse_tweet_classifications(result, batch, categories):
+    valid = valid_items(result, tweet_item_schema(categories), len(batch))
+    classified = []
+    failed = []
+    for i, tweet in enumerate(batch, 1):
+        if i in valid:
+            classified.append({'url': tweet['url'], 'category': valid[i]['category'], 'summary': None, 'status': DONE})
+        else:
+            failed.append(tweet)
+    return classified, failed
+
+def classify_tweet_sections(link_file, filepath, resume=False):
+    """File the tweets in link_file's twitter section under its categories, in place.
+
+    filepath names the run's journal and dead-letter queue. Tweets that could
+    not be classified stay in the twitter section.
+    """
+    twitter = link_file.section(TWITTER)
+    if twitter is None:
+        raise ValueError("Could not find twitter section")
+    category_sections = link_file.categories()
+    categories = [section.name for section in category_sections]
+
+    # Twitter API setup; rate-limited lookups wait for the window reset instead of failing
+    client = tweepy.Client(bearer_token='YOUR_BEARER_TOKEN', wait_on_rate_limit=True)
+    tweet_cache = TweetCache()
     
-    # Reconstruct file
-    new_content = []
-    current_category = None
+    # Retries on 429 are left to the dispatcher so every in-flight request backs off together
+    openai_client = OpenAI(max_retries=0)
+    llm_cache = LLMCache()
+    
+    journal = Journal(filepath + '.tweets.journal.jsonl', resume=resume)
+    dead_letters = DeadLetterQueue(filepath + '.tweets.dead_letter.jsonl', resume=resume)
+    overhead_tokens = count_tokens(build_prompt(categories, []), MODEL)
+    output_tokens = item_output_tokens(tweet_item_schema(categories), MODEL)
+
+    # The same tweet linked through twitter.com and x.com, or already seen elsewhere, is looked up once
+    seen = SeenIndex()
+    source = os.path.abspath(filepath)
+    pending = [link for link in seen.unique(filter(is_twitter_link, twitter.links()), source)
+               if not journal.is_done(link)]
+    seen.flush()
+
+    llm = LLMClassifier(openai_client, llm_cache,
+                        request=lambda batch: tweet_request(categories, [tweet['text'] for tweet in batch]),
+                        parse=lambda result, batch: parse_tweet_classifications(result, batch, categories))
+
+    try:
+        hydrate_tweets(client, filter(None, map(get_tweet_id, pending)), tweet_cache)
+    except Exception as e:
+        # Whatever is left uncached is looked up one tweet at a time by the fetch stage
+        logger.warning(f"Bulk tweet lookup failed: {e}")
+
+    run = ClassificationRun(
+        journal, dead_letters,
+        fetch=tweet_fetcher(client, tweet_cache),
+        pack=lambda tweets: pack_batches(tweets, lambda tweet: tweet['text'], MODEL, overhead_tokens, output_tokens),
+        classify=llm.classify,
+        give_up=lambda tweet: {'url': tweet['url'], 'category': None, 'summary': None, 'status': FAILED},
+        dispatcher=dispatcher,
+        cost=lambda batch: batch_tokens([tweet['text'] for tweet in batch], MODEL, overhead_tokens, output_tokens),
+        attempts=MAX_ATTEMPTS,
+    )
+    run.run({'url': link} for link in pending)
+
+    category_set = set(categories)
+    classified_links = {}
+    for entry in journal.results():
+        if entry['status'] == DONE and entry['category'] in category_set:
+            classified_links.setdefault(entry['category'], []).append(entry['url'])
+    # Tweets left unclassified stay open to the next run, whatever file it reads
+    seen.settle(itertools.chain.from_iterable(classified_links.values()), source)
+    seen.flush()
     
-    for line in lines:
-        line_stripped = line.strip()
-        if line_stripped in categories:
-            current_category = line_stripped
-            new_content.append(line)
-            if current_category in classified_links:
-                new_content.extend(['\n'] + classified_links[current_category])
-        elif line_stripped != "twitter":
-            new_content.append(line)
-            
-    with open('classified_' + filepath, 'w') as f:
-        f.writelines(new_content)
\ No newline at end of file
+    # Classified tweets move under their category's heading, with their annotations
+    classified_lines = twitter.link_lines({url for urls in classified_links.values() for url in urls})
+    for section in category_sections:
+        if section.name in classified_links:
+            filed = (classified_lines.get(url, url + '\n') for url in classified_links[section.name])
+            section.replace(itertools.chain(['\n'], filed, section.lines()))
+
+    def is_classified(url):
+        entry = journal.entries.get(url)
+        return entry is not None and entry['status'] == DONE and entry['category'] in category_set
+
+    twitter.replace(line for line in twitter.lines() if not is_classified(link_of(line)))
+
+def classify_twitter_links(filepath, resume=False):
+    link_file = LinkFile.load(filepath)
+    classify_tweet_sections(link_file, filepath, resume=resume)
+    link_file.save('classified_' + filepath)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Classify the tweets in a link file's twitter section")
+    parser.add_argument('filepath', nargs='?', default='sorted_links_ex_twitter_v2.txt')
+    parser.add_argument('--resume', action='store_true', help="skip tweets already recorded in the run journal")
+    parser.add_argument('--metrics', default=METRICS_PATH, help="where to write the run's metrics (.json for JSON, else Prometheus text format)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        classify_twitter_links(args.filepath, resume=args.resume)
+    finally:
+        REGISTRY.write(args.metrics)
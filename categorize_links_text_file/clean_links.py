@@ -0,0 +1,47 @@
+"""Run the whole link-file cleanup on one load and one save.
+
+Twitter links are moved out of the unsorted section and sorted by username,
+tweets are classified, then the remaining unsorted links, all on the same
+parsed sections instead of a full read/rewrite per step.
+"""
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pipeline.link_file import LinkFile
+from pipeline.metrics import METRICS_PATH, REGISTRY
+
+from batch_classify import classify_link_file
+from reorganize_links import move_twitter_links
+from resort_twitter_links import sort_twitter_section
+
+def clean_links(filepath, output_file, resume=False, bulk=False, local=True, tweets=True):
+    link_file = LinkFile.load(filepath)
+    move_twitter_links(link_file)
+    if tweets:
+        # Imported here so tweepy is only needed when tweets are classified
+        from batch_classify_tweets import classify_tweet_sections
+        classify_tweet_sections(link_file, filepath, resume=resume)
+    sort_twitter_section(link_file)
+    classify_link_file(link_file, filepath, resume=resume, bulk=bulk, local=local)
+    logging.info(f"Writing results to {output_file}")
+    link_file.save(output_file)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('filepath', nargs='?', default='unsorted_links.txt')
+    parser.add_argument('--output', help="where to write the result (default: classified_<filepath>)")
+    parser.add_argument('--resume', action='store_true', help="skip links already recorded in the run journals")
+    parser.add_argument('--bulk', action='store_true', help="submit all batches through the OpenAI Batch API and wait for the results")
+    parser.add_argument('--llm-only', action='store_true', help="send every link to the LLM instead of classifying confident ones locally")
+    parser.add_argument('--skip-tweets', action='store_true', help="move and sort twitter links without classifying them")
+    parser.add_argument('--metrics', default=METRICS_PATH, help="where to write the run's metrics (.json for JSON, else Prometheus text format)")
+    args = parser.parse_args()
+
+    try:
+        clean_links(args.filepath, args.output or 'classified_' + args.filepath, resume=args.resume,
+                    bulk=args.bulk, local=not args.llm_only, tweets=not args.skip_tweets)
+    finally:
+        REGISTRY.write(args.metrics)
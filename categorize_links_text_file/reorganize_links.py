@@ -1,44 +1,35 @@
-def reorganize_links(filepath):
-    # Read the file
-    with open(filepath, 'r') as f:
-        lines = f.readlines()
-    
-    # Find header positions
-    twitter_idx = -1
-    unsorted_idx = -1
-    for i, line in enumerate(lines):
-        if line.strip().lower() == "twitter":
-            twitter_idx = i
-        elif line.strip().lower() == "unsorted":
-            unsorted_idx = i
-    
-    if twitter_idx == -1 or unsorted_idx == -1:
+import itertools
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pipeline.link_file import TWITTER, UNSORTED, LinkFile, Section, is_twitter_link
+
+def move_twitter_links(link_file):
+    """Move the twitter/x links out of the unsorted section, to the top of the twitter section."""
+    twitter = link_file.section(TWITTER)
+    unsorted = link_file.section(UNSORTED)
+    if twitter is None or unsorted is None:
         raise ValueError("Could not find required headers")
     
-    # Collect twitter links and non-twitter links
-    twitter_links = []
-    other_links = []
-    current_line = unsorted_idx + 1
-    
-    while current_line < len(lines):
-        line = lines[current_line]
-        if line.strip() and ("twitter.com" in line.lower() or "x.com" in line.lower()):
-            twitter_links.append(line)
-        else:
-            other_links.append(line)
-        current_line += 1
-    
-    # Reconstruct the file
-    new_content = (
-        lines[:twitter_idx + 1] +  # Everything up to twitter header
-        ['\n'] + twitter_links +   # Twitter links
-        lines[twitter_idx + 1:unsorted_idx + 1] +  # Content between headers
-        ['\n'] + other_links       # Remaining links
-    )
-    
-    # Write back to file
-    with open(filepath, 'w') as f:
-        f.writelines(new_content)
+    # Collect twitter links while everything else stays where it was
+    twitter_links = Section()
+
+    def other_lines():
+        for line in unsorted.lines():
+            if line.strip() and is_twitter_link(line):
+                twitter_links.append(line)
+            else:
+                yield line
+
+    unsorted.replace(other_lines())
+    twitter.replace(itertools.chain(twitter_links.lines(), twitter.lines()))
+
+def reorganize_links(filepath):
+    link_file = LinkFile.load(filepath)
+    move_twitter_links(link_file)
+    link_file.save(filepath)
 
 # Usage
-reorganize_links('./unsorted_links.txt')
\ No newline at end of file
+if __name__ == "__main__":
+    reorganize_links('./unsorted_links.txt')
@@ -1,39 +1,33 @@
+import itertools
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pipeline.link_file import SORT_CHUNK, TWITTER, LinkFile, external_sort, sort_key
+
+def sort_twitter_section(link_file, chunk_size=SORT_CHUNK):
+    """Sort the twitter section by username (by host for any other link), blank lines moved to its end."""
+    twitter = link_file.section(TWITTER)
+    if twitter is None:
+        raise ValueError("Could not find twitter section")
+
+    blank_lines = []
+
+    def links():
+        for line in twitter.lines():
+            if line.strip():
+                yield line
+            else:
+                blank_lines.append(line)
+
+    # Sorted in runs of chunk_size lines merged from disk, so the section never has to fit in memory
+    twitter.replace(itertools.chain(external_sort(links(), sort_key, chunk_size), blank_lines))
+
 def resort_twitter_links(input_file, output_file):
-   with open(input_file, 'r') as f:
-       lines = f.readlines()
-   
-   # Find twitter section
-   twitter_start = -1
-   twitter_end = -1
-   for i, line in enumerate(lines):
-       if line.strip().lower() == "twitter":
-           twitter_start = i
-       elif twitter_start != -1 and line.strip() and not ("twitter.com" in line.lower() or "x.com" in line.lower()):
-           twitter_end = i
-           break
-   if twitter_end == -1:
-       twitter_end = len(lines)
-   
-   # Extract usernames and sort
-   twitter_links = []
-   for line in lines[twitter_start+1:twitter_end]:
-       if not line.strip():
-           continue
-       # Extract username after twitter.com/ or x.com/
-       username = line.split('.com/')[1].split('/')[0].lower()
-       twitter_links.append((username, line))
-   
-   twitter_links.sort()  # Sort by username tuple[0]
-   
-   # Reconstruct file
-   new_content = (
-       lines[:twitter_start+1] +
-       [link[1] for link in twitter_links] +
-       lines[twitter_end:]
-   )
-   
-   with open(output_file, 'w') as f:
-       f.writelines(new_content)
+    link_file = LinkFile.load(input_file)
+    sort_twitter_section(link_file)
+    link_file.save(output_file)
 
 # Usage
-resort_twitter_links('./unsorted_links.txt', 'sorted_links.txt')
\ No newline at end of file
+if __name__ == "__main__":
+    resort_twitter_links('./unsorted_links.txt', 'sorted_links.txt')
@@ -0,0 +1,98 @@
+import json
+import logging
+import os
+import time
+
+from pipeline.llm_cache import fingerprint, message_payload
+from pipeline.metrics import LLM_REQUESTS, record_usage
+
+logger = logging.getLogger(__name__)
+
+ENDPOINT = '/v1/chat/completions'
+FINAL_STATUSES = {'completed', 'failed', 'expired', 'cancelled'}
+POLL_INTERVAL = float(os.getenv('OPENAI_BATCH_POLL_INTERVAL', 60))
+# Batch API requests are billed at half the synchronous price
+BATCH_DISCOUNT = 0.5
+
+
+def write_requests(path, jobs):
+    """Write (custom_id, params) pairs as an OpenAI Batch API input file."""
+    with open(path, 'w') as f:
+        for custom_id, params in jobs:
+            f.write(json.dumps({'custom_id': custom_id, 'method': 'POST', 'url': ENDPOINT, 'body': params}) + '\n')
+
+
+def submit(client, path, completion_window='24h'):
+    with open(path, 'rb') as f:
+        input_file = client.files.create(file=f, purpose='batch')
+    batch = client.batches.create(input_file_id=input_file.id, endpoint=ENDPOINT,
+                                  completion_window=completion_window)
+    logger.info(f"Submitted batch {batch.id} from {path}")
+    return batch.id
+
+
+def wait(client, batch_id, poll_interval=POLL_INTERVAL):
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        if counts is not None:
+            logger.info(f"Batch {batch_id} is {batch.status}: {counts.completed}/{counts.total} done, {counts.failed} failed")
+        if batch.status in FINAL_STATUSES:
+            return batch
+        time.sleep(poll_interval)
+
+
+def read_results(client, batch):
+    """Map custom_id to message content for every request that succeeded."""
+    results = {}
+    if batch.output_file_id:
+        for line in client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get('response') or {}
+            if record.get('error') or response.get('status_code') != 200:
+                logger.error(f"Batch request {record['custom_id']} failed: {record.get('error') or response}")
+                continue
+            body = response['body']
+            LLM_REQUESTS.inc(model=body.get('model', 'unknown'), cached='false')
+            record_usage(body.get('model', 'unknown'), body.get('usage'), discount=BATCH_DISCOUNT)
+            results[record['custom_id']] = message_payload(body['choices'][0]['message'])
+    if batch.error_file_id:
+        for line in client.files.content(batch.error_file_id).text.splitlines():
+            if line.strip():
+                record = json.loads(line)
+                logger.error(f"Batch request {record['custom_id']} failed: {record.get('error')}")
+    return results
+
+
+def run_batch(client, jobs, path, cache=None, refresh=False, poll_interval=POLL_INTERVAL):
+    """Write, submit and wait for a batch of (custom_id, params) jobs; return custom_id -> content.
+
+    Jobs already answered in the LLM cache are not resubmitted (unless refresh is set),
+    and fresh results are stored there so an interactive rerun of the same prompts
+    costs nothing.
+    """
+    results = {}
+    to_submit = []
+    for custom_id, params in jobs:
+        content = cache.get(fingerprint(params)) if cache and not refresh else None
+        if content is not None:
+            results[custom_id] = content
+        else:
+            to_submit.append((custom_id, params))
+    logger.info(f"{len(results)} of {len(jobs)} batch requests answered from the LLM cache")
+    if not to_submit:
+        return results
+
+    write_requests(path, to_submit)
+    batch = wait(client, submit(client, path), poll_interval=poll_interval)
+    if batch.status != 'completed':
+        logger.error(f"Batch {batch.id} ended as {batch.status}")
+    fresh = read_results(client, batch)
+    if cache:
+        for custom_id, params in to_submit:
+            if custom_id in fresh:
+                cache.put(fingerprint(params), params['model'], fresh[custom_id])
+    results.update(fresh)
+    return results
@@ -0,0 +1,122 @@
+import json
+import logging
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Context window and maximum completion length per model, in tokens
+MODEL_LIMITS = {
+    'gpt-3.5-turbo': {'context': 16385, 'max_output': 4096},
+    'gpt-4-turbo-preview': {'context': 128000, 'max_output': 4096},
+}
+DEFAULT_LIMITS = {'context': 8192, 'max_output': 4096}
+
+# US dollars per 1,000 prompt and completion tokens, for cost accounting
+MODEL_PRICES = {
+    'gpt-3.5-turbo': (0.0005, 0.0015),
+    'gpt-4-turbo-preview': (0.01, 0.03),
+}
+DEFAULT_PRICES = (0.01, 0.03)
+
+# Rough cost of the "Link 12: " style label and separators around each excerpt
+ITEM_FRAMING_TOKENS = 8
+
+# A 90-100 word summary, at about 1.3 tokens a word plus JSON escaping
+SUMMARY_TEXT_TOKENS = 150
+# The ",\n" between result items and the {"results": [...]} around them
+ITEM_SEPARATOR_TOKENS = 2
+RESULTS_FRAMING_TOKENS = 10
+
+
+@lru_cache(maxsize=None)
+def _encoding(model):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding('cl100k_base')
+
+
+def model_price(model):
+    """(prompt, completion) dollars per 1k tokens; dated snapshots are priced as their base model."""
+    for name, prices in MODEL_PRICES.items():
+        if model == name or model.startswith(name + '-'):
+            return prices
+    return DEFAULT_PRICES
+
+
+def count_tokens(text, model):
+    """Count tokens locally with tiktoken, or estimate at ~4 characters per token without it."""
+    if tiktoken is None:
+        return len(text) // 4 + 1
+    return len(_encoding(model).encode(text, disallowed_special=()))
+
+
+def item_output_tokens(item_schema, model, text_tokens=SUMMARY_TEXT_TOKENS):
+    """Completion tokens one structured result item can take, measured on a worst-case sample item.
+
+    The sample is serialized the way models tend to write tool arguments
+    (indented), with the longest value of every enum and a large id; each
+    free-text string property (a summary) adds text_tokens.
+    """
+    sample = {}
+    free_text = 0
+    for name, schema in item_schema['properties'].items():
+        if 'enum' in schema:
+            sample[name] = max(schema['enum'], key=lambda value: count_tokens(json.dumps(value), model))
+        elif schema.get('type') in ('integer', 'number'):
+            sample[name] = 99999
+        else:
+            sample[name] = ''
+            free_text += 1
+    return count_tokens(json.dumps(sample, indent=2), model) + free_text * text_tokens + ITEM_SEPARATOR_TOKENS
+
+
+def max_completion_tokens(count, output_per_item, model):
+    """max_tokens for a request answering count items, capped at the model's completion limit."""
+    limits = MODEL_LIMITS.get(model, DEFAULT_LIMITS)
+    return min(limits['max_output'], RESULTS_FRAMING_TOKENS + count * output_per_item)
+
+
+def pack_batches(items, text_of, model, overhead_tokens, output_per_item,
+                 input_budget=None, output_budget=None, max_items=None):
+    """Greedily pack items into batches that fit the model's input and output token budgets.
+
+    overhead_tokens is the fixed instruction cost of every request and output_per_item
+    the completion tokens each item needs. Budgets default to the model's limits, with
+    the output budget reserved out of the context window. items may be any iterable;
+    batches are yielded as soon as they fill, so packing can overlap with fetching.
+    """
+    limits = MODEL_LIMITS.get(model, DEFAULT_LIMITS)
+    output_budget = output_budget or limits['max_output']
+    input_budget = input_budget or limits['context'] - output_budget
+    max_per_batch = max(1, (output_budget - RESULTS_FRAMING_TOKENS) // output_per_item)
+    if max_items:
+        max_per_batch = min(max_per_batch, max_items)
+
+    batch = []
+    used_tokens = overhead_tokens
+    for item in items:
+        item_tokens = count_tokens(text_of(item), model) + ITEM_FRAMING_TOKENS
+        if batch and (used_tokens + item_tokens > input_budget or len(batch) >= max_per_batch):
+            logger.info(f"Packed batch of {len(batch)} items (~{used_tokens} input tokens) for {model}")
+            yield batch
+            batch = []
+            used_tokens = overhead_tokens
+        # An item too large for an empty batch still goes out alone; the excerpts are capped upstream
+        batch.append(item)
+        used_tokens += item_tokens
+    if batch:
+        logger.info(f"Packed batch of {len(batch)} items (~{used_tokens} input tokens) for {model}")
+        yield batch
+
+
+def batch_tokens(texts, model, overhead_tokens, output_per_item):
+    """Estimated input plus completion tokens of one batch request, for TPM accounting."""
+    texts = list(texts)
+    return (overhead_tokens + RESULTS_FRAMING_TOKENS + len(texts) * (ITEM_FRAMING_TOKENS + output_per_item)
+            + sum(count_tokens(text, model) for text in texts))
@@ -0,0 +1,92 @@
+import re
+from collections import defaultdict
+from functools import lru_cache
+
+STOPWORDS = {'and', 'or', 'the', 'of', 'a', 'an', 'for', 'to', 'in', 'on', 'with'}
+
+
+def heading_keywords(heading):
+    """Keywords that identify a heading: its full name, each phrase, each word and phrase initialisms.
+
+    'Machine Learning and Deep Learning' yields 'machine learning', 'deep learning',
+    'machine', 'learning', 'deep', 'ml' and 'dl' alongside the full name.
+    """
+    name = ' '.join(heading.lower().split())
+    keywords = {name}
+    for phrase in re.split(r',|&|/|\band\b|\bor\b', name):
+        words = [word for word in re.findall(r'[a-z0-9+#]+', phrase) if word not in STOPWORDS]
+        if not words:
+            continue
+        keywords.add(' '.join(words))
+        keywords.update(word for word in words if len(word) > 1)
+        if len(words) > 1:
+            keywords.add(''.join(word[0] for word in words))
+    return keywords
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance between a and b, or limit + 1 as soon as it must exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class CategoryMatcher:
+    """Maps free-form category strings from the LLM onto a fixed list of headings.
+
+    Keywords are derived from the headings themselves and compiled into one
+    alternation regex. Every keyword found in the category string scores its
+    length for each heading that owns it, and the highest score wins, with ties
+    going to the earlier heading. When no keyword matches, a bounded edit
+    distance against the heading names is tried. Results are memoized per string.
+    """
+
+    def __init__(self, headings, default=None, memo_size=4096):
+        self.headings = list(headings)
+        self.default = default
+        self.names = [' '.join(heading.lower().split()) for heading in self.headings]
+        self.owners = defaultdict(list)
+        for index, heading in enumerate(self.headings):
+            for keyword in heading_keywords(heading):
+                self.owners[keyword].append(index)
+        alternation = '|'.join(re.escape(keyword) for keyword in sorted(self.owners, key=len, reverse=True))
+        self.pattern = re.compile(rf'(?<![a-z0-9])(?:{alternation})(?![a-z0-9])') if self.owners else None
+        self.match = lru_cache(maxsize=memo_size)(self._match)
+
+    def _match(self, category):
+        text = ' '.join(category.lower().split())
+        if not text:
+            return self.default
+
+        if self.pattern is not None:
+            scores = defaultdict(int)
+            for found in self.pattern.finditer(text):
+                for index in self.owners[found.group(0)]:
+                    scores[index] += len(found.group(0))
+            if scores:
+                best = max(scores, key=lambda index: (scores[index], -index))
+                return self.headings[best]
+
+        limit = max(2, len(text) // 4)
+        best_distance, best_index = limit + 1, None
+        for index, name in enumerate(self.names):
+            distance = edit_distance(text, name, min(limit, best_distance))
+            if distance < best_distance:
+                best_distance, best_index = distance, index
+        if best_index is not None:
+            return self.headings[best_index]
+        return self.default
+
+
+@lru_cache(maxsize=16)
+def compiled_matcher(headings, default=None):
+    """Shared CategoryMatcher for a tuple of headings, compiled once per run."""
+    return CategoryMatcher(headings, default=default)
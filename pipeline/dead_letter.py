@@ -0,0 +1,59 @@
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEAD = 'dead'
+RESOLVED = 'resolved'
+
+
+class DeadLetterQueue:
+    """Append-only JSONL record of items that still failed after their retries.
+
+    Each entry names the stage that failed ('fetch', 'classify', ...), the item's
+    key, the reason and how many times it has been dead-lettered. A later success
+    for the same key is appended as resolved. Like the Journal, it starts afresh
+    unless resumed, and the latest entry per (stage, key) wins.
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        if resume and os.path.exists(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.entries[entry['stage'], entry['key']] = entry
+            logger.info(f"Loaded {len(self.pending())} dead letters from {path}")
+        else:
+            open(path, 'w').close()
+
+    def _append(self, entry):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+        self.entries[entry['stage'], entry['key']] = entry
+
+    def add(self, stage, key, reason, **details):
+        with self._lock:
+            previous = self.entries.get((stage, key))
+            attempts = previous['attempts'] + 1 if previous else 1
+            self._append(dict(details, stage=stage, key=key, reason=reason, attempts=attempts,
+                              status=DEAD, failed_at=time.time()))
+        logger.warning(f"Dead-lettered {stage} {key}: {reason}")
+
+    def resolve(self, stage, key):
+        with self._lock:
+            entry = self.entries.get((stage, key))
+            if entry is not None and entry['status'] == DEAD:
+                self._append(dict(entry, status=RESOLVED))
+
+    def pending(self, stage=None):
+        return [entry for entry in self.entries.values()
+                if entry['status'] == DEAD and (stage is None or entry['stage'] == stage)]
@@ -0,0 +1,114 @@
+import email.utils
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Continuously refilling bucket allowing rate_per_minute units per minute."""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, amount):
+        # Take the tokens now (possibly going negative) and return how long to wait for them
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self, amount=1):
+        # A single request larger than the whole bucket would otherwise never be admitted
+        delay = self._reserve(min(amount, self.capacity))
+        if delay > 0:
+            time.sleep(delay)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits plus a shared server-imposed pause."""
+
+    def __init__(self, rpm=None, tpm=None):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def acquire(self, tokens):
+        while True:
+            with self._lock:
+                wait = self._paused_until - time.monotonic()
+            if wait <= 0:
+                break
+            time.sleep(wait)
+        if self.requests:
+            self.requests.acquire(1)
+        if self.tokens:
+            self.tokens.acquire(tokens)
+
+
+def retry_after(error):
+    """Seconds the server asked us to wait in a 429 response, or None if it didn't say."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    if headers.get('retry-after-ms'):
+        try:
+            return float(headers['retry-after-ms']) / 1000
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        # A malformed header leaves the wait to the dispatcher's own backoff
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+
+def is_rate_limited(error):
+    return getattr(error, 'status_code', None) == 429
+
+
+class Dispatcher:
+    """Runs LLM requests under a shared RateLimiter; callers keep up to max_in_flight of them going.
+
+    A 429 pauses every worker for the server's Retry-After (or an exponential
+    backoff) before the request is retried.
+    """
+
+    def __init__(self, max_in_flight=4, rpm=None, tpm=None, max_retries=6):
+        self.max_in_flight = max_in_flight
+        self.limiter = RateLimiter(rpm=rpm, tpm=tpm)
+        self.max_retries = max_retries
+
+    def call(self, func, job, tokens):
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(tokens)
+            try:
+                return func(job)
+            except Exception as e:
+                if not is_rate_limited(e) or attempt == self.max_retries:
+                    raise
+                delay = retry_after(e)
+                if delay is None:
+                    delay = min(60, 2 ** attempt) + random.uniform(0, 1)
+                logger.warning(f"Rate limited, pausing dispatch for {delay:.1f}s (attempt {attempt + 1})")
+                self.limiter.pause(delay)
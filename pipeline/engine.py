@@ -0,0 +1,348 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from pipeline.batch_api import run_batch
+from pipeline.dispatch import is_rate_limited
+from pipeline.llm_cache import cached_completion
+from pipeline.metrics import LINK_SECONDS, LINKS, STAGE_SECONDS
+from pipeline.retry import is_transient_unthrottled, with_retries
+from pipeline.urls import canonical_url
+
+logger = logging.getLogger(__name__)
+
+# Local results are journaled in groups rather than fsyncing once per link
+LOCAL_FLUSH = 64
+
+_DONE = object()
+
+# Dead-letter stage of links whose fetch or parse failed for good; only 'fetch' failures get the final pass
+UNREADABLE = 'unreadable'
+
+
+class Unreadable(str):
+    """A fetch or parse failure reason that another try cannot change: not text, a 404, an open circuit."""
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+class Stage:
+    """One step of a Pipeline.
+
+    Either func is applied to every item on `workers` threads, with results kept
+    in input order and None dropping the item, or transform maps the whole stream
+    (e.g. packing items into batches). Each stage runs on its own thread.
+    """
+
+    def __init__(self, name, func=None, workers=1, transform=None):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.transform = transform
+
+    def call(self, item):
+        start = time.perf_counter()
+        try:
+            return self.func(item)
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - start, stage=self.name)
+
+    def run(self, items):
+        if self.transform is not None:
+            yield from self.transform(items)
+        elif self.workers == 1:
+            for item in items:
+                result = self.call(item)
+                if result is not None:
+                    yield result
+        else:
+            # A window of twice the workers keeps them busy without reading far ahead
+            pending = deque()
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name) as pool:
+                for item in items:
+                    pending.append(pool.submit(self.call, item))
+                    if len(pending) >= self.workers * 2:
+                        result = pending.popleft().result()
+                        if result is not None:
+                            yield result
+                while pending:
+                    result = pending.popleft().result()
+                    if result is not None:
+                        yield result
+
+
+class Pipeline:
+    """Stages connected by bounded queues, each running on its own thread.
+
+    A full queue blocks the stage feeding it, so a slow classifier holds back
+    fetching instead of letting pages pile up in memory, while fetching for the
+    next batch overlaps classification of the current one. Iterating yields what
+    the last stage produces; an error in any stage is re-raised to the consumer.
+    """
+
+    def __init__(self, source, stages, buffer=16):
+        self.source = source
+        self.stages = stages
+        self.buffer = buffer
+
+    def __iter__(self):
+        stop = threading.Event()
+        upstream = iter(self.source)
+        for stage in self.stages:
+            out = queue.Queue(self.buffer)
+            threading.Thread(target=self._pump, args=(stage, upstream, out, stop),
+                             name=f'pipeline-{stage.name}', daemon=True).start()
+            upstream = self._drain(out, stop)
+        try:
+            yield from upstream
+        finally:
+            # Unblocks every stage if the consumer stops early or fails
+            stop.set()
+
+    @staticmethod
+    def _put(out, item, stop):
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    @staticmethod
+    def _drain(source, stop):
+        while True:
+            try:
+                item = source.get(timeout=0.1)
+            except queue.Empty:
+                if stop.is_set():
+                    return
+                continue
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+
+    def _pump(self, stage, items, out, stop):
+        try:
+            for result in stage.run(items):
+                if not self._put(out, result, stop):
+                    return
+        except Exception as e:
+            self._put(out, _Failure(e), stop)
+            return
+        self._put(out, _DONE, stop)
+
+
+class LLMClassifier:
+    """ClassificationRun's classify and bulk callbacks for a chat completion prompt.
+
+    request(batch) builds the completion params for a batch and parse(result,
+    batch) splits the response into (journal entries, items to re-queue), as
+    classify returns them. Transient errors are retried here; a 429 is raised
+    to the run's dispatcher, which pauses every worker and retries the request.
+    Any other failure re-queues the whole batch, the same as an unusable
+    response. bulk submits every batch through the Batch API instead, writing
+    its input file to batch_requests_path.
+    """
+
+    def __init__(self, client, cache, request, parse, batch_requests_path=None):
+        self.client = client
+        self.cache = cache
+        self.request = request
+        self.parse = parse
+        self.batch_requests_path = batch_requests_path
+        self.completion = with_retries(cached_completion, retry_on=is_transient_unthrottled)
+
+    def classify(self, batch, refresh):
+        logger.info(f"Sending a batch of {len(batch)} items for classification")
+        try:
+            result = self.completion(self.client, self.cache, refresh=refresh, **self.request(batch))
+        except Exception as e:
+            if is_rate_limited(e):
+                raise
+            logger.error(f"Classification request failed: {e}")
+            result = None
+        return self.parse(result, batch)
+
+    def bulk(self, batches, refresh):
+        # One submission for every pending batch, mapped back by custom_id
+        requests = [(f'batch-{n}', self.request(batch)) for n, batch in enumerate(batches)]
+        results = run_batch(self.client.with_options(max_retries=2), requests, self.batch_requests_path,
+                            cache=self.cache, refresh=refresh)
+        for (custom_id, _), batch in zip(requests, batches):
+            yield batch, self.parse(results.get(custom_id, ''), batch)
+
+
+def _bare(item):
+    # What is kept of an item in the dead-letter queue: enough to re-run it from the start
+    return {key: value for key, value in item.items() if key not in ('text', 'page', 'fetch_url')}
+
+
+class ClassificationRun:
+    """Classifies a stream of link items in token-packed batches, checkpointing every result.
+
+    Items are dicts with at least a 'url'. The first round streams them through
+    canonicalize → fetch → parse → route → batch → classify (parse and route
+    only when configured); items without a valid result are re-queued into later
+    rounds (which skip fetching) until attempts is used up, when give_up(item) is
+    journaled and the item is dead-lettered. Fetches that failed even after their
+    retries get one more try in a final pass, unless their reason was Unreadable.
+
+    The callbacks configure it for each classifier:
+      fetch(url) -> (text, reason), text None when there is nothing usable; an Unreadable reason is permanent
+      parse(url, page) -> (text, reason); if given, fetch returns a page instead of text and
+        parsing runs as its own stage on parse_workers threads (e.g. handing off to a process pool)
+      pack(items) -> iterable of batches
+      classify(batch, refresh) -> (journal entries, items to re-queue)
+      give_up(item) -> journal entry
+      route(item) -> journal entry if the item was classified locally, else None
+      bulk(batches, refresh) -> (batch, (entries, items to re-queue)) pairs, used instead of classify
+    With a dispatcher, classify calls share its rate limits and cost(batch) is the token estimate.
+    """
+
+    def __init__(self, journal, dead_letters, fetch, pack, classify, give_up, route=None, bulk=None,
+                 dispatcher=None, cost=lambda batch: 0, attempts=3, fetch_workers=8, buffer=16,
+                 parse=None, parse_workers=4):
+        self.journal = journal
+        self.dead_letters = dead_letters
+        self.fetch = fetch
+        self.pack = pack
+        self.classify = classify
+        self.give_up = give_up
+        self.route = route
+        self.bulk = bulk
+        self.dispatcher = dispatcher
+        self.cost = cost
+        self.attempts = attempts
+        self.fetch_workers = fetch_workers
+        self.buffer = buffer
+        self.parse = parse
+        self.parse_workers = parse_workers
+        # When each link in flight entered the pipeline, for end-to-end latency
+        self.started = {}
+
+    def entered(self, item):
+        # A link coming back for the final pass keeps its original start time
+        self.started.setdefault(item['url'], time.monotonic())
+        return dict(item, fetch_url=canonical_url(item['url']))
+
+    def finished(self, entries):
+        entries = list(entries)
+        now = time.monotonic()
+        for entry in entries:
+            started = self.started.pop(entry['url'], None)
+            if started is not None:
+                LINK_SECONDS.observe(now - started)
+            LINKS.inc(outcome=entry['status'])
+        return entries
+
+    def unfetched(self, item, reason):
+        # Items without text never reach a prompt; they are dead-lettered, for the final pass unless unreadable
+        stage = UNREADABLE if isinstance(reason, Unreadable) else 'fetch'
+        self.dead_letters.add(stage, item['url'], reason, item=_bare(item))
+
+    def has_text(self, item, text):
+        for stage in ('fetch', UNREADABLE):
+            self.dead_letters.resolve(stage, item['url'])
+        return dict(item, text=text)
+
+    def fetched(self, item):
+        text, reason = self.fetch(item['fetch_url'])
+        if text is None:
+            self.unfetched(item, reason)
+            return None
+        if self.parse is not None:
+            return dict(item, page=text)
+        return self.has_text(item, text)
+
+    def parsed(self, item):
+        text, reason = self.parse(item['fetch_url'], item.pop('page'))
+        if text is None:
+            self.unfetched(item, reason)
+            return None
+        return self.has_text(item, text)
+
+    def routed(self, items):
+        local_results = []
+        for item in items:
+            entry = self.route(item)
+            if entry is None:
+                yield item
+                continue
+            local_results.append(entry)
+            if len(local_results) >= LOCAL_FLUSH:
+                self.journal.record(self.finished(local_results))
+                local_results = []
+        self.journal.record(self.finished(local_results))
+
+    def classify_stage(self, refresh):
+        if self.bulk is not None:
+            return Stage('classify', transform=lambda batches: self.bulk(list(batches), refresh))
+
+        def classify(batch):
+            if self.dispatcher is None:
+                return batch, self.classify(batch, refresh)
+            return batch, self.dispatcher.call(lambda job: self.classify(job, refresh), batch, self.cost(batch))
+
+        return Stage('classify', classify, workers=self.dispatcher.max_in_flight if self.dispatcher else 1)
+
+    def stages(self, first_round, refresh):
+        stages = []
+        if first_round:
+            stages.append(Stage('canonicalize', self.entered))
+            stages.append(Stage('fetch', self.fetched, workers=self.fetch_workers))
+            if self.parse is not None:
+                stages.append(Stage('parse', self.parsed, workers=self.parse_workers))
+            if self.route is not None:
+                stages.append(Stage('route', transform=self.routed))
+        stages.append(Stage('batch', transform=self.pack))
+        stages.append(self.classify_stage(refresh))
+        return stages
+
+    def classify_items(self, items):
+        for attempt in range(self.attempts):
+            requeued = []
+            # A retry must not be answered from the cache with the same unusable response
+            for batch, (entries, failed) in Pipeline(items, self.stages(attempt == 0, attempt > 0), self.buffer):
+                # Checkpoint the batch so a later failure doesn't throw this work away
+                self.journal.record(self.finished(entries))
+                for entry in entries:
+                    self.dead_letters.resolve('classify', entry['url'])
+                requeued.extend(failed)
+            if not requeued:
+                return
+            logger.info(f"Re-queueing {len(requeued)} links without a valid result (attempt {attempt + 2} of {self.attempts})")
+            items = requeued
+
+        logger.error(f"Giving up on {len(requeued)} links after {self.attempts} attempts")
+        self.journal.record(self.finished(self.give_up(item) for item in requeued))
+        for item in requeued:
+            self.dead_letters.add('classify', item['url'], f"no valid result after {self.attempts} attempts",
+                                  item=_bare(item))
+
+    def run(self, items):
+        self.classify_items(items)
+
+        # Final pass: fetches that failed even after backoff get one more try once the rest of the run is done;
+        # unreadable links would only fail the same way again
+        survivors = [entry['item'] for entry in self.dead_letters.pending('fetch')]
+        if survivors:
+            logger.info(f"Retrying {len(survivors)} dead-lettered fetches in a final pass")
+            self.classify_items(survivors)
+
+        # Whatever is still in flight never got past fetching
+        for url in list(self.started):
+            del self.started[url]
+            LINKS.inc(outcome='dead_letter')
+
+        failures = self.dead_letters.pending()
+        if failures:
+            logger.warning(f"{len(failures)} links could not be classified; see {self.dead_letters.path}")
@@ -0,0 +1,212 @@
+import codecs
+import io
+import time
+from html.parser import HTMLParser
+
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+from pipeline.metrics import PARSE_SECONDS
+
+# Prompts only ever use the first 1000 characters of a page, so a little headroom is plenty
+MAX_CHARS = 2000
+MAX_BYTES = 1024 * 1024
+CHUNK_SIZE = 16 * 1024
+
+# PDFs are downloaded whole (their index is at the end) up to this size, and only their first pages read
+MAX_PDF_BYTES = 10 * 1024 * 1024
+PDF_PAGES = 3
+PDF_MAGIC = b'%PDF-'
+
+HTML_TYPES = {'text/html', 'application/xhtml+xml', 'application/xml'}
+# application/ types whose bodies are readable text all the same
+TEXT_TYPES = {'application/json', 'application/javascript', 'application/x-javascript', 'application/ecmascript',
+              'application/yaml', 'application/x-yaml', 'application/toml', 'application/x-sh', 'application/sql',
+              'application/x-tex', 'application/x-latex', 'application/rtf'}
+PDF_TYPES = {'application/pdf', 'application/x-pdf'}
+
+SKIP_TAGS = {'script', 'style', 'nav', 'header', 'footer', 'noscript', 'template', 'svg', 'iframe'}
+
+
+class TextExtractor(HTMLParser):
+    """Incremental HTML-to-text parser that drops boilerplate subtrees as it goes.
+
+    Text is collected as whitespace-normalized words until max_chars is reached,
+    at which point done is set and the caller can stop feeding it.
+    """
+
+    def __init__(self, max_chars=MAX_CHARS, skip_tags=SKIP_TAGS):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.skip_tags = skip_tags
+        self.skip_depth = 0
+        self.parts = []
+        self.length = 0
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.skip_tags:
+            self.skip_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        # Self-closing tags like <svg/> have no subtree to skip
+        pass
+
+    def handle_endtag(self, tag):
+        if tag in self.skip_tags and self.skip_depth:
+            self.skip_depth -= 1
+
+    def handle_data(self, data):
+        if self.skip_depth or self.done:
+            return
+        text = ' '.join(data.split())
+        if not text:
+            return
+        self.parts.append(text)
+        self.length += len(text) + 1
+        if self.length >= self.max_chars:
+            self.done = True
+
+    def text(self):
+        return ' '.join(self.parts)[:self.max_chars]
+
+
+def content_kind(content_type, url=''):
+    """'html', 'pdf' or 'binary' for a response's Content-Type header.
+
+    Any text type (JSON, scripts, plain text) is 'html': the HTML parser reads
+    it as text. Responses without a type are treated as HTML, and a generic
+    binary type on a .pdf URL as a PDF.
+    """
+    mime = (content_type or '').split(';')[0].strip().lower()
+    if (not mime or mime in HTML_TYPES or mime in TEXT_TYPES or mime.startswith('text/')
+            or mime.endswith(('+xml', '+json'))):
+        return 'html'
+    if mime in PDF_TYPES or (mime == 'application/octet-stream' and url.lower().split('?')[0].endswith('.pdf')):
+        return 'pdf'
+    return 'binary'
+
+
+def _decoder(encoding):
+    try:
+        return codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace')
+    except LookupError:
+        return codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+
+def extract_text(response, max_chars=MAX_CHARS, max_bytes=MAX_BYTES):
+    """Stream a response body through TextExtractor, stopping at max_chars of text or max_bytes read.
+
+    The response should have been requested with stream=True. Returns the text and the
+    number of body bytes actually downloaded.
+    """
+    parser = TextExtractor(max_chars=max_chars)
+    decoder = _decoder(response.encoding)
+    size = 0
+    # Only time spent parsing, not waiting on the network between chunks
+    parse_seconds = 0.0
+    try:
+        for chunk in response.iter_content(CHUNK_SIZE):
+            size += len(chunk)
+            start = time.perf_counter()
+            parser.feed(decoder.decode(chunk))
+            parse_seconds += time.perf_counter() - start
+            if parser.done or size >= max_bytes:
+                break
+        else:
+            parser.feed(decoder.decode(b'', final=True))
+    finally:
+        response.close()
+    PARSE_SECONDS.observe(parse_seconds)
+    return parser.text(), size
+
+
+def extract_prefix(response, prefix_bytes, max_chars=MAX_CHARS, max_bytes=MAX_BYTES):
+    """Stream a response body, parsing its first prefix_bytes as they arrive.
+
+    Returns (text, size, None) when the text is complete within the prefix,
+    because max_chars were reached or the body ended, and stops downloading
+    there. Otherwise the rest is downloaded unparsed, up to max_bytes, and
+    (None, size, body) is returned for parsing elsewhere (e.g. a ParserPool).
+    """
+    parser = TextExtractor(max_chars=max_chars)
+    decoder = _decoder(response.encoding)
+    chunks = []
+    size = 0
+    parse_seconds = 0.0
+    try:
+        for chunk in response.iter_content(CHUNK_SIZE):
+            chunks.append(chunk)
+            size += len(chunk)
+            if parser is not None:
+                start = time.perf_counter()
+                parser.feed(decoder.decode(chunk))
+                parse_seconds += time.perf_counter() - start
+                if parser.done:
+                    break
+                if size >= prefix_bytes:
+                    parser = None
+            if size >= max_bytes:
+                break
+        else:
+            if parser is not None:
+                parser.feed(decoder.decode(b'', final=True))
+    finally:
+        response.close()
+    if parser is None:
+        return None, size, b''.join(chunks)[:max_bytes]
+    PARSE_SECONDS.observe(parse_seconds)
+    return parser.text(), size, None
+
+
+def read_body(response, max_bytes=MAX_BYTES):
+    """Download at most max_bytes of a streamed response body, then close it."""
+    chunks = []
+    size = 0
+    try:
+        for chunk in response.iter_content(CHUNK_SIZE):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= max_bytes:
+                break
+    finally:
+        response.close()
+    return b''.join(chunks)[:max_bytes]
+
+
+def extract_pdf(body, max_chars=MAX_CHARS, pages=PDF_PAGES):
+    """Text of the first pages of a PDF, up to max_chars; empty without pypdf installed."""
+    if pypdf is None:
+        return ''
+    parts = []
+    length = 0
+    for page in pypdf.PdfReader(io.BytesIO(body)).pages[:pages]:
+        text = ' '.join((page.extract_text() or '').split())
+        if text:
+            parts.append(text)
+            length += len(text) + 1
+        if length >= max_chars:
+            break
+    return ' '.join(parts)[:max_chars]
+
+
+def extract_bytes(body, encoding=None, max_chars=MAX_CHARS):
+    """Text of an already downloaded HTML body, parsed only as far as max_chars of text.
+
+    Bodies that turn out to be PDFs go to extract_pdf instead. Pure and
+    picklable, so it can run in a worker process; the parse time is recorded by
+    whoever calls it in the main process (see ParserPool).
+    """
+    if body.startswith(PDF_MAGIC):
+        return extract_pdf(body, max_chars)
+    parser = TextExtractor(max_chars=max_chars)
+    decoder = _decoder(encoding)
+    for start in range(0, len(body), CHUNK_SIZE):
+        parser.feed(decoder.decode(body[start:start + CHUNK_SIZE]))
+        if parser.done:
+            break
+    else:
+        parser.feed(decoder.decode(b'', final=True))
+    return parser.text()
@@ -0,0 +1,311 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from pipeline.metrics import CIRCUIT_OPENS, FETCH_REJECTIONS, HEDGES
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = 'Mozilla/5.0 (compatible; knowledge-pipeline/1.0)'
+
+# Latencies kept per host (and across all hosts) for the adaptive timeout
+LATENCY_WINDOW = 50
+# Observations needed before a p95 is trusted over the fixed timeout
+MIN_SAMPLES = 5
+# Adaptive timeout: this multiple of the observed p95, never below MIN_TIMEOUT or above the fetcher's timeout
+TIMEOUT_FACTOR = 3
+MIN_TIMEOUT = 5
+
+# Consecutive failures that open a host's circuit, and how long it stays open before one probe is let through
+FAILURE_THRESHOLD = 5
+COOLDOWN = 60
+
+# Send a backup request when the first hasn't answered by the host's p95; off unless PIPELINE_FETCH_HEDGE=on
+HEDGE = os.getenv('PIPELINE_FETCH_HEDGE', 'off').lower() == 'on'
+HEDGE_QUANTILE = 0.95
+
+
+class CircuitOpen(requests.RequestException):
+    """Raised instead of sending a request to a host that has been failing; not retried."""
+
+
+def _quantile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _close_response(future):
+    # The slower of two hedged responses goes unused; closing it returns its connection to the pool
+    if future.exception() is None:
+        response, _ = future.result()
+        response.close()
+
+
+class HostHealth:
+    """Per-host response latencies and failure streaks for one run, with a circuit breaker.
+
+    A host's timeout follows the p95 of its recent latencies (or of all hosts
+    until it has enough of its own). After failure_threshold consecutive
+    connection errors, timeouts or 5xx responses its circuit opens and requests
+    to it are refused for cooldown seconds; then one probe is let through, which
+    closes the circuit on success or reopens it on failure.
+    """
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN, window=LATENCY_WINDOW):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.window = window
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._all_latencies = deque(maxlen=window * 10)
+        self._failures = {}
+        self._open_until = {}
+        self._probing = set()
+
+    def quantile(self, host, q):
+        """q-th quantile of host's recent latencies, falling back to all hosts', or None with too few samples."""
+        with self._lock:
+            samples = self._latencies.get(host, ())
+            if len(samples) < MIN_SAMPLES:
+                samples = self._all_latencies
+            if len(samples) < MIN_SAMPLES:
+                return None
+            return _quantile(samples, q)
+
+    def timeout(self, host, default):
+        p95 = self.quantile(host, 0.95)
+        if p95 is None:
+            return default
+        return min(default, max(MIN_TIMEOUT, p95 * TIMEOUT_FACTOR))
+
+    def is_open(self, host):
+        with self._lock:
+            open_until = self._open_until.get(host)
+            return open_until is not None and time.monotonic() < open_until
+
+    def allow(self, host):
+        """Whether a request to host may go out now; while half-open only one probe at a time may."""
+        with self._lock:
+            open_until = self._open_until.get(host)
+            if open_until is None:
+                return True
+            if time.monotonic() < open_until or host in self._probing:
+                return False
+            self._probing.add(host)
+            return True
+
+    def success(self, host, seconds):
+        with self._lock:
+            if host not in self._latencies:
+                self._latencies[host] = deque(maxlen=self.window)
+            self._latencies[host].append(seconds)
+            self._all_latencies.append(seconds)
+            self._failures[host] = 0
+            self._probing.discard(host)
+            if self._open_until.pop(host, None) is not None:
+                logger.info(f"Circuit for {host} closed again")
+
+    def abandon(self, host):
+        # A request that failed for reasons unrelated to the host's health still ends a probe
+        with self._lock:
+            self._probing.discard(host)
+
+    def failure(self, host):
+        with self._lock:
+            failures = self._failures[host] = self._failures.get(host, 0) + 1
+            probing = host in self._probing
+            self._probing.discard(host)
+            if not probing and (failures < self.failure_threshold or host in self._open_until):
+                return
+            self._open_until[host] = time.monotonic() + self.cooldown
+        CIRCUIT_OPENS.inc(host=host)
+        logger.warning(f"Circuit for {host} opened after {failures} consecutive failures; "
+                       f"skipping it for {self.cooldown}s")
+
+
+class HostLimiter:
+    """Caps concurrent requests per host and spaces out their start times."""
+
+    def __init__(self, per_host=2, min_interval=1.0):
+        self.per_host = per_host
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_start = {}
+
+    def _semaphore(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.Semaphore(self.per_host)
+            return self._semaphores[host]
+
+    def _reserve_start(self, host):
+        # Reserve the next free start slot for this host and return how long to wait for it
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start.get(host, now))
+            self._next_start[host] = start + self.min_interval
+            return start - now
+
+    def acquire(self, host):
+        self._semaphore(host).acquire()
+        delay = self._reserve_start(host)
+        if delay > 0:
+            time.sleep(delay)
+
+    def try_acquire(self, host):
+        """Take a slot for host only if one is free and the host's next start is due; True if taken."""
+        semaphore = self._semaphore(host)
+        if not semaphore.acquire(blocking=False):
+            return False
+        with self._lock:
+            now = time.monotonic()
+            if self._next_start.get(host, now) <= now:
+                self._next_start[host] = now + self.min_interval
+                return True
+        semaphore.release()
+        return False
+
+    def release(self, host):
+        self._semaphore(host).release()
+
+
+class Fetcher:
+    """Concurrent URL fetcher backed by pooled keep-alive sessions.
+
+    Requests to different hosts run in parallel on a bounded thread pool, while
+    requests to the same host are limited by a HostLimiter instead of a global sleep.
+    Timeouts adapt to each host's observed latency with timeout as the ceiling,
+    hosts that keep failing are skipped by a circuit breaker (see HostHealth),
+    and with hedge a slow request gets a backup copy, the first answer winning,
+    when the host has a free slot for it. Either way a get counts once towards
+    the host's health.
+    """
+
+    def __init__(self, max_workers=8, per_host=2, min_interval=1.0, timeout=60, hedge=HEDGE):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.hedge = hedge
+        self.limiter = HostLimiter(per_host=per_host, min_interval=min_interval)
+        self.health = HostHealth()
+        self._local = threading.local()
+        self._hedge_pool = ThreadPoolExecutor(max_workers=max_workers * 2) if hedge else None
+
+    def session(self):
+        # requests.Session is not thread-safe, so each worker thread keeps its own pool
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers['User-Agent'] = USER_AGENT
+            self._local.session = session
+        return session
+
+    def _reject(self, host):
+        FETCH_REJECTIONS.inc(host=host)
+        raise CircuitOpen(f"{host} is failing; circuit open")
+
+    def _get(self, url, kwargs):
+        # (response, seconds) of one request; the caller records it in the host's health
+        start = time.perf_counter()
+        response = self.session().get(url, **kwargs)
+        return response, time.perf_counter() - start
+
+    def _record(self, host, response=None, seconds=None, error=None):
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)) or (response is not None
+                                                                               and response.status_code >= 500):
+            self.health.failure(host)
+        elif error is not None:
+            # A request that failed for reasons unrelated to the host's health still ends a probe
+            self.health.abandon(host)
+        else:
+            self.health.success(host, seconds)
+
+    def _send(self, host, url, kwargs):
+        try:
+            response, seconds = self._get(url, kwargs)
+        except Exception as e:
+            self._record(host, error=e)
+            raise
+        self._record(host, response, seconds)
+        return response
+
+    def _submit(self, host, url, kwargs):
+        # Runs one copy on the hedge pool; the host slot taken for it is given back when it completes
+        try:
+            future = self._hedge_pool.submit(self._get, url, kwargs)
+        except BaseException:
+            self.limiter.release(host)
+            raise
+        future.add_done_callback(lambda _: self.limiter.release(host))
+        return future
+
+    def _hedged(self, host, url, kwargs, delay):
+        primary = self._submit(host, url, kwargs)
+        copies = [primary]
+        # The backup needs a slot of its own, so hedging never takes a host past its limit
+        if not wait([primary], timeout=delay).done and self.limiter.try_acquire(host):
+            copies.append(self._submit(host, url, kwargs))
+        pending = set(copies)
+        winner = None
+        while winner is None and pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((future for future in done if future.exception() is None), None)
+        if winner is None:
+            # Every copy failed: one failure for the host, and the original request's error
+            self._record(host, error=primary.exception())
+            raise primary.exception()
+        if len(copies) > 1:
+            HEDGES.inc(host=host, winner='primary' if winner is primary else 'backup')
+            for loser in copies:
+                if loser is not winner:
+                    loser.add_done_callback(_close_response)
+        response, seconds = winner.result()
+        self._record(host, response, seconds)
+        return response
+
+    def get(self, url, **kwargs):
+        """GET url, raising CircuitOpen straight away if the host's circuit is open."""
+        host = urlsplit(url).netloc.lower()
+        # Refused before queueing on the limiter, so a failing host is skipped without waiting its turn
+        if self.health.is_open(host):
+            self._reject(host)
+        kwargs.setdefault('timeout', self.health.timeout(host, self.timeout))
+        self.limiter.acquire(host)
+        hedged = False
+        try:
+            # Checked again: the circuit may have opened while this request waited
+            if not self.health.allow(host):
+                self._reject(host)
+            delay = self.health.quantile(host, HEDGE_QUANTILE) if self.hedge else None
+            if delay is not None:
+                # Each hedged copy gives its slot back when it completes, this one included
+                hedged = True
+                return self._hedged(host, url, kwargs, delay)
+            return self._send(host, url, kwargs)
+        finally:
+            if not hedged:
+                self.limiter.release(host)
+
+    def imap(self, func, urls, window=None):
+        """Lazily yield (url, func(url)) in input order, keeping at most window calls in flight."""
+        window = window or self.max_workers * 4
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for url in urls:
+                pending.append((url, pool.submit(func, url)))
+                if len(pending) >= window:
+                    url, future = pending.popleft()
+                    yield url, future.result()
+            while pending:
+                url, future = pending.popleft()
+                yield url, future.result()
@@ -0,0 +1,59 @@
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Journal:
+    """Append-only JSONL checkpoint of per-link results.
+
+    Each completed batch is appended and fsynced, so a crash loses at most the
+    batch in flight. Without resume the journal is started afresh; with resume the
+    existing entries are loaded and links already marked done can be skipped.
+    When a link appears more than once, its latest entry wins.
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        if resume and os.path.exists(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn final line from a crash mid-write
+                        logger.warning(f"Skipping unreadable journal line in {path}")
+                        continue
+                    self.entries[entry['url']] = entry
+            logger.info(f"Resuming from {path}: {len(self.entries)} links already journaled")
+        else:
+            open(path, 'w').close()
+
+    def is_done(self, url):
+        entry = self.entries.get(url)
+        return entry is not None and entry['status'] == DONE
+
+    def record(self, results):
+        results = list(results)
+        if not results:
+            return
+        with self._lock:
+            with open(self.path, 'a') as f:
+                for entry in results:
+                    f.write(json.dumps(entry) + '\n')
+                    self.entries[entry['url']] = entry
+                f.flush()
+                os.fsync(f.fileno())
+
+    def results(self):
+        return list(self.entries.values())
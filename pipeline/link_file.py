@@ -0,0 +1,186 @@
+import heapq
+import itertools
+import os
+import re
+import tempfile
+from urllib.parse import urlsplit
+
+# Section contents stay in memory up to this size, then spill to a temp file
+SPOOL_BYTES = 8 * 1024 * 1024
+
+# Lines sorted in memory per run of external_sort
+SORT_CHUNK = 200_000
+
+TWITTER = 'twitter'
+UNSORTED = 'unsorted'
+TWITTER_HOSTS = {'twitter.com', 'x.com'}
+
+# A URL with a scheme, or a host name with an optional port and path (example.com, www.example.com/page)
+URL_TOKEN = re.compile(r'[a-z][a-z0-9+.-]*://\S+|(?:[a-z0-9-]+\.)+[a-z]{2,}(?::\d+)?(?:[/?#]\S*)?', re.IGNORECASE)
+
+
+def link_of(line):
+    """The link a line starts with, without any annotation after it; None for headers, comments and blank lines."""
+    if line.startswith('#'):
+        return None
+    tokens = line.split(None, 1)
+    return tokens[0] if tokens and URL_TOKEN.fullmatch(tokens[0]) else None
+
+
+def looks_like_link(line):
+    return link_of(line) is not None
+
+
+def link_host(link):
+    """Lowercased host of a link, with or without a scheme, minus any www./mobile. prefix."""
+    tokens = link.split(None, 1)
+    link = tokens[0] if tokens else ''
+    host = urlsplit(link if '://' in link else '//' + link).hostname or ''
+    for prefix in ('www.', 'mobile.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    return host
+
+
+def is_twitter_link(link):
+    return link_host(link) in TWITTER_HOSTS
+
+
+def sort_key(line):
+    """Username for a twitter/x link, host for anything else; lines that aren't links sort by their text."""
+    link = link_of(line) or ''
+    host = link_host(link)
+    if host in TWITTER_HOSTS:
+        path = urlsplit(link if '://' in link else '//' + link).path
+        return path.strip('/').split('/')[0].lower()
+    return host or line.strip().lower()
+
+
+class Section:
+    """One header line and the lines under it, held in a spooled temp file."""
+
+    def __init__(self, header=None):
+        self.header = header
+        self._lines = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES, mode='w+')
+
+    @property
+    def name(self):
+        return self.header.strip() if self.header is not None else None
+
+    def append(self, line):
+        self._lines.seek(0, os.SEEK_END)
+        self._lines.write(line if line.endswith('\n') else line + '\n')
+
+    def lines(self):
+        self._lines.seek(0)
+        yield from self._lines
+
+    def links(self):
+        """The links in the section, without their annotations, skipping every line that isn't a link."""
+        for line in self.lines():
+            link = link_of(line)
+            if link is not None:
+                yield link
+
+    def link_lines(self, links):
+        """{link: line} for the first line holding each of links, annotation and all."""
+        found = {}
+        for line in self.lines():
+            link = link_of(line)
+            if link in links and link not in found:
+                found[link] = line if line.endswith('\n') else line + '\n'
+        return found
+
+    def replace(self, lines):
+        """Set the section's lines from an iterable, which may read this section's current lines."""
+        replacement = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES, mode='w+')
+        for line in lines:
+            replacement.write(line if line.endswith('\n') else line + '\n')
+        self._lines.close()
+        self._lines = replacement
+
+
+class LinkFile:
+    """A link file parsed into sections: a header line, then the links under it.
+
+    A line is a link when its first word is a URL or a host name; any words
+    after it are an annotation that stays with the link. Every other line but
+    comments (starting with #) and blank ones is a header. Lines before the
+    first header form a headerless preamble, and everything after the unsorted
+    header belongs to that section. The twitter and unsorted
+    headers are matched case-insensitively; every other header is a category.
+    Loading and saving each stream the file once, and sections spill to disk
+    past SPOOL_BYTES, so large files are handled in bounded memory.
+    """
+
+    def __init__(self):
+        self.sections = [Section()]
+
+    @classmethod
+    def load(cls, path):
+        link_file = cls()
+        with open(path, 'r') as f:
+            for line in f:
+                current = link_file.sections[-1]
+                # The unsorted section runs to the end of the file, whatever its lines look like
+                if (line.strip() and not line.startswith('#') and not looks_like_link(line)
+                        and (current.name or '').lower() != UNSORTED):
+                    link_file.sections.append(Section(line))
+                else:
+                    current.append(line)
+        return link_file
+
+    def section(self, name):
+        """The first section whose header is name (case-insensitive), or None."""
+        for section in self.sections[1:]:
+            if section.name.lower() == name:
+                return section
+        return None
+
+    def categories(self):
+        return [section for section in self.sections[1:] if section.name.lower() not in (TWITTER, UNSORTED)]
+
+    def save(self, path):
+        """Write every section to path through a temp file renamed over it once complete."""
+        out = tempfile.NamedTemporaryFile('w', dir=os.path.dirname(os.path.abspath(path)),
+                                          prefix=os.path.basename(path) + '.', suffix='.tmp', delete=False)
+        try:
+            with out:
+                for section in self.sections:
+                    if section.header is not None:
+                        out.write(section.header if section.header.endswith('\n') else section.header + '\n')
+                    out.writelines(section.lines())
+            os.replace(out.name, path)
+        except BaseException:
+            os.unlink(out.name)
+            raise
+
+
+def _spill(run):
+    f = tempfile.TemporaryFile('w+')
+    f.writelines(run)
+    f.seek(0)
+    return f
+
+
+def external_sort(lines, key, chunk_size=SORT_CHUNK):
+    """Yield lines sorted by key, holding at most chunk_size of them in memory.
+
+    Sorted runs of chunk_size lines are spilled to temp files and merged; input
+    small enough for one run never touches disk. The sort is stable.
+    """
+    lines = iter(lines)
+    runs = []
+    try:
+        while True:
+            run = sorted(itertools.islice(lines, chunk_size), key=key)
+            if not run:
+                break
+            if not runs and len(run) < chunk_size:
+                yield from run
+                return
+            runs.append(_spill(run))
+        yield from heapq.merge(*runs, key=key)
+    finally:
+        for run in runs:
+            run.close()
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from pipeline.metrics import LLM_REQUESTS, record_usage
+from pipeline.page_cache import CACHE_DIR, DAY
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprint(params):
+    """Content address of a chat completion request: model, messages and every other parameter."""
+    payload = json.dumps(params, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    """SQLite-backed cache of chat completion responses keyed on the request fingerprint.
+
+    Entries expire after ttl seconds (None keeps them forever). invalidate() drops
+    every entry for a model, clear() drops everything. Setting LLM_CACHE=off in the
+    environment bypasses the cache entirely.
+    """
+
+    def __init__(self, path=None, ttl=30 * DAY, enabled=None):
+        self.path = path or os.path.join(CACHE_DIR, 'llm.sqlite3')
+        self.ttl = ttl
+        self.enabled = os.getenv('LLM_CACHE', 'on').lower() != 'off' if enabled is None else enabled
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            ' key TEXT PRIMARY KEY,'
+            ' model TEXT NOT NULL,'
+            ' content TEXT NOT NULL,'
+            ' created_at REAL NOT NULL)'
+        )
+        self._conn.commit()
+        if self.ttl is not None:
+            with self._lock:
+                self._conn.execute('DELETE FROM responses WHERE created_at < ?', (time.time() - self.ttl,))
+                self._conn.commit()
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            row = self._conn.execute('SELECT content, created_at FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        content, created_at = row
+        if self.ttl is not None and time.time() - created_at > self.ttl:
+            return None
+        return content
+
+    def put(self, key, model, content):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO responses (key, model, content, created_at) VALUES (?, ?, ?, ?)',
+                               (key, model, content, time.time()))
+            self._conn.commit()
+
+    def invalidate(self, model):
+        with self._lock:
+            count = self._conn.execute('DELETE FROM responses WHERE model = ?', (model,)).rowcount
+            self._conn.commit()
+        logger.info(f"Invalidated {count} cached responses for {model}")
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM responses')
+            self._conn.commit()
+
+
+def message_payload(message):
+    """The useful part of a completion message: tool call arguments for structured output, else its content."""
+    tool_calls = message.get('tool_calls') if isinstance(message, dict) else message.tool_calls
+    if tool_calls:
+        call = tool_calls[0]
+        return call['function']['arguments'] if isinstance(call, dict) else call.function.arguments
+    return message.get('content') if isinstance(message, dict) else message.content
+
+
+def cached_completion(client, cache, refresh=False, **params):
+    """Return the message payload for a chat completion, calling the API only on a cache miss.
+
+    refresh skips the lookup (the fresh response still replaces the cached one), for
+    retries of a request whose cached answer turned out to be unusable.
+    """
+    key = fingerprint(params)
+    content = None if refresh else cache.get(key)
+    if content is not None:
+        logger.info(f"LLM cache hit for {params['model']} ({key[:12]})")
+        LLM_REQUESTS.inc(model=params['model'], cached='true')
+        return content
+    response = client.chat.completions.create(**params)
+    LLM_REQUESTS.inc(model=params['model'], cached='false')
+    record_usage(params['model'], response.usage)
+    choice = response.choices[0]
+    if choice.finish_reason == 'length':
+        logger.warning(f"Completion for {params['model']} hit max_tokens; only its complete result items are usable")
+    content = message_payload(choice.message)
+    cache.put(key, params['model'], content)
+    return content
@@ -0,0 +1,101 @@
+import logging
+import math
+import re
+import zlib
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r"[a-z0-9][a-z0-9'+#.-]*[a-z0-9+#]|[a-z0-9]")
+
+
+class HashingEmbedder:
+    """Offline TF-IDF embedder over hashed unigrams and bigrams.
+
+    This is the default backend for LocalClassifier. Any object with the same
+    fit(texts) / embed(text) interface can be swapped in, as long as embed
+    returns a sparse {feature: weight} dict; a dense vector can be passed as
+    dict(enumerate(vector)).
+    """
+
+    def __init__(self, dimensions=2 ** 20):
+        self.dimensions = dimensions
+        self.idf = {}
+        self.default_idf = 1.0
+
+    def features(self, text):
+        words = WORD_PATTERN.findall(text.lower())
+        grams = words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+        # crc32 rather than hash() so vectors are stable across processes
+        return Counter(zlib.crc32(gram.encode('utf-8')) % self.dimensions for gram in grams)
+
+    def fit(self, texts):
+        document_frequency = Counter()
+        for text in texts:
+            document_frequency.update(set(self.features(text)))
+        total = len(texts)
+        self.idf = {feature: math.log((1 + total) / (1 + count)) + 1 for feature, count in document_frequency.items()}
+        self.default_idf = math.log(1 + total) + 1
+        return self
+
+    def embed(self, text):
+        vector = {feature: (1 + math.log(count)) * self.idf.get(feature, self.default_idf)
+                  for feature, count in self.features(text).items()}
+        return normalize(vector)
+
+
+def normalize(vector):
+    norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+    if not norm:
+        return {}
+    return {feature: weight / norm for feature, weight in vector.items()}
+
+
+def cosine(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(feature, 0.0) for feature, weight in a.items())
+
+
+class LocalClassifier:
+    """Nearest-centroid classifier built from links already filed under each category.
+
+    predict() returns the best category only when it is both similar enough
+    (min_similarity) and clearly ahead of the runner-up (min_margin). Otherwise
+    it returns None and the link should go to the LLM.
+    """
+
+    def __init__(self, embedder=None, min_similarity=0.2, min_margin=0.05, min_examples=3):
+        self.embedder = embedder or HashingEmbedder()
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self.min_examples = min_examples
+        self.centroids = {}
+
+    def fit(self, examples):
+        """Build centroids from a {category: [text, ...]} mapping, ignoring empty texts."""
+        examples = {category: [text for text in texts if text.strip()] for category, texts in examples.items()}
+        examples = {category: texts for category, texts in examples.items() if len(texts) >= self.min_examples}
+        self.embedder.fit([text for texts in examples.values() for text in texts])
+        self.centroids = {}
+        for category, texts in examples.items():
+            centroid = Counter()
+            for text in texts:
+                centroid.update(self.embedder.embed(text))
+            self.centroids[category] = normalize(dict(centroid))
+        logger.info(f"Local classifier trained on {sum(len(t) for t in examples.values())} examples "
+                    f"across {len(self.centroids)} categories")
+        return self
+
+    def predict(self, text):
+        """Return (category or None, similarity, margin) for text."""
+        if not text.strip() or len(self.centroids) < 2:
+            return None, 0.0, 0.0
+        vector = self.embedder.embed(text)
+        scores = sorted(((cosine(vector, centroid), category) for category, centroid in self.centroids.items()),
+                        reverse=True)
+        (best, category), (runner_up, _) = scores[0], scores[1]
+        margin = best - runner_up
+        if best < self.min_similarity or margin < self.min_margin:
+            return None, best, margin
+        return category, best, margin
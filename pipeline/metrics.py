@@ -0,0 +1,185 @@
+import bisect
+import itertools
+import json
+import logging
+import os
+import threading
+
+from pipeline.batching import model_price
+
+logger = logging.getLogger(__name__)
+
+# Where a run's metrics are written; a .json path gets JSON, anything else Prometheus text format
+# (the cache directory is read from the environment here too: page_cache imports this module)
+METRICS_PATH = os.getenv('PIPELINE_METRICS', os.path.join(os.getenv('PIPELINE_CACHE_DIR', '.pipeline_cache'), 'metrics.prom'))
+
+# Seconds, spanning a cached page read to a slow batch completion
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Verbose content logs (prompts, responses) are emitted at debug level for one call in this many
+DEBUG_SAMPLE_EVERY = int(os.getenv('PIPELINE_DEBUG_SAMPLE', 100))
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def prometheus(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        lines.extend(f'{self.name}{_format_labels(key)} {value}' for key, value in sorted(self.values.items()))
+        return lines
+
+    def snapshot(self):
+        return [{'labels': dict(key), 'value': value} for key, value in sorted(self.values.items())]
+
+
+class Histogram:
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            series['counts'][bisect.bisect_left(self.buckets, value)] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def quantile(self, q, **labels):
+        """Upper bound of the bucket holding the q-th quantile, or None without observations."""
+        series = self.series.get(_label_key(labels))
+        if not series or not series['count']:
+            return None
+        rank = q * series['count']
+        for bound, cumulative in zip(self.buckets + (float('inf'),), itertools.accumulate(series['counts'])):
+            if cumulative >= rank:
+                return bound
+        return float('inf')
+
+    def prometheus(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for key, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series['counts']):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(key, [("le", bound)])} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(key)} {series["sum"]}')
+            lines.append(f'{self.name}_count{_format_labels(key)} {series["count"]}')
+        return lines
+
+    def snapshot(self):
+        return [{'labels': dict(key), 'count': series['count'], 'sum': series['sum'],
+                 'buckets': dict(zip([str(bound) for bound in self.buckets] + ['+Inf'], series['counts'])),
+                 'p50': self.quantile(0.5, **dict(key)), 'p99': self.quantile(0.99, **dict(key))}
+                for key, series in sorted(self.series.items())]
+
+
+class Registry:
+    """Named counters and histograms for one process, exported as Prometheus text or JSON."""
+
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, **kwargs):
+        with self._lock:
+            if name not in self.metrics:
+                self.metrics[name] = cls(name, help, **kwargs)
+            return self.metrics[name]
+
+    def counter(self, name, help):
+        return self._get(Counter, name, help)
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def prometheus(self):
+        lines = []
+        for name in sorted(self.metrics):
+            lines.extend(self.metrics[name].prometheus())
+        return '\n'.join(lines) + '\n'
+
+    def json(self):
+        return json.dumps({name: {'type': type(metric).__name__.lower(), 'help': metric.help,
+                                  'series': metric.snapshot()}
+                           for name, metric in sorted(self.metrics.items())}, indent=2)
+
+    def write(self, path=None):
+        path = path or METRICS_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(self.json() if path.endswith('.json') else self.prometheus())
+        logger.info(f"Wrote metrics to {path}")
+
+
+REGISTRY = Registry()
+
+FETCH_SECONDS = REGISTRY.histogram('pipeline_fetch_seconds', 'Time to download and extract a page, by host')
+FETCH_BYTES = REGISTRY.counter('pipeline_fetch_bytes_total', 'Response body bytes downloaded, by host')
+FETCHES = REGISTRY.counter('pipeline_fetches_total', 'Page fetches, by host and outcome')
+FETCH_REJECTIONS = REGISTRY.counter('pipeline_fetch_rejections_total', 'Requests refused without a network call because the host\'s circuit was open, by host')
+CIRCUIT_OPENS = REGISTRY.counter('pipeline_fetch_circuit_opens_total', 'Times a host\'s circuit breaker tripped, by host')
+HEDGES = REGISTRY.counter('pipeline_fetch_hedges_total', 'Backup requests sent for slow requests, by host and which one answered first')
+PARSE_SECONDS = REGISTRY.histogram('pipeline_parse_seconds', 'Time spent in the HTML text extractor per page')
+STAGE_SECONDS = REGISTRY.histogram('pipeline_stage_seconds', 'Time a pipeline stage spends on one item, by stage')
+LINK_SECONDS = REGISTRY.histogram('pipeline_link_seconds', 'End-to-end time from a link entering the pipeline to its result')
+LINKS = REGISTRY.counter('pipeline_links_total', 'Links finished, by outcome')
+LLM_REQUESTS = REGISTRY.counter('pipeline_llm_requests_total', 'Completion requests, by model and whether the cache answered')
+LLM_TOKENS = REGISTRY.counter('pipeline_llm_tokens_total', 'Tokens billed, by model and kind (prompt or completion)')
+LLM_COST = REGISTRY.counter('pipeline_llm_cost_dollars_total', 'Estimated spend in US dollars, by model')
+DOCS_UPDATE_CALLS = REGISTRY.counter('pipeline_docs_batch_update_calls_total', 'Google Docs batchUpdate calls')
+DOCS_UPDATE_REQUESTS = REGISTRY.counter('pipeline_docs_batch_update_requests_total', 'Requests sent in Docs batchUpdate calls, by kind')
+
+
+def record_usage(model, usage, discount=1.0):
+    """Count the tokens and estimated cost of one completion from its usage block (dict or object)."""
+    if usage is None:
+        return
+    prompt = usage['prompt_tokens'] if isinstance(usage, dict) else usage.prompt_tokens
+    completion = usage['completion_tokens'] if isinstance(usage, dict) else usage.completion_tokens
+    LLM_TOKENS.inc(prompt, model=model, kind='prompt')
+    LLM_TOKENS.inc(completion, model=model, kind='completion')
+    prompt_price, completion_price = model_price(model)
+    LLM_COST.inc((prompt * prompt_price + completion * completion_price) / 1000 * discount, model=model)
+
+
+class SampledLog:
+    """Logs one message in every `every` at debug level, building it only when it is emitted.
+
+    For content too large to log on every call, such as full prompts and responses.
+    """
+
+    def __init__(self, log, every=DEBUG_SAMPLE_EVERY):
+        self.log = log
+        self.every = max(1, every)
+        self._count = itertools.count()
+
+    def __call__(self, build):
+        if next(self._count) % self.every == 0 and self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug(build())
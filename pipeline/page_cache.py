@@ -0,0 +1,261 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit
+
+from pipeline.extract import (MAX_BYTES, MAX_CHARS, MAX_PDF_BYTES, content_kind, extract_bytes, extract_prefix,
+                              extract_text, pypdf, read_body)
+from pipeline.metrics import FETCH_BYTES, FETCH_SECONDS, FETCHES, PARSE_SECONDS
+from pipeline.parse_pool import INLINE_BYTES
+from pipeline.urls import canonical_url
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.getenv('PIPELINE_CACHE_DIR', '.pipeline_cache')
+
+DAY = 24 * 60 * 60
+
+
+class NotText(Exception):
+    """The link points at something with no text to extract (a video, an image, an archive)."""
+
+
+class PageCache:
+    """SQLite-backed cache of extracted page text keyed on canonical URL.
+
+    Entries younger than revalidate_after are served without touching the network.
+    Older entries are revalidated with a conditional GET using the stored
+    ETag/Last-Modified. Entries are evicted once older than max_age, and the
+    least recently used ones go first when the cache grows past max_bytes.
+    Links found to hold no text are kept as a skipped verdict instead, which is
+    never revalidated, so they are not downloaded again until it is max_age old.
+    Verdicts for content types since recognised as text are dropped on open.
+    """
+
+    def __init__(self, path=None, max_bytes=200 * 1024 * 1024, max_age=30 * DAY, revalidate_after=DAY):
+        self.path = path or os.path.join(CACHE_DIR, 'pages.sqlite3')
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.revalidate_after = revalidate_after
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS pages ('
+            ' url TEXT PRIMARY KEY,'
+            ' text TEXT NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' etag TEXT,'
+            ' last_modified TEXT,'
+            ' fetched_at REAL NOT NULL,'
+            ' accessed_at REAL NOT NULL,'
+            ' skipped TEXT)'
+        )
+        # Caches created before skipped verdicts were recorded
+        if 'skipped' not in {row[1] for row in self._conn.execute('PRAGMA table_info(pages)')}:
+            self._conn.execute('ALTER TABLE pages ADD COLUMN skipped TEXT')
+        for (reason,) in self._conn.execute('SELECT DISTINCT skipped FROM pages WHERE skipped IS NOT NULL').fetchall():
+            if content_kind(reason) != 'binary':
+                self._conn.execute('DELETE FROM pages WHERE skipped = ?', (reason,))
+        self._conn.commit()
+        self.evict()
+
+    def get(self, url):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT text, size, etag, last_modified, fetched_at, skipped FROM pages WHERE url = ?',
+                (canonical_url(url),)
+            ).fetchone()
+        if row is None:
+            return None
+        text, size, etag, last_modified, fetched_at, skipped = row
+        return {'text': text, 'size': size, 'etag': etag, 'last_modified': last_modified, 'fetched_at': fetched_at,
+                'skipped': skipped}
+
+    def put(self, url, text, size, etag=None, last_modified=None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO pages (url, text, size, etag, last_modified, fetched_at, accessed_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (canonical_url(url), text, size, etag, last_modified, now, now)
+            )
+            self._conn.commit()
+
+    def put_skipped(self, url, reason):
+        """Record that url has no text to extract, and why (its content type, or its size)."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO pages (url, text, size, fetched_at, accessed_at, skipped)'
+                " VALUES (?, '', 0, ?, ?, ?)",
+                (canonical_url(url), now, now, reason)
+            )
+            self._conn.commit()
+
+    def touch(self, url, revalidated=False):
+        now = time.time()
+        with self._lock:
+            if revalidated:
+                self._conn.execute('UPDATE pages SET fetched_at = ?, accessed_at = ? WHERE url = ?',
+                                   (now, now, canonical_url(url)))
+            else:
+                self._conn.execute('UPDATE pages SET accessed_at = ? WHERE url = ?', (now, canonical_url(url)))
+            self._conn.commit()
+
+    def is_fresh(self, entry):
+        return entry['skipped'] is not None or time.time() - entry['fetched_at'] < self.revalidate_after
+
+    def evict(self):
+        with self._lock:
+            expired = self._conn.execute('DELETE FROM pages WHERE fetched_at < ?',
+                                         (time.time() - self.max_age,)).rowcount
+            total = self._conn.execute('SELECT COALESCE(SUM(LENGTH(text)), 0) FROM pages').fetchone()[0]
+            evicted = 0
+            if total > self.max_bytes:
+                rows = self._conn.execute('SELECT url, LENGTH(text) FROM pages WHERE skipped IS NULL ORDER BY accessed_at').fetchall()
+                for url, length in rows:
+                    if total <= self.max_bytes:
+                        break
+                    self._conn.execute('DELETE FROM pages WHERE url = ?', (url,))
+                    total -= length
+                    evicted += 1
+            self._conn.commit()
+        if expired or evicted:
+            logger.info(f"Page cache evicted {expired} expired and {evicted} least recently used entries")
+
+
+def _content_length(response):
+    try:
+        return int(response.headers.get('Content-Length', ''))
+    except ValueError:
+        return None
+
+
+def _preflight(url, response, cache, host):
+    """Kind of body behind a successful response, from its headers alone: 'html' or 'pdf'.
+
+    Anything else, and PDFs over MAX_PDF_BYTES, are closed unread and raise
+    NotText, with the verdict cached so the link is not downloaded again.
+    """
+    content_type = response.headers.get('Content-Type', '')
+    kind = content_kind(content_type, url)
+    length = _content_length(response)
+    if kind == 'binary':
+        reason = content_type.split(';')[0].strip()
+    elif kind == 'pdf' and length is not None and length > MAX_PDF_BYTES:
+        reason = f'PDF of {length} bytes'
+    elif kind == 'pdf' and pypdf is None:
+        # Not cached: installing pypdf makes these links readable
+        response.close()
+        FETCHES.inc(host=host, outcome='skipped')
+        raise NotText(f"{url} is a PDF and pypdf is not installed")
+    else:
+        return kind
+    response.close()
+    cache.put_skipped(url, reason)
+    FETCHES.inc(host=host, outcome='skipped')
+    raise NotText(f"{url} is not text: {reason}")
+
+
+def _request(url, fetcher, cache, host):
+    """(cached text, None, None, None) when the cache can answer, else (None, streamed response, start time, kind).
+
+    Raises NotText for links with nothing to extract, without reading their body.
+    """
+    entry = cache.get(url)
+    if entry is not None and entry['skipped'] is not None:
+        cache.touch(url)
+        FETCHES.inc(host=host, outcome='cached')
+        raise NotText(f"{url} is not text: {entry['skipped']} (cached)")
+    if entry is not None and cache.is_fresh(entry):
+        cache.touch(url)
+        FETCHES.inc(host=host, outcome='cached')
+        return entry['text'], None, None, None
+
+    headers = {}
+    if entry is not None:
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    start = time.perf_counter()
+    response = fetcher.get(url, headers=headers, stream=True)
+    if response.status_code == 304 and entry is not None:
+        response.close()
+        cache.touch(url, revalidated=True)
+        FETCH_SECONDS.observe(time.perf_counter() - start, host=host)
+        FETCHES.inc(host=host, outcome='not_modified')
+        return entry['text'], None, None, None
+    if not response.ok:
+        response.close()
+        FETCHES.inc(host=host, outcome=f'http_{response.status_code}')
+    response.raise_for_status()
+    return None, response, start, _preflight(url, response, cache, host)
+
+
+def fetch_text(url, fetcher, cache, max_chars=MAX_CHARS):
+    """Return the first max_chars of url's text, serving and revalidating through the page cache."""
+    host = urlsplit(url).netloc.lower()
+    text, response, start, kind = _request(url, fetcher, cache, host)
+    if response is None:
+        return text
+
+    if kind == 'pdf':
+        body = read_body(response, max_bytes=MAX_PDF_BYTES)
+        parse_start = time.perf_counter()
+        text, size = extract_bytes(body, max_chars=max_chars), len(body)
+        PARSE_SECONDS.observe(time.perf_counter() - parse_start)
+    else:
+        text, size = extract_text(response, max_chars=max_chars)
+    FETCH_SECONDS.observe(time.perf_counter() - start, host=host)
+    FETCH_BYTES.inc(size, host=host)
+    FETCHES.inc(host=host, outcome='downloaded')
+    cache.put(url, text, size,
+              etag=response.headers.get('ETag'),
+              last_modified=response.headers.get('Last-Modified'))
+    return text
+
+
+def fetch_page(url, fetcher, cache, max_bytes=MAX_BYTES, max_chars=MAX_CHARS, inline_bytes=INLINE_BYTES):
+    """Fetch url through the page cache, leaving the parsing of large pages to a separate parse stage.
+
+    The first inline_bytes of an HTML page are parsed as they arrive, so most
+    pages stop downloading once max_chars of text are in, and come back (and
+    are cached) as {'text': ...}, the same as a cache hit. Pages whose text is
+    not complete by then, and PDFs, come back as the downloaded raw body (at
+    most max_bytes, or MAX_PDF_BYTES for a PDF) with what page_text needs to
+    parse and cache it. Raises NotText for links with nothing to extract.
+    """
+    host = urlsplit(url).netloc.lower()
+    text, response, start, kind = _request(url, fetcher, cache, host)
+    if response is None:
+        return {'text': text}
+
+    if kind == 'pdf':
+        body = read_body(response, max_bytes=MAX_PDF_BYTES)
+        size = len(body)
+    else:
+        text, size, body = extract_prefix(response, inline_bytes, max_chars=max_chars, max_bytes=max_bytes)
+    FETCH_SECONDS.observe(time.perf_counter() - start, host=host)
+    FETCH_BYTES.inc(size, host=host)
+    FETCHES.inc(host=host, outcome='downloaded')
+    if text is not None:
+        cache.put(url, text, size,
+                  etag=response.headers.get('ETag'),
+                  last_modified=response.headers.get('Last-Modified'))
+        return {'text': text}
+    return {'body': body, 'encoding': response.encoding,
+            'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+
+
+def page_text(url, page, cache, parse=extract_bytes, max_chars=MAX_CHARS):
+    """Text of a page from fetch_page: parsed with parse(body, encoding, max_chars) and cached if it was downloaded."""
+    if 'text' in page:
+        return page['text']
+    text = parse(page['body'], page['encoding'], max_chars)
+    cache.put(url, text, len(page['body']), etag=page['etag'], last_modified=page['last_modified'])
+    return text
@@ -0,0 +1,83 @@
+import logging
+
+from pipeline.engine import Unreadable
+from pipeline.fetch import Fetcher
+from pipeline.page_cache import NotText, PageCache, fetch_page, fetch_text, page_text
+from pipeline.parse_pool import ParserPool
+from pipeline.retry import is_transient, with_retries
+
+logger = logging.getLogger(__name__)
+
+# Prompts use this much of each page's text
+EXCERPT_CHARS = 1000
+
+
+def _excerpt(text):
+    if not text.strip():
+        return None, Unreadable("no text extracted")
+    return text[:EXCERPT_CHARS], None
+
+
+def _fetch_failure(url, e):
+    # Anything a retry could fix is left for the engine's final pass
+    reason = f"fetch failed: {e}"
+    if is_transient(e):
+        logger.error(f"Error fetching {url}: {e}")
+        return reason
+    logger.warning(f"Giving up on {url}: {e}")
+    return Unreadable(reason)
+
+
+class PageLoader:
+    """Page text for the classifiers, through one shared fetcher, page cache and parser pool.
+
+    The fetcher pools sessions, bounds concurrency, keeps per-host politeness
+    limits and adapts its timeouts per host (timeout is the ceiling), skipping
+    hosts that keep failing. The start of each HTML page is parsed as it
+    arrives, so most downloads stop once the excerpt is in; pages still short
+    of text are parsed in worker processes, off the threads waiting on the
+    network. Transient fetch errors are retried with backoff.
+    Every method returns (result, reason), result None when there is nothing usable.
+    """
+
+    def __init__(self, timeout=60, fetcher=None, cache=None, parser_pool=None):
+        self.fetcher = fetcher or Fetcher(max_workers=8, per_host=2, min_interval=1.0, timeout=timeout)
+        self.cache = cache or PageCache()
+        self.parser_pool = parser_pool or ParserPool()
+        self._download = with_retries(lambda url: fetch_page(url, self.fetcher, self.cache))
+        self._fetch_text = with_retries(lambda url: fetch_text(url, self.fetcher, self.cache))
+
+    @property
+    def parse_workers(self):
+        # One parse thread per pool process keeps every process busy; inline parsing gains nothing from more
+        return max(1, self.parser_pool.workers)
+
+    def download(self, url):
+        """url's cached text or raw body for parse: the engine's fetch stage."""
+        try:
+            return self._download(url), None
+        except NotText as e:
+            logger.info(f"Skipping {url}: {e}")
+            return None, Unreadable(e)
+        except Exception as e:
+            return None, _fetch_failure(url, e)
+
+    def parse(self, url, page):
+        """The excerpt of a page from download: the engine's parse stage."""
+        try:
+            text = page_text(url, page, self.cache, parse=self.parser_pool.extract)
+        except Exception as e:
+            logger.error(f"Error parsing {url}: {e}")
+            return None, Unreadable(f"parse failed: {e}")
+        return _excerpt(text)
+
+    def text(self, url):
+        """The excerpt of url fetched and parsed in one step on this thread, for one-off reads like training samples."""
+        try:
+            text = self._fetch_text(url)
+        except NotText as e:
+            logger.info(f"Skipping {url}: {e}")
+            return None, Unreadable(e)
+        except Exception as e:
+            return None, _fetch_failure(url, e)
+        return _excerpt(text)
@@ -0,0 +1,67 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from pipeline.extract import MAX_CHARS, extract_bytes
+from pipeline.metrics import PARSE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Worker processes for HTML parsing; 0 parses in the calling thread
+PARSE_WORKERS = int(os.getenv('PIPELINE_PARSE_WORKERS', os.cpu_count() or 1))
+
+# Bodies smaller than this are parsed in the calling thread: shipping them to a worker costs more than parsing
+INLINE_BYTES = 64 * 1024
+
+
+def _timed_extract(body, encoding, max_chars):
+    # Runs in a worker process; the timing goes back with the text since metrics live in the parent
+    start = time.perf_counter()
+    text = extract_bytes(body, encoding, max_chars)
+    return text, time.perf_counter() - start
+
+
+class ParserPool:
+    """Parses downloaded HTML bodies on a pool of worker processes.
+
+    Parsing is CPU-bound, so on threads it would hold the GIL against the fetch
+    threads; in worker processes it scales with cores while fetching carries on.
+    Only the raw bytes go in and the truncated text comes back. The pool is
+    started on first use.
+    """
+
+    def __init__(self, workers=PARSE_WORKERS, inline_bytes=INLINE_BYTES):
+        self.workers = workers
+        self.inline_bytes = inline_bytes
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Forking a process that already runs fetch threads can deadlock, so workers are started
+                # from a fresh interpreter. Like spawn, forkserver still imports the main script into each
+                # worker (as __mp_main__), so a script's module-level setup runs once per worker.
+                method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context(method))
+                logger.info(f"Started {self.workers} HTML parser processes")
+            return self._executor
+
+    def extract(self, body, encoding=None, max_chars=MAX_CHARS):
+        """Text of body, parsed in a worker process unless it is small or the pool is disabled."""
+        if self.workers <= 0 or len(body) < self.inline_bytes:
+            text, seconds = _timed_extract(body, encoding, max_chars)
+        else:
+            text, seconds = self.executor().submit(_timed_extract, body, encoding, max_chars).result()
+        PARSE_SECONDS.observe(seconds)
+        return text
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
@@ -0,0 +1,47 @@
+import logging
+
+import openai
+import requests
+from tenacity import before_sleep_log, retry, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+logger = logging.getLogger(__name__)
+
+# Failures worth another try: the request may well succeed a few seconds later
+TRANSIENT_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+TRANSIENT_ERRORS = (requests.ConnectionError, requests.Timeout, openai.APIConnectionError)
+
+
+def status_of(error):
+    """HTTP status behind an error from requests, openai or tweepy, if it carries one."""
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status
+
+
+def is_transient(error):
+    status = status_of(error)
+    if status is not None:
+        return status in TRANSIENT_STATUSES
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+def is_transient_unthrottled(error):
+    # For calls made through a Dispatcher, which pauses every worker on a 429 itself
+    return is_transient(error) and status_of(error) != 429
+
+
+def with_retries(func, attempts=3, max_wait=30, retry_on=is_transient, wait=None):
+    """Wrap func so transient failures are retried with exponential backoff and full jitter.
+
+    The last error is re-raised once attempts are used up; anything retry_on
+    rejects (a 404, a malformed request) is raised immediately. wait replaces
+    the backoff with a tenacity wait, e.g. one reading the server's reset time.
+    """
+    return retry(
+        stop=stop_after_attempt(attempts),
+        wait=wait or wait_random_exponential(multiplier=1, max=max_wait),
+        retry=retry_if_exception(retry_on),
+        before_sleep=before_sleep_log(logger, logging.WARNING),
+        reraise=True,
+    )(func)
@@ -0,0 +1,94 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from pipeline.page_cache import CACHE_DIR
+from pipeline.urls import url_key
+
+logger = logging.getLogger(__name__)
+
+# Settled links are committed in groups rather than once per link
+COMMIT_EVERY = 500
+
+
+class SeenIndex:
+    """Persistent index of the link occurrences already filed, keyed on url_key.
+
+    A run claims each item's first occurrence, so later occurrences in the same
+    run, whether spelled differently or in another section, are duplicates.
+    Only once the run has filed a link does settle record its source (a document
+    or file) and the link as written there; from then on an occurrence of the
+    item anywhere else is a duplicate. A link that failed or was dead-lettered
+    is never settled, so another source, or a rerun on a renamed or derived
+    file, still processes it. The settling occurrence stays first on every
+    rerun, so re-running a source never drops its own links.
+    Setting DEDUP=off in the environment turns the index off.
+    """
+
+    def __init__(self, path=None, enabled=None):
+        self.path = path or os.path.join(CACHE_DIR, 'seen.sqlite3')
+        self.enabled = os.getenv('DEDUP', 'on').lower() != 'off' if enabled is None else enabled
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS seen ('
+            ' key TEXT PRIMARY KEY,'
+            ' source TEXT NOT NULL,'
+            ' url TEXT NOT NULL,'
+            ' first_seen REAL NOT NULL)'
+        )
+        self._conn.commit()
+        # Keys claimed in this process, so a repeat within one run is caught without a lookup
+        self._claimed = set()
+        self._uncommitted = 0
+        # Duplicates skipped per source since the last flush
+        self.skipped = Counter()
+
+    def claim(self, url, source):
+        """True if this occurrence of url in source is the one to process, False for a duplicate."""
+        if not self.enabled:
+            return True
+        key = url_key(url)
+        url = url.strip()
+        with self._lock:
+            if key in self._claimed:
+                self.skipped[source] += 1
+                return False
+            row = self._conn.execute('SELECT source, url FROM seen WHERE key = ?', (key,)).fetchone()
+            if row is not None and row != (source, url):
+                self.skipped[source] += 1
+                logger.debug(f"Skipping {url} in {source}: already filed as {row[1]} in {row[0]}")
+                return False
+            self._claimed.add(key)
+            return True
+
+    def unique(self, urls, source):
+        """Yield the urls that are not duplicates, claiming them for source."""
+        for url in urls:
+            if self.claim(url, source):
+                yield url
+
+    def settle(self, urls, source):
+        """Record urls as filed in source, so their occurrences in any other source are skipped from now on."""
+        if not self.enabled:
+            return
+        now = time.time()
+        rows = [(url_key(url), source, url.strip(), now) for url in urls]
+        with self._lock:
+            self._conn.executemany('INSERT OR IGNORE INTO seen (key, source, url, first_seen) VALUES (?, ?, ?, ?)', rows)
+            self._uncommitted += len(rows)
+            if self._uncommitted >= COMMIT_EVERY:
+                self._conn.commit()
+                self._uncommitted = 0
+
+    def flush(self):
+        with self._lock:
+            self._conn.commit()
+            self._uncommitted = 0
+            skipped, self.skipped = self.skipped, Counter()
+        for source, count in skipped.items():
+            logger.info(f"Skipped {count} duplicate links in {source}")
@@ -0,0 +1,142 @@
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+TOOL_NAME = 'record_results'
+
+JSON_TYPES = {
+    'object': dict,
+    'array': list,
+    'string': str,
+    'integer': int,
+    'number': (int, float),
+    'boolean': bool,
+}
+
+
+def results_tool(item_schema, description):
+    """Function-calling tool whose single argument is the list of per-item results."""
+    return {
+        'type': 'function',
+        'function': {
+            'name': TOOL_NAME,
+            'description': description,
+            'parameters': {
+                'type': 'object',
+                'properties': {'results': {'type': 'array', 'items': item_schema}},
+                'required': ['results'],
+            },
+        },
+    }
+
+
+def structured_params(params, item_schema, description):
+    """Add the results tool to chat completion params and force the model to call it."""
+    return dict(params, tools=[results_tool(item_schema, description)],
+                tool_choice={'type': 'function', 'function': {'name': TOOL_NAME}})
+
+
+def validate(instance, schema, path='$'):
+    """Check instance against the subset of JSON Schema used here; return a list of error messages."""
+    expected = schema.get('type')
+    if expected:
+        python_type = JSON_TYPES[expected]
+        # bool is an int subclass in Python but not a JSON number
+        if not isinstance(instance, python_type) or (isinstance(instance, bool) and expected != 'boolean'):
+            return [f"{path}: expected {expected}, got {type(instance).__name__}"]
+
+    errors = []
+    if 'enum' in schema and instance not in schema['enum']:
+        errors.append(f"{path}: {instance!r} is not one of the allowed values")
+    if isinstance(instance, str):
+        if len(instance) < schema.get('minLength', 0):
+            errors.append(f"{path}: shorter than {schema['minLength']} characters")
+        if 'maxLength' in schema and len(instance) > schema['maxLength']:
+            errors.append(f"{path}: longer than {schema['maxLength']} characters")
+    if isinstance(instance, (int, float)) and not isinstance(instance, bool):
+        if 'minimum' in schema and instance < schema['minimum']:
+            errors.append(f"{path}: below minimum {schema['minimum']}")
+        if 'maximum' in schema and instance > schema['maximum']:
+            errors.append(f"{path}: above maximum {schema['maximum']}")
+    if isinstance(instance, dict):
+        for name in schema.get('required', []):
+            if name not in instance:
+                errors.append(f"{path}.{name}: required property missing")
+        for name, subschema in schema.get('properties', {}).items():
+            if name in instance:
+                errors.extend(validate(instance[name], subschema, f"{path}.{name}"))
+    if isinstance(instance, list) and 'items' in schema:
+        for index, item in enumerate(instance):
+            errors.extend(validate(item, schema['items'], f"{path}[{index}]"))
+    return errors
+
+
+def complete_items(text):
+    """The whole items at the start of a results array that was cut off part-way, or None without one.
+
+    A response that ran into max_tokens ends mid-item; everything before that
+    item is still usable.
+    """
+    start = text.find('[')
+    if start < 0:
+        return None
+    decoder = json.JSONDecoder()
+    items = []
+    index = start + 1
+    while True:
+        while index < len(text) and text[index] in ', \t\r\n':
+            index += 1
+        if index >= len(text) or text[index] == ']':
+            return items
+        try:
+            item, index = decoder.raw_decode(text, index)
+        except json.JSONDecodeError:
+            return items
+        items.append(item)
+
+
+def parse_results(result):
+    """Return the list of result items from a record_results call, or None if there isn't one.
+
+    result is the tool call's argument string as returned by cached_completion. Models
+    occasionally answer in plain content instead, so a bare JSON object or list is
+    accepted too. A truncated response yields the items that came through whole.
+    """
+    try:
+        payload = json.loads(result or '')
+    except json.JSONDecodeError:
+        items = complete_items(result or '')
+        if items:
+            logger.warning(f"LLM response was cut off; using the {len(items)} complete result items")
+            return items
+        logger.error("LLM response is not valid JSON")
+        return None
+    if isinstance(payload, dict):
+        payload = payload.get('results')
+    if not isinstance(payload, list):
+        logger.error("LLM response has no results list")
+        return None
+    return payload
+
+
+def valid_items(result, item_schema, count, normalize=None):
+    """Map item id (1-based) to each schema-valid item in result; invalid items are logged and dropped.
+
+    normalize, if given, is applied to each item dict before validation, e.g. to map a
+    near-miss category name onto an allowed one.
+    """
+    items = parse_results(result)
+    if items is None:
+        return {}
+    valid = {}
+    for item in items:
+        if normalize and isinstance(item, dict):
+            item = normalize(item)
+        errors = validate(item, item_schema)
+        if errors:
+            logger.warning(f"Dropping invalid result item {item!r}: {'; '.join(errors)}")
+            continue
+        if 1 <= item['id'] <= count:
+            valid.setdefault(item['id'], item)
+    return valid
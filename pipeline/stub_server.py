@@ -0,0 +1,228 @@
+"""Local stand-in for the OpenAI chat completions, files and batches APIs.
+
+Requests carry tools and get a tool call back with one result per numbered
+item, cut off (finish_reason "length") past the request's max_tokens; any
+other request is answered 400. Simulates per-request latency and a
+requests-per-minute limit (answering 429 with Retry-After once it is exceeded)
+so the dispatcher and the classifiers can be exercised without a key or
+network access. Uploaded batch files are worked through on a background
+thread, one completion at a time. Point a run at it with:
+
+    python -m pipeline.stub_server --port 8765 --latency 0.5 --rpm 60
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub python categorize_links_text_file/batch_classify.py links.txt
+"""
+import argparse
+import email.parser
+import json
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+NO_TOOLS = {'error': {'message': 'The stub only answers requests with tools', 'type': 'invalid_request_error'}}
+
+
+def structured_responder(prompt, tool):
+    """Call the requested tool with one result per numbered item, using each enum's first value."""
+    item_schema = tool['function']['parameters']['properties']['results']['items']
+    properties = item_schema['properties']
+    # dict.fromkeys drops repeats such as the "URL1: category1" example in the instructions
+    items = list(dict.fromkeys(re.findall(r'^(?:Link |URL)(\d+):', prompt, re.MULTILINE)))
+    results = []
+    for n in items:
+        result = {'id': int(n)}
+        if 'category' in properties:
+            result['category'] = properties['category'].get('enum', ['Unsorted'])[0]
+        if 'summary' in properties:
+            result['summary'] = ' '.join(['Stub summary text.'] * 30)
+        results.append(result)
+    return json.dumps({'results': results})
+
+
+class StubState:
+    def __init__(self, latency=0.0, rpm=None, window=60):
+        self.latency = latency
+        self.rpm = rpm
+        # The rate limit allows rpm requests per this many seconds; tests shorten it to hit 429s quickly
+        self.window = window
+        self.lock = threading.Lock()
+        self.recent = deque()
+        self.requests = 0
+        self.rejected = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.files = {}
+        self.batches = {}
+
+    def admit(self):
+        """Record a request; return seconds until a slot frees up if it exceeds the rate limit."""
+        with self.lock:
+            now = time.monotonic()
+            while self.recent and now - self.recent[0] >= self.window:
+                self.recent.popleft()
+            if self.rpm and len(self.recent) >= self.rpm:
+                self.rejected += 1
+                return self.window - (now - self.recent[0])
+            self.recent.append(now)
+            self.requests += 1
+            return None
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_POST(self):
+        path = self.path.rstrip('/')
+        if path.endswith('/chat/completions'):
+            request = self.read_json()
+            wait = self.state.admit()
+            if wait is not None:
+                return self.send_json(429, {'error': {'message': 'Rate limit reached', 'type': 'requests'}},
+                                      headers={'Retry-After': f'{wait:.2f}'})
+            if not request.get('tools'):
+                return self.send_json(400, NO_TOOLS)
+            time.sleep(self.state.latency)
+            return self.send_json(200, self.chat_completion(request))
+        if path.endswith('/files'):
+            return self.upload_file()
+        if path.endswith('/batches'):
+            return self.create_batch(self.read_json())
+        self.send_json(404, {'error': {'message': f'Unknown path {self.path}'}})
+
+    def do_GET(self):
+        parts = self.path.split('?')[0].rstrip('/').split('/')
+        if len(parts) >= 3 and parts[-3] == 'files' and parts[-1] == 'content' and parts[-2] in self.state.files:
+            body = self.state.files[parts[-2]]['content']
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            return self.wfile.write(body)
+        if len(parts) >= 2 and parts[-2] == 'batches' and parts[-1] in self.state.batches:
+            return self.send_json(200, self.state.batches[parts[-1]])
+        self.send_json(404, {'error': {'message': f'Unknown path {self.path}'}})
+
+    def chat_completion(self, request):
+        prompt = '\n'.join(message.get('content') or '' for message in request.get('messages', []))
+        tool = request['tools'][0]
+        finish_reason = 'tool_calls'
+        content = structured_responder(prompt, tool)
+        # Same ~4 characters per token estimate as below
+        if request.get('max_tokens') and len(content) // 4 + 1 > request['max_tokens']:
+            content = content[:request['max_tokens'] * 4]
+            finish_reason = 'length'
+        message = {'role': 'assistant', 'content': None, 'tool_calls': [{
+            'id': f'call-stub-{self.state.requests}', 'type': 'function',
+            'function': {'name': tool['function']['name'], 'arguments': content}}]}
+        # Same ~4 characters per token estimate the batcher falls back to
+        prompt_tokens = len(prompt) // 4 + 1
+        completion_tokens = len(content) // 4 + 1
+        with self.state.lock:
+            self.state.prompt_tokens += prompt_tokens
+            self.state.completion_tokens += completion_tokens
+        return {
+            'id': f'chatcmpl-stub-{self.state.requests}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'stub'),
+            'choices': [{'index': 0, 'finish_reason': finish_reason, 'message': message}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                      'total_tokens': prompt_tokens + completion_tokens},
+        }
+
+    def store_file(self, content, filename, purpose):
+        with self.state.lock:
+            file_id = f'file-stub-{len(self.state.files) + 1}'
+            self.state.files[file_id] = {'content': content, 'object': {
+                'id': file_id, 'object': 'file', 'bytes': len(content), 'created_at': int(time.time()),
+                'filename': filename, 'purpose': purpose, 'status': 'processed'}}
+        return self.state.files[file_id]['object']
+
+    def upload_file(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        message = email.parser.BytesParser().parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode('utf-8') + self.rfile.read(length))
+        fields = {}
+        for part in message.get_payload():
+            fields[part.get_param('name', header='content-disposition')] = part
+        upload = fields['file']
+        purpose = fields['purpose'].get_payload(decode=True).decode('utf-8')
+        filename = upload.get_filename() or 'upload.jsonl'
+        self.send_json(200, self.store_file(upload.get_payload(decode=True), filename, purpose))
+
+    def create_batch(self, request):
+        with self.state.lock:
+            batch_id = f'batch-stub-{len(self.state.batches) + 1}'
+            batch = {
+                'id': batch_id, 'object': 'batch', 'endpoint': request['endpoint'], 'errors': None,
+                'input_file_id': request['input_file_id'], 'completion_window': request['completion_window'],
+                'status': 'in_progress', 'output_file_id': None, 'error_file_id': None,
+                'created_at': int(time.time()), 'request_counts': {'total': 0, 'completed': 0, 'failed': 0},
+            }
+            self.state.batches[batch_id] = batch
+        threading.Thread(target=self.run_batch, args=(batch,), daemon=True).start()
+        self.send_json(200, batch)
+
+    def run_batch(self, batch):
+        lines = self.state.files[batch['input_file_id']]['content'].decode('utf-8').splitlines()
+        requests = [json.loads(line) for line in lines if line.strip()]
+        batch['request_counts']['total'] = len(requests)
+        output = []
+        for request in requests:
+            time.sleep(self.state.latency)
+            if request['body'].get('tools'):
+                status, body = 200, self.chat_completion(request['body'])
+            else:
+                status, body = 400, NO_TOOLS
+            output.append(json.dumps({
+                'id': f"batch-req-{request['custom_id']}", 'custom_id': request['custom_id'], 'error': None,
+                'response': {'status_code': status, 'request_id': request['custom_id'], 'body': body},
+            }))
+            batch['request_counts']['completed'] += 1
+        output_file = self.store_file(('\n'.join(output) + '\n').encode('utf-8'), f"{batch['id']}_output.jsonl", 'batch_output')
+        batch.update(output_file_id=output_file['id'], status='completed', completed_at=int(time.time()))
+
+
+def start_stub_server(port=0, latency=0.0, rpm=None, window=60):
+    """Start the stub on a background thread; returns (server, state). Use server.server_port for the port."""
+    handler = type('BoundStubHandler', (StubHandler,), {'state': StubState(latency, rpm, window)})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, handler.state
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub server")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.5, help="seconds per completion")
+    parser.add_argument('--rpm', type=int, default=None, help="requests per minute before answering 429")
+    args = parser.parse_args()
+
+    server, state = start_stub_server(args.port, args.latency, args.rpm)
+    print(f"Stub OpenAI API listening on http://127.0.0.1:{server.server_port}/v1")
+    try:
+        while True:
+            time.sleep(60)
+            print(f"requests={state.requests} rejected={state.rejected} "
+                  f"prompt_tokens={state.prompt_tokens} completion_tokens={state.completion_tokens}")
+    except KeyboardInterrupt:
+        server.shutdown()
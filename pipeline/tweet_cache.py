@@ -0,0 +1,97 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from pipeline.page_cache import CACHE_DIR, DAY
+from pipeline.retry import with_retries
+
+logger = logging.getLogger(__name__)
+
+# Most IDs the v2 tweet lookup endpoint accepts in one request
+LOOKUP_CHUNK = 100
+
+
+class TweetCache:
+    """SQLite-backed cache of hydrated tweets keyed on tweet ID.
+
+    Hydrated tweets (text, author, context annotations) are kept for good.
+    Tweets the API reported as unavailable (deleted, protected, suspended) are
+    remembered for retry_unavailable_after seconds before being looked up again.
+    """
+
+    def __init__(self, path=None, retry_unavailable_after=DAY):
+        self.path = path or os.path.join(CACHE_DIR, 'tweets.sqlite3')
+        self.retry_unavailable_after = retry_unavailable_after
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS tweets ('
+            ' id TEXT PRIMARY KEY,'
+            ' tweet TEXT,'
+            ' error TEXT,'
+            ' fetched_at REAL NOT NULL)'
+        )
+        self._conn.commit()
+
+    def get(self, tweet_id):
+        """The hydrated tweet as a dict, {'error': reason} for a recently unavailable one, or None."""
+        with self._lock:
+            row = self._conn.execute('SELECT tweet, error, fetched_at FROM tweets WHERE id = ?', (tweet_id,)).fetchone()
+        if row is None:
+            return None
+        tweet, error, fetched_at = row
+        if tweet is not None:
+            return json.loads(tweet)
+        if time.time() - fetched_at > self.retry_unavailable_after:
+            return None
+        return {'error': error}
+
+    def put_many(self, tweets, errors):
+        """Store hydrated tweets (dicts with an 'id') and {tweet_id: reason} for unavailable ones."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany('INSERT OR REPLACE INTO tweets (id, tweet, error, fetched_at) VALUES (?, ?, NULL, ?)',
+                                   [(tweet['id'], json.dumps(tweet), now) for tweet in tweets])
+            self._conn.executemany('INSERT OR REPLACE INTO tweets (id, tweet, error, fetched_at) VALUES (?, NULL, ?, ?)',
+                                   [(tweet_id, reason, now) for tweet_id, reason in errors.items()])
+            self._conn.commit()
+
+
+def _tweet_dict(tweet, users):
+    author = users.get(str(tweet.author_id))
+    return {
+        'id': str(tweet.id),
+        'text': tweet.text,
+        'author_id': str(tweet.author_id) if tweet.author_id is not None else None,
+        'author': author.username if author is not None else None,
+        'context_annotations': tweet.context_annotations or [],
+    }
+
+
+def hydrate_tweets(client, tweet_ids, cache):
+    """Look up every tweet ID not already cached, LOOKUP_CHUNK at a time, and cache the results.
+
+    client should be a tweepy.Client created with wait_on_rate_limit=True, so a
+    429 waits for the window reset its rate-limit headers announce; other
+    transient failures are retried with backoff.
+    """
+    missing = [tweet_id for tweet_id in dict.fromkeys(tweet_ids) if cache.get(tweet_id) is None]
+    if not missing:
+        return
+    logger.info(f"Looking up {len(missing)} uncached tweets in {-(-len(missing) // LOOKUP_CHUNK)} requests")
+    get_tweets = with_retries(client.get_tweets)
+    for start in range(0, len(missing), LOOKUP_CHUNK):
+        chunk = missing[start:start + LOOKUP_CHUNK]
+        response = get_tweets(ids=chunk, expansions=['author_id'], user_fields=['username'],
+                              tweet_fields=['text', 'author_id', 'context_annotations'])
+        users = {str(user.id): user for user in (response.includes or {}).get('users', [])}
+        tweets = [_tweet_dict(tweet, users) for tweet in response.data or []]
+        found = {tweet['id'] for tweet in tweets}
+        reasons = {str(error.get('resource_id') or error.get('value')): error.get('detail') or error.get('title')
+                   for error in response.errors or []}
+        errors = {tweet_id: reasons.get(tweet_id) or "tweet unavailable" for tweet_id in chunk if tweet_id not in found}
+        cache.put_many(tweets, errors)
@@ -0,0 +1,66 @@
+import re
+from urllib.parse import unquote, urlsplit, urlunsplit
+
+# Hosts that serve the same content as the canonical host they map to
+HOST_ALIASES = {
+    'x.com': 'twitter.com',
+    'www.x.com': 'twitter.com',
+    'mobile.x.com': 'twitter.com',
+    'www.twitter.com': 'twitter.com',
+    'mobile.twitter.com': 'twitter.com',
+    'm.youtube.com': 'www.youtube.com',
+    'youtube.com': 'www.youtube.com',
+}
+
+# Query parameters that only track where a link was shared from
+TRACKING_PARAMS = {'fbclid', 'gclid', 'dclid', 'msclkid', 'mc_cid', 'mc_eid', 'igshid', 'ref_src', 'ref_url'}
+TRACKING_PREFIXES = ('utm_',)
+# Twitter adds share-source parameters to every copied link
+TWITTER_TRACKING_PARAMS = {'s', 't'}
+
+# A tweet is the same whichever username (or none, /i/) its URL is written with
+TWEET_PATH = re.compile(r'/[^/]+/status(?:es)?/(\d+)')
+
+
+def _is_tracking(name, host):
+    name = name.lower()
+    return (name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+            or (host == 'twitter.com' and name in TWITTER_TRACKING_PARAMS))
+
+
+def canonical_url(url):
+    """Normalize a URL so that trivially different spellings share one cache key.
+
+    Scheme and host are lowercased, default ports, fragments and tracking
+    parameters dropped, and host aliases (x.com for twitter.com) rewritten. The
+    result is still fetchable.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme == 'http' and netloc.endswith(':80')) or (scheme == 'https' and netloc.endswith(':443')):
+        netloc = netloc.rsplit(':', 1)[0]
+    netloc = HOST_ALIASES.get(netloc, netloc)
+    path = parts.path or '/'
+    # Parameters are filtered as written, so the ones kept keep their exact encoding
+    query = '&'.join(param for param in parts.query.split('&')
+                     if param and not _is_tracking(unquote(param.split('=', 1)[0]), netloc))
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+
+def url_key(url):
+    """Identity of the item a link points at, for dedup: canonical_url without scheme, www. or trailing slash.
+
+    Links written without a scheme (example.com/page) get the same key as with
+    one, and a tweet's key is its ID alone.
+    """
+    url = url.strip()
+    if '://' not in url:
+        url = 'http://' + url
+    parts = urlsplit(canonical_url(url))
+    host = parts.netloc[4:] if parts.netloc.startswith('www.') else parts.netloc
+    path = parts.path.rstrip('/')
+    tweet = TWEET_PATH.match(path) if host == 'twitter.com' else None
+    if tweet:
+        return f'twitter.com/status/{tweet.group(1)}'
+    return host + path + ('?' + parts.query if parts.query else '')
@@ -0,0 +1,40 @@
+"""Shared setup for the test suite.
+
+The caches, the seen index and the LLM cache read their settings from the
+environment when the classifier scripts are imported, so the environment is
+pointed at a scratch directory before any test module imports them.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+os.environ.update({
+    'PIPELINE_CACHE_DIR': tempfile.mkdtemp(prefix='pipeline-tests-'),
+    'OPENAI_API_KEY': 'stub',
+    'LLM_CACHE': 'off',
+    'DEDUP': 'off',
+    # The stub server's limit is the one under test, not the client-side one
+    'OPENAI_RPM': str(10 ** 9),
+    'OPENAI_TPM': str(10 ** 12),
+    'PIPELINE_PARSE_WORKERS': '0',
+})
+
+
+@pytest.fixture(scope='session')
+def corpus():
+    from benchmarks.fakes import start_corpus_server
+    server = start_corpus_server()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def fetcher():
+    from pipeline.fetch import Fetcher
+    # Every corpus page lives on one local host, so per-host spacing would only slow the tests down
+    return Fetcher(max_workers=8, per_host=8, min_interval=0, timeout=10)
@@ -0,0 +1,12 @@
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def import_script(directory, name):
+    """Import one of the classifier scripts the way it imports its neighbours, from its own directory."""
+    path = os.path.join(ROOT, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return __import__(name)
@@ -0,0 +1,79 @@
+"""Output budgeting for structured batches, and recovery from truncated responses."""
+import json
+
+from openai import OpenAI
+
+from pipeline.batching import MODEL_LIMITS, RESULTS_FRAMING_TOKENS, count_tokens, item_output_tokens, pack_batches
+from pipeline.llm_cache import LLMCache, cached_completion
+from pipeline.stub_server import start_stub_server
+from pipeline.structured import parse_results, valid_items
+from tests.support import import_script
+
+MODEL = 'gpt-4-turbo-preview'
+LONG_CATEGORY = 'Machine Learning and Deep Learning and Foundation Models and Artificial Intelligence'
+# The stub answers with the first category, so every answer is the longest one
+CATEGORIES = [LONG_CATEGORY, 'Shipbuilding']
+
+
+def label_schema():
+    return {
+        'type': 'object',
+        'properties': {'id': {'type': 'integer'}, 'category': {'type': 'string', 'enum': CATEGORIES}},
+        'required': ['id', 'category'],
+    }
+
+
+def test_item_output_tokens_covers_the_longest_category():
+    item = json.dumps({'id': 187, 'category': LONG_CATEGORY})
+    assert item_output_tokens(label_schema(), MODEL) >= count_tokens(item, MODEL)
+
+
+def test_item_output_tokens_adds_free_text():
+    schema = label_schema()
+    schema['properties']['summary'] = {'type': 'string'}
+    assert item_output_tokens(schema, MODEL, text_tokens=150) >= item_output_tokens(label_schema(), MODEL) + 150
+
+
+def test_packed_batches_fit_the_completion_limit():
+    per_item = item_output_tokens(label_schema(), MODEL)
+    for batch in pack_batches(range(1000), lambda n: 'page text', MODEL, 100, per_item):
+        assert RESULTS_FRAMING_TOKENS + len(batch) * per_item <= MODEL_LIMITS[MODEL]['max_output']
+
+
+def test_truncated_results_keep_their_complete_items():
+    payload = json.dumps({'results': [{'id': n, 'category': LONG_CATEGORY} for n in range(1, 6)]})
+    truncated = payload[:payload.index('{"id": 4') + 5]
+    assert [item['id'] for item in parse_results(truncated)] == [1, 2, 3]
+    assert sorted(valid_items(truncated, label_schema(), 5)) == [1, 2, 3]
+
+
+def test_parse_results_rejects_text_without_results():
+    assert parse_results('not json at all') is None
+
+
+def classify_on_stub(batch_classify, batch, shrink=1):
+    server, state = start_stub_server()
+    client = OpenAI(base_url=f'http://127.0.0.1:{server.server_port}/v1', api_key='stub', max_retries=0)
+    request = batch_classify.classify_request(CATEGORIES, [link['text'] for link in batch])
+    request['max_tokens'] //= shrink
+    try:
+        result = cached_completion(client, LLMCache(enabled=False), **request)
+    finally:
+        server.shutdown()
+    return batch_classify.parse_classifications(result, batch, CATEGORIES)
+
+
+def test_max_tokens_fits_every_answer():
+    batch_classify = import_script('categorize_links_text_file', 'batch_classify')
+    batch = [{'url': f'https://example.com/{n}', 'text': f'page {n}'} for n in range(100)]
+    classified, failed = classify_on_stub(batch_classify, batch)
+    assert len(classified) == len(batch) and not failed
+
+
+def test_truncated_completion_classifies_the_complete_items():
+    batch_classify = import_script('categorize_links_text_file', 'batch_classify')
+    batch = [{'url': f'https://example.com/{n}', 'text': f'page {n}'} for n in range(40)]
+    # Room for only part of the answers: the whole ones are kept, the rest re-queued
+    classified, failed = classify_on_stub(batch_classify, batch, shrink=2)
+    assert classified and failed
+    assert len(classified) + len(failed) == len(batch)
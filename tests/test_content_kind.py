@@ -0,0 +1,53 @@
+"""Text in any content type is read; only bodies with no text are skipped, and not for ever."""
+import time
+
+import pytest
+
+from pipeline.extract import content_kind
+from pipeline.page_cache import DAY, PageCache
+
+
+@pytest.mark.parametrize('content_type, url, kind', [
+    ('', '', 'html'),
+    ('text/html; charset=utf-8', '', 'html'),
+    ('text/plain', '', 'html'),
+    ('application/json', '', 'html'),
+    ('application/ld+json; charset=utf-8', '', 'html'),
+    ('application/javascript', '', 'html'),
+    ('application/x-yaml', '', 'html'),
+    ('application/rss+xml', '', 'html'),
+    ('application/pdf', '', 'pdf'),
+    ('application/octet-stream', 'https://example.com/paper.PDF?download=1', 'pdf'),
+    ('application/octet-stream', 'https://example.com/archive', 'binary'),
+    ('application/zip', '', 'binary'),
+    ('video/mp4', '', 'binary'),
+    ('image/png', '', 'binary'),
+])
+def test_content_kind(content_type, url, kind):
+    assert content_kind(content_type, url) == kind
+
+
+def test_skipped_verdicts_expire(tmp_path):
+    path = str(tmp_path / 'pages.sqlite3')
+    cache = PageCache(path, max_age=30 * DAY)
+    cache.put_skipped('https://example.com/old.mp4', 'video/mp4')
+    cache.put_skipped('https://example.com/new.mp4', 'video/mp4')
+    cache._conn.execute('UPDATE pages SET fetched_at = ? WHERE url = ?',
+                        (time.time() - 31 * DAY, 'https://example.com/old.mp4'))
+    cache._conn.commit()
+
+    cache = PageCache(path, max_age=30 * DAY)
+    assert cache.get('https://example.com/old.mp4') is None
+    assert cache.get('https://example.com/new.mp4')['skipped'] == 'video/mp4'
+
+
+def test_verdicts_for_text_types_are_dropped(tmp_path):
+    path = str(tmp_path / 'pages.sqlite3')
+    cache = PageCache(path)
+    # Recorded before application/json was read as text
+    cache.put_skipped('https://example.com/data.json', 'application/json')
+    cache.put_skipped('https://example.com/archive.zip', 'application/zip')
+
+    cache = PageCache(path)
+    assert cache.get('https://example.com/data.json') is None
+    assert cache.get('https://example.com/archive.zip')['skipped'] == 'application/zip'
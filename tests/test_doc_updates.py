@@ -0,0 +1,183 @@
+"""The planned Docs requests, applied in order, file every link where it belongs, once."""
+import functools
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from pipeline.journal import DONE, Journal
+from tests.support import import_script
+
+doc_updates = import_script('categorize_links', 'doc_updates')
+DocumentIndex = import_script('categorize_links', 'doc_index').DocumentIndex
+
+HEADINGS = ['Shipbuilding', 'Robotics', 'Unsorted']
+LINKS = [f'https://example.com/{n}' for n in range(7)]
+# Which heading each link is filed under, in the order the results come back
+FILED = ['Robotics', 'Shipbuilding', 'Robotics', 'Robotics', 'Shipbuilding', 'Robotics', 'Shipbuilding']
+
+
+def summary(link):
+    return f'Summary of {link}.'
+
+
+def content_of(text, heading_runs=1):
+    """Docs body for plain text: one paragraph per line, the heading names styled HEADING_1.
+
+    Headings are split into heading_runs text runs, as mixed formatting splits them in Docs.
+    """
+    content = []
+    index = 1
+    for line in text.splitlines(keepends=True):
+        end = index + len(line)
+        style = 'HEADING_1' if line.strip() in HEADINGS else 'NORMAL_TEXT'
+        runs = heading_runs if style == 'HEADING_1' else 1
+        cuts = [index + len(line) * n // runs for n in range(runs)] + [end]
+        content.append({'startIndex': index, 'endIndex': end, 'paragraph': {
+            'elements': [{'startIndex': start, 'endIndex': stop, 'textRun': {'content': line[start - index:stop - index]}}
+                         for start, stop in zip(cuts, cuts[1:])],
+            'paragraphStyle': {'namedStyleType': style}}})
+        index = end
+    return content
+
+
+def original_text():
+    return 'Shipbuilding\nhttps://example.com/filed\nRobotics\nUnsorted\n' + ''.join(link + '\n' for link in LINKS)
+
+
+class SimulatedDoc:
+    """Plain-text model of a Docs body (index i is text[i - 1]) recording the text each styling request covers."""
+
+    def __init__(self, text):
+        self.text = text
+        self.bullets = []
+        self.styled = []
+
+    def covered(self, range_):
+        return self.text[range_['startIndex'] - 1:range_['endIndex'] - 1]
+
+    def apply(self, request):
+        if 'insertText' in request:
+            index = request['insertText']['location']['index'] - 1
+            self.text = self.text[:index] + request['insertText']['text'] + self.text[index:]
+        elif 'createParagraphBullets' in request:
+            self.bullets.append(self.covered(request['createParagraphBullets']['range']))
+        elif 'updateParagraphStyle' in request:
+            self.styled.append(self.covered(request['updateParagraphStyle']['range']))
+
+
+def placements(text, heading_runs=1):
+    doc_index = DocumentIndex(content_of(text, heading_runs))
+    return [(doc_index.heading_end(heading), link, summary(link)) for link, heading in zip(LINKS, FILED)]
+
+
+def expected_text():
+    def filed(heading):
+        return ''.join(f'\n{link}\n{summary(link)}\n' for link, under in zip(LINKS, FILED) if under == heading)
+    return ('Shipbuilding\n' + filed('Shipbuilding') + 'https://example.com/filed\nRobotics\n' + filed('Robotics')
+            + 'Unsorted\n' + ''.join(link + '\n' for link in LINKS))
+
+
+def test_plan_keeps_indices_valid_across_chunks():
+    doc = SimulatedDoc(original_text())
+    chunks = list(doc_updates.chunk_updates(doc_updates.plan_updates(placements(doc.text)), max_requests=3))
+    assert len(chunks) > 1
+    for _, chunk in chunks:
+        for request in chunk:
+            doc.apply(request)
+
+    assert doc.text == expected_text()
+    assert sorted(doc.bullets) == sorted(summary(link) + '\n' for link in LINKS)
+    # Each heading's inserted block is set to normal text as a whole
+    assert sorted(doc.styled) == sorted([''.join(f'\n{link}\n{summary(link)}\n' for link, under in zip(LINKS, FILED)
+                                                 if under == heading) for heading in ('Shipbuilding', 'Robotics')])
+
+
+def test_headings_split_over_several_text_runs():
+    doc = SimulatedDoc(original_text())
+    for _, chunk in doc_updates.chunk_updates(doc_updates.plan_updates(placements(doc.text, heading_runs=3))):
+        for request in chunk:
+            doc.apply(request)
+    assert doc.text == expected_text()
+
+    categorize = import_script('categorize_links', 'categorize')
+    assert list(categorize.extract_headings_and_links(content_of(original_text(), heading_runs=3))) == HEADINGS
+
+
+def test_chunk_links_are_the_ones_it_inserts():
+    groups = doc_updates.plan_updates(placements(original_text()))
+    chunks = list(doc_updates.chunk_updates(groups, max_requests=2))
+    assert sorted(link for links, _ in chunks for link in links) == sorted(LINKS)
+    for links, chunk in chunks:
+        inserted = ''.join(request['insertText']['text'] for request in chunk if 'insertText' in request)
+        assert all(link in inserted for link in links)
+
+
+def test_oversized_insert_is_split_in_order():
+    doc = SimulatedDoc(original_text())
+    max_text = 80
+    chunks = list(doc_updates.chunk_updates(doc_updates.plan_updates(placements(doc.text), max_text=max_text),
+                                            max_text=max_text))
+    assert all(sum(len(request['insertText']['text']) for request in chunk if 'insertText' in request) <= max_text
+               for _, chunk in chunks)
+    for _, chunk in chunks:
+        for request in chunk:
+            doc.apply(request)
+    assert doc.text == expected_text()
+    assert sorted(doc.bullets) == sorted(summary(link) + '\n' for link in LINKS)
+
+
+def test_insert_too_large_for_any_chunk_is_rejected():
+    with pytest.raises(ValueError, match='https://example.com/0'):
+        doc_updates.plan_updates([(1, 'https://example.com/0', 'x' * 100)], max_text=50)
+    with pytest.raises(ValueError, match='max_text'):
+        list(doc_updates.chunk_updates(doc_updates.plan_updates(placements(original_text())), max_text=50))
+
+
+class FlakyDocsService:
+    """Docs service applying batchUpdates to a SimulatedDoc, failing the fail_on-th call once."""
+
+    def __init__(self, doc, fail_on=None):
+        self.doc = doc
+        self.fail_on = fail_on
+        self.calls = 0
+
+    def documents(self):
+        return self
+
+    def batchUpdate(self, documentId, body):
+        self.calls += 1
+        if self.calls == self.fail_on:
+            raise HttpError(httplib2.Response({'status': 500}), b'backend error')
+        for request in body['requests']:
+            self.doc.apply(request)
+        return self
+
+    def execute(self):
+        return {}
+
+
+def test_resume_after_a_failed_chunk_files_each_link_once(tmp_path, monkeypatch):
+    categorize = import_script('categorize_links', 'categorize')
+    monkeypatch.setattr(categorize, 'chunk_updates', functools.partial(doc_updates.chunk_updates, max_requests=3))
+    doc = SimulatedDoc(original_text())
+    journal_path = str(tmp_path / 'journal.jsonl')
+    journal = Journal(journal_path)
+    journal.record({'url': link, 'category': heading, 'summary': summary(link), 'heading': 'Unsorted', 'status': DONE}
+                   for link, heading in zip(LINKS, FILED))
+
+    monkeypatch.setattr(categorize, 'docs_service', FlakyDocsService(doc, fail_on=2))
+    categorize.update_document('doc', categorize.build_updates(content_of(doc.text), HEADINGS, journal.results()), journal)
+    assert doc.text != expected_text()
+
+    # The resumed run reads the document as the first run left it
+    journal = Journal(journal_path, resume=True)
+    monkeypatch.setattr(categorize, 'docs_service', FlakyDocsService(doc))
+    categorize.update_document('doc', categorize.build_updates(content_of(doc.text), HEADINGS, journal.results()), journal)
+    for link in LINKS:
+        # Once where it was listed, once where it was filed
+        assert doc.text.count(link + '\n') == 2
+    assert all(entry['applied'] for entry in Journal(journal_path, resume=True).results())
+
+    # A further resume has nothing left to apply
+    assert categorize.build_updates(content_of(doc.text), HEADINGS, journal.results()) == []
@@ -0,0 +1,54 @@
+"""Only fetches that might succeed on another try get the final pass."""
+from pipeline.dead_letter import DeadLetterQueue
+from pipeline.engine import UNREADABLE, ClassificationRun, Unreadable
+from pipeline.journal import DONE, FAILED, Journal
+from pipeline.pages import PageLoader
+
+
+def run_links(tmp_path, fetch, urls):
+    journal = Journal(str(tmp_path / 'journal.jsonl'))
+    dead_letters = DeadLetterQueue(str(tmp_path / 'dead_letter.jsonl'))
+    run = ClassificationRun(
+        journal, dead_letters,
+        fetch=fetch,
+        pack=lambda items: ([item] for item in items),
+        classify=lambda batch, refresh: ([{'url': item['url'], 'status': DONE} for item in batch], []),
+        give_up=lambda item: {'url': item['url'], 'status': FAILED},
+        fetch_workers=2,
+    )
+    run.run({'url': url} for url in urls)
+    return journal, dead_letters
+
+
+def test_final_pass_skips_unreadable_links(tmp_path):
+    calls = []
+
+    def fetch(url):
+        calls.append(url)
+        if url.endswith('/flaky') and calls.count(url) == 1:
+            return None, "fetch failed: 503 Service Unavailable"
+        if url.endswith('/video'):
+            return None, Unreadable("not text: video/mp4")
+        return f"text of {url}", None
+
+    urls = ['https://example.com/ok', 'https://example.com/flaky', 'https://example.com/video']
+    journal, dead_letters = run_links(tmp_path, fetch, urls)
+
+    assert calls.count('https://example.com/flaky') == 2
+    assert calls.count('https://example.com/video') == 1
+    assert {entry['url'] for entry in journal.results()} == {'https://example.com/ok', 'https://example.com/flaky'}
+    assert [(entry['stage'], entry['key']) for entry in dead_letters.pending()] == [
+        (UNREADABLE, 'https://example.com/video')]
+
+
+def test_page_loader_marks_permanent_failures_unreadable(corpus, fetcher):
+    pages = PageLoader(fetcher=fetcher)
+    page, reason = pages.download(f'http://127.0.0.1:{corpus.server_port}/missing')
+    assert page is None and isinstance(reason, Unreadable) and '404' in reason
+
+    page, _ = pages.download(f'http://127.0.0.1:{corpus.server_port}/page/1')
+    assert pages.parse(f'http://127.0.0.1:{corpus.server_port}/page/1', page)[0]
+
+    _, reason = pages.parse('https://example.com/empty', {'body': b'<html><script>x</script></html>', 'encoding': 'utf-8',
+                                                         'etag': None, 'last_modified': None})
+    assert isinstance(reason, Unreadable)
@@ -0,0 +1,150 @@
+"""Adaptive timeouts, the circuit breaker, and hedged requests that stay within the host's limit."""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from pipeline.fetch import MIN_SAMPLES, MIN_TIMEOUT, TIMEOUT_FACTOR, CircuitOpen, Fetcher, HostHealth
+
+
+class SlowServer(ThreadingHTTPServer):
+    """Answers after delays[n] seconds for its n-th request (the last delay after that), counting overlap."""
+
+    daemon_threads = True
+
+    def __init__(self, delays):
+        self.delays = delays
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        super().__init__(('127.0.0.1', 0), SlowHandler)
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            delay = server.delays[min(server.requests, len(server.delays) - 1)]
+            server.requests += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            time.sleep(delay)
+            body = b'ok'
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            # The client gave up on this copy
+            pass
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def slow_server():
+    servers = []
+
+    def start(delays):
+        server = SlowServer(delays)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def warmed_up(fetcher, host, seconds=0.01):
+    # Enough fast samples that the host's p95, and with it the hedge delay, is known
+    for _ in range(MIN_SAMPLES):
+        fetcher.health.success(host, seconds)
+    return fetcher
+
+
+def test_timeout_follows_p95():
+    health = HostHealth()
+    assert health.timeout('a.example', 60) == 60
+
+    for _ in range(MIN_SAMPLES):
+        health.success('a.example', 4.0)
+    assert health.timeout('a.example', 60) == 4.0 * TIMEOUT_FACTOR
+    assert health.timeout('a.example', 10) == 10
+    # A host without samples of its own borrows every host's
+    assert health.timeout('b.example', 60) == 4.0 * TIMEOUT_FACTOR
+
+    for _ in range(MIN_SAMPLES):
+        health.success('c.example', 0.01)
+    assert health.timeout('c.example', 60) == MIN_TIMEOUT
+
+
+def test_circuit_opens_then_lets_one_probe_through():
+    health = HostHealth(failure_threshold=3, cooldown=0.2)
+    for _ in range(2):
+        health.failure('a.example')
+    assert not health.is_open('a.example')
+
+    health.failure('a.example')
+    assert health.is_open('a.example') and not health.allow('a.example')
+
+    time.sleep(0.25)
+    assert health.allow('a.example')
+    assert not health.allow('a.example')
+
+    # A failed probe reopens the circuit straight away, a successful one closes it
+    health.failure('a.example')
+    assert health.is_open('a.example')
+    time.sleep(0.25)
+    assert health.allow('a.example')
+    health.success('a.example', 0.1)
+    assert not health.is_open('a.example') and health.allow('a.example') and health.allow('a.example')
+
+
+def test_open_circuit_refuses_requests():
+    fetcher = Fetcher(min_interval=0)
+    for _ in range(fetcher.health.failure_threshold):
+        fetcher.health.failure('127.0.0.1:9')
+    with pytest.raises(CircuitOpen):
+        fetcher.get('http://127.0.0.1:9/')
+
+
+def test_backup_request_wins(slow_server):
+    server = slow_server([2, 0])
+    host = f'127.0.0.1:{server.server_port}'
+    fetcher = warmed_up(Fetcher(per_host=2, min_interval=0, hedge=True), host)
+
+    start = time.perf_counter()
+    assert fetcher.get(f'http://{host}/').text == 'ok'
+    assert time.perf_counter() - start < 1.5
+    assert server.requests == 2
+
+
+def test_no_backup_without_a_free_slot(slow_server):
+    server = slow_server([0.5, 0])
+    host = f'127.0.0.1:{server.server_port}'
+    fetcher = warmed_up(Fetcher(per_host=1, min_interval=0, hedge=True), host)
+
+    assert fetcher.get(f'http://{host}/').text == 'ok'
+    assert server.requests == 1 and server.max_in_flight == 1
+    # The slot went back when the request completed
+    assert fetcher.limiter.try_acquire(host)
+
+
+def test_hedged_failure_counts_once(slow_server):
+    server = slow_server([2])
+    host = f'127.0.0.1:{server.server_port}'
+    fetcher = warmed_up(Fetcher(per_host=2, min_interval=0, hedge=True), host)
+
+    with pytest.raises(requests.Timeout):
+        fetcher.get(f'http://{host}/', timeout=0.3)
+    assert server.requests == 2
+    assert fetcher.health._failures[host] == 1
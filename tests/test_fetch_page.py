@@ -0,0 +1,79 @@
+"""HTML downloads stop once the excerpt is in; only pages still short of text are handed to the parse stage."""
+from pipeline.extract import CHUNK_SIZE, MAX_CHARS
+from pipeline.page_cache import PageCache, fetch_page, page_text
+from pipeline.parse_pool import ParserPool
+
+PREFIX = 4 * CHUNK_SIZE
+
+
+class FakeResponse:
+    """A streamed 200 response that counts the bytes read from it."""
+
+    def __init__(self, body, content_type='text/html; charset=utf-8'):
+        self.body = body
+        self.headers = {'Content-Type': content_type, 'ETag': '"v1"'}
+        self.status_code = 200
+        self.ok = True
+        self.encoding = 'utf-8'
+        self.read = 0
+        self.closed = False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), chunk_size):
+            chunk = self.body[start:start + chunk_size]
+            self.read += len(chunk)
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+class FakeFetcher:
+    def __init__(self, response):
+        self.response = response
+
+    def get(self, url, headers=None, stream=False):
+        return self.response
+
+
+def page(head_bytes, paragraphs):
+    script = '<script>' + 'x' * head_bytes + '</script>'
+    text = ''.join(f'<p>Paragraph {n} about hulls, keels and dry docks.</p>' for n in range(paragraphs))
+    return f'<html><head>{script}</head><body>{text}</body></html>'.encode('utf-8')
+
+
+def fetch(tmp_path, body):
+    cache = PageCache(str(tmp_path / 'pages.sqlite3'))
+    response = FakeResponse(body)
+    result = fetch_page('https://example.com/page', FakeFetcher(response), cache, inline_bytes=PREFIX)
+    return result, response, cache
+
+
+def test_text_early_in_a_large_page_stops_the_download(tmp_path):
+    body = page(0, 5000)
+    result, response, cache = fetch(tmp_path, body)
+    assert len(result['text']) == MAX_CHARS
+    assert response.read < PREFIX < len(body)
+    assert response.closed
+    assert cache.get('https://example.com/page')['text'] == result['text']
+
+
+def test_small_page_is_parsed_while_downloading(tmp_path):
+    result, response, _ = fetch(tmp_path, page(0, 3))
+    assert result['text'].startswith('Paragraph 0 about hulls')
+    assert response.read == len(page(0, 3))
+
+
+def test_page_short_of_text_in_its_prefix_goes_to_the_parse_stage(tmp_path):
+    body = page(PREFIX * 2, 5000)
+    result, response, cache = fetch(tmp_path, body)
+    assert 'text' not in result
+    assert result['body'] == body
+    assert cache.get('https://example.com/page') is None
+
+    text = page_text('https://example.com/page', result, cache, parse=ParserPool(workers=0).extract)
+    assert text.startswith('Paragraph 0 about hulls')
+    assert cache.get('https://example.com/page')['etag'] == '"v1"'
@@ -0,0 +1,114 @@
+"""A link file survives a load and save unchanged, and only real headers become sections."""
+import pytest
+
+from benchmarks.fakes import page_url
+from pipeline.journal import DONE, Journal
+from pipeline.link_file import LinkFile, external_sort, link_of, sort_key
+from pipeline.stub_server import start_stub_server
+from tests.support import import_script
+
+LINK_FILE = """\
+# reading list, exported
+preamble.example.com/intro
+Shipbuilding
+https://example.com/hull - great overview of hull design
+example.com
+
+Robotics
+github.com/foo/bar   a good repo
+# not a header
+twitter
+https://twitter.com/alice/status/1 thread on welding
+x.com/bob/status/2
+unsorted
+https://example.com/a
+Not a header here either
+www.example.com/b?ref=1 (read later)
+"""
+
+
+def load(tmp_path, text):
+    path = tmp_path / 'links.txt'
+    path.write_text(text)
+    return LinkFile.load(str(path))
+
+
+@pytest.mark.parametrize('line, link', [
+    ('https://example.com/page\n', 'https://example.com/page'),
+    ('https://example.com/page - annotated\n', 'https://example.com/page'),
+    ('example.com\n', 'example.com'),
+    ('sub.example.co.uk:8080/path?q=1 note\n', 'sub.example.co.uk:8080/path?q=1'),
+    ('ftp://files.example.com/a.zip\n', 'ftp://files.example.com/a.zip'),
+    ('Shipbuilding\n', None),
+    ('Machine Learning, Deep Learning\n', None),
+    ('3D, 3D reconstruction, and spatial computing\n', None),
+    ('# https://example.com\n', None),
+    ('\n', None),
+])
+def test_link_of(line, link):
+    assert link_of(line) == link
+
+
+def test_round_trip(tmp_path):
+    link_file = load(tmp_path, LINK_FILE)
+    link_file.save(str(tmp_path / 'saved.txt'))
+    assert (tmp_path / 'saved.txt').read_text() == LINK_FILE
+
+
+def test_round_trip_without_trailing_newline(tmp_path):
+    link_file = load(tmp_path, 'Shipbuilding\nexample.com/a')
+    link_file.save(str(tmp_path / 'saved.txt'))
+    assert (tmp_path / 'saved.txt').read_text() == 'Shipbuilding\nexample.com/a\n'
+
+
+def test_sections(tmp_path):
+    link_file = load(tmp_path, LINK_FILE)
+    assert [section.name for section in link_file.sections] == [None, 'Shipbuilding', 'Robotics', 'twitter', 'unsorted']
+    # Annotated links and bare domains are links, not categories
+    assert [section.name for section in link_file.categories()] == ['Shipbuilding', 'Robotics']
+    assert list(link_file.sections[0].links()) == ['preamble.example.com/intro']
+    assert list(link_file.section('shipbuilding').links()) == ['https://example.com/hull', 'example.com']
+    assert list(link_file.section('robotics').links()) == ['github.com/foo/bar']
+    # Everything after the unsorted header belongs to it, though only links are links
+    unsorted = link_file.section('unsorted')
+    assert 'Not a header here either\n' in list(unsorted.lines())
+    assert list(unsorted.links()) == ['https://example.com/a', 'www.example.com/b?ref=1']
+
+
+def test_link_lines_keep_annotations(tmp_path):
+    twitter = load(tmp_path, LINK_FILE).section('twitter')
+    assert twitter.link_lines({'https://twitter.com/alice/status/1', 'https://example.com/missing'}) == {
+        'https://twitter.com/alice/status/1': 'https://twitter.com/alice/status/1 thread on welding\n'}
+
+
+def test_external_sort_merges_spilled_runs_stably():
+    lines = [f'{key}-{n}\n' for n, key in enumerate('dbcadbca')]
+    expected = sorted(lines, key=lambda line: line[0])
+    assert list(external_sort(lines, key=lambda line: line[0], chunk_size=3)) == expected
+    assert list(external_sort(lines, key=lambda line: line[0])) == expected
+    assert list(external_sort([], key=str)) == []
+
+
+def test_sort_key():
+    assert sort_key('https://x.com/Bob/status/2 a thread\n') == 'bob'
+    assert sort_key('twitter.com/alice/status/1\n') == 'alice'
+    assert sort_key('https://www.Example.com/page\n') == 'example.com'
+    assert sort_key('Not A Link\n') == 'not a link'
+
+
+def test_classified_links_keep_their_annotations(tmp_path, monkeypatch, corpus, fetcher):
+    batch_classify = import_script('categorize_links_text_file', 'batch_classify')
+    server, _ = start_stub_server()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('OPENAI_BASE_URL', f'http://127.0.0.1:{server.server_port}/v1')
+    monkeypatch.setattr(batch_classify.pages, 'fetcher', fetcher)
+    link = page_url(corpus.server_port, 1)
+    (tmp_path / 'links.txt').write_text(f'Shipbuilding\n\nunsorted\n{link} - worth a second read\n')
+    try:
+        batch_classify.classify_links('links.txt', local=False)
+    finally:
+        server.shutdown()
+
+    assert [entry['status'] for entry in Journal('links.txt.journal.jsonl', resume=True).results()] == [DONE]
+    assert (tmp_path / 'classified_links.txt').read_text() == (
+        f'Shipbuilding\n\n{link} - worth a second read\n\nunsorted\n')
@@ -0,0 +1,48 @@
+"""The local classifier only answers when a link is clearly closest to one category's centroid."""
+from pipeline.local_classifier import LocalClassifier
+
+EXAMPLES = {
+    'Robotics': [
+        'robot arm actuators and servo motor control for industrial robots',
+        'humanoid robot locomotion with reinforcement learning controllers',
+        'robot grippers, servo motor torque and robotic manipulation',
+    ],
+    'Shipbuilding': [
+        'hull welding in the shipyard and steel plate for cargo ships',
+        'naval architecture of container ship hulls and ballast tanks',
+        'shipyard dry dock schedules for tanker hull construction',
+    ],
+}
+
+
+def test_confident_prediction():
+    classifier = LocalClassifier().fit(EXAMPLES)
+    category, similarity, margin = classifier.predict('servo motor control for a robot arm')
+    assert category == 'Robotics'
+    assert similarity >= classifier.min_similarity and margin >= classifier.min_margin
+
+
+def test_unrelated_or_ambiguous_text_goes_to_the_llm():
+    classifier = LocalClassifier().fit(EXAMPLES)
+    category, similarity, _ = classifier.predict('sourdough bread recipes with rye flour')
+    assert category is None and similarity < classifier.min_similarity
+
+    # Both centroids match equally well, so the margin is too small to pick one
+    category, _, margin = classifier.predict('robot arm welding ship hull')
+    assert category is None and margin < classifier.min_margin
+
+
+def test_thresholds_decide():
+    text = 'servo motor control for a robot arm'
+    _, similarity, margin = LocalClassifier().fit(EXAMPLES).predict(text)
+    assert LocalClassifier(min_similarity=similarity + 0.01).fit(EXAMPLES).predict(text)[0] is None
+    assert LocalClassifier(min_margin=margin + 0.01).fit(EXAMPLES).predict(text)[0] is None
+
+
+def test_categories_with_too_few_examples_are_left_out():
+    examples = dict(EXAMPLES, Cooking=['sourdough bread recipes', ''])
+    classifier = LocalClassifier().fit(examples)
+    assert set(classifier.centroids) == {'Robotics', 'Shipbuilding'}
+
+    # A single centroid has no runner-up to be measured against
+    assert LocalClassifier().fit({'Robotics': EXAMPLES['Robotics']}).predict('robot arm')[0] is None
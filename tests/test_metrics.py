@@ -0,0 +1,57 @@
+"""A run's metrics export as Prometheus text or JSON, chosen by the output path."""
+import json
+
+from pipeline.batching import model_price
+from pipeline.metrics import LLM_COST, LLM_TOKENS, Registry, record_usage
+
+
+def populated():
+    registry = Registry()
+    fetches = registry.counter('fetches_total', 'Page fetches')
+    fetches.inc(host='a.example', outcome='ok')
+    fetches.inc(2, host='a.example', outcome='ok')
+    fetches.inc(host='b"x', outcome='error')
+    seconds = registry.histogram('fetch_seconds', 'Fetch time', buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 3):
+        seconds.observe(value)
+    return registry
+
+
+def test_prometheus_text():
+    lines = populated().prometheus().splitlines()
+    assert lines[:2] == ['# HELP fetch_seconds Fetch time', '# TYPE fetch_seconds histogram']
+    # Buckets are cumulative and end with +Inf
+    assert 'fetch_seconds_bucket{le="0.1"} 1' in lines
+    assert 'fetch_seconds_bucket{le="1"} 3' in lines
+    assert 'fetch_seconds_bucket{le="+Inf"} 4' in lines
+    assert 'fetch_seconds_sum 4.05' in lines and 'fetch_seconds_count 4' in lines
+    assert 'fetches_total{host="a.example",outcome="ok"} 3' in lines
+    assert 'fetches_total{host="b\\"x",outcome="error"} 1' in lines
+
+
+def test_write_picks_the_format_from_the_path(tmp_path):
+    registry = populated()
+    registry.write(str(tmp_path / 'run' / 'metrics.json'))
+    registry.write(str(tmp_path / 'metrics.prom'))
+
+    with open(tmp_path / 'run' / 'metrics.json') as f:
+        exported = json.load(f)
+    assert exported['fetches_total']['type'] == 'counter'
+    assert {'labels': {'host': 'a.example', 'outcome': 'ok'}, 'value': 3} in exported['fetches_total']['series']
+    [series] = exported['fetch_seconds']['series']
+    assert series['count'] == 4 and series['buckets'] == {'0.1': 1, '1': 2, '+Inf': 1}
+    assert series['p50'] == 1 and series['p99'] == float('inf')
+
+    assert (tmp_path / 'metrics.prom').read_text() == registry.prometheus()
+
+
+def test_record_usage_counts_tokens_and_cost():
+    model = 'test-model'
+    prompt_price, completion_price = model_price(model)
+    record_usage(model, {'prompt_tokens': 1000, 'completion_tokens': 500})
+    record_usage(model, {'prompt_tokens': 1000, 'completion_tokens': 0}, discount=0.5)
+
+    assert LLM_TOKENS.values[(('kind', 'prompt'), ('model', model))] == 2000
+    assert LLM_TOKENS.values[(('kind', 'completion'), ('model', model))] == 500
+    expected = prompt_price + completion_price / 2 + prompt_price / 2
+    assert abs(LLM_COST.values[(('model', model),)] - expected) < 1e-9
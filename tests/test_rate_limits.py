@@ -0,0 +1,127 @@
+"""A 429 from the API must reach the dispatcher and be retried, not fail the batch."""
+import functools
+import random
+from types import SimpleNamespace
+
+import pytest
+from openai import OpenAI
+
+from benchmarks.fakes import TOPICS, FakeDocsService, synthetic_document, synthetic_link_file
+from pipeline.dispatch import Dispatcher, retry_after
+from pipeline.journal import DONE, Journal
+from pipeline.stub_server import start_stub_server
+from pipeline.tweet_cache import TweetCache
+from tests.support import import_script
+
+LINKS = 60
+
+
+def rate_limited_stub():
+    # One request per second: concurrent batches are answered with 429 and a Retry-After under a second
+    return start_stub_server(rpm=1, window=1)
+
+
+def test_categorize_links_end_up_done_under_rate_limit(tmp_path, monkeypatch, corpus, fetcher):
+    categorize = import_script('categorize_links', 'categorize')
+    server, state = rate_limited_stub()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(categorize.pages, 'fetcher', fetcher)
+    monkeypatch.setattr(categorize, 'client', OpenAI(base_url=f'http://127.0.0.1:{server.server_port}/v1',
+                                                     api_key='stub', max_retries=0))
+    docs = FakeDocsService(synthetic_document(corpus.server_port, LINKS))
+    monkeypatch.setattr(categorize, 'docs_service', docs)
+    try:
+        categorize.main('rate-limited')
+    finally:
+        server.shutdown()
+
+    assert state.rejected > 0
+    results = Journal('journal_rate-limited.jsonl', resume=True).results()
+    # categorize files every link in the document, including the one already under each heading
+    assert len(results) == LINKS + len(TOPICS)
+    assert all(entry['status'] == DONE for entry in results)
+    inserted = ''.join(update['insertText']['text'] for update in docs.requests if 'insertText' in update)
+    assert 'Unable to categorize' not in inserted
+
+
+def test_classify_links_end_up_done_under_rate_limit(tmp_path, monkeypatch, corpus, fetcher):
+    batch_classify = import_script('categorize_links_text_file', 'batch_classify')
+    server, state = rate_limited_stub()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('OPENAI_BASE_URL', f'http://127.0.0.1:{server.server_port}/v1')
+    monkeypatch.setattr(batch_classify.pages, 'fetcher', fetcher)
+    # Small batches, so the run makes several concurrent requests for the limit to reject
+    monkeypatch.setattr(batch_classify, 'pack_batches', functools.partial(batch_classify.pack_batches, max_items=10))
+    synthetic_link_file('links.txt', corpus.server_port, LINKS)
+    try:
+        batch_classify.classify_links('links.txt', local=False)
+    finally:
+        server.shutdown()
+
+    assert state.rejected > 0
+    results = Journal('links.txt.journal.jsonl', resume=True).results()
+    assert len(results) == LINKS
+    assert all(entry['status'] == DONE for entry in results)
+
+
+
+def test_tweets_end_up_done_under_rate_limit(tmp_path, monkeypatch):
+    batch_classify_tweets = import_script('categorize_links_text_file', 'batch_classify_tweets')
+    server, state = rate_limited_stub()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('OPENAI_BASE_URL', f'http://127.0.0.1:{server.server_port}/v1')
+    # Every tweet is already hydrated, so the Twitter client is never called
+    monkeypatch.setattr(batch_classify_tweets.tweepy, 'Client', lambda **kwargs: None)
+    monkeypatch.setattr(batch_classify_tweets, 'pack_batches',
+                        functools.partial(batch_classify_tweets.pack_batches, max_items=10))
+    ids = [str(9_000_000 + n) for n in range(LINKS)]
+    TweetCache().put_many([{'id': tweet_id, 'text': f'Welded a hull plate, day {tweet_id}'} for tweet_id in ids], {})
+    with open('tweets.txt', 'w') as f:
+        f.write('Shipbuilding\n\nRobotics\n\ntwitter\n')
+        f.writelines(f'https://twitter.com/someone/status/{tweet_id}\n' for tweet_id in ids)
+    try:
+        batch_classify_tweets.classify_twitter_links('tweets.txt')
+    finally:
+        server.shutdown()
+
+    assert state.rejected > 0
+    results = Journal('tweets.txt.tweets.journal.jsonl', resume=True).results()
+    assert len(results) == LINKS
+    assert all(entry['status'] == DONE for entry in results)
+
+
+class _RateLimited(Exception):
+    status_code = 429
+
+    def __init__(self, headers):
+        super().__init__('rate limited')
+        self.response = SimpleNamespace(headers=headers)
+
+
+@pytest.mark.parametrize('headers, expected', [
+    ({'retry-after-ms': '250'}, 0.25),
+    ({'retry-after': '3'}, 3.0),
+    ({'retry-after': 'Thu, 01 Jan 1970 00:00:00 GMT'}, 0.0),
+    ({'retry-after': 'garbage'}, None),
+    ({'retry-after-ms': 'soon', 'retry-after': 'garbage'}, None),
+    ({}, None),
+])
+def test_retry_after(headers, expected):
+    assert retry_after(_RateLimited(headers)) == expected
+
+
+def test_malformed_retry_after_falls_back_to_backoff(monkeypatch):
+    monkeypatch.setattr(random, 'uniform', lambda low, high: 0)
+    dispatcher = Dispatcher(max_retries=3)
+    pauses = []
+    monkeypatch.setattr(dispatcher.limiter, 'pause', pauses.append)
+    responses = iter([_RateLimited({'retry-after': 'garbage'}), _RateLimited({'retry-after': 'garbage'}), 'done'])
+
+    def call(job):
+        response = next(responses)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    assert dispatcher.call(call, None, 0) == 'done'
+    assert pauses == [1, 2]
@@ -0,0 +1,37 @@
+"""A link is only skipped in other sources once it has been filed in one."""
+from pipeline.seen import SeenIndex
+
+
+def index(tmp_path):
+    return SeenIndex(str(tmp_path / 'seen.sqlite3'), enabled=True)
+
+
+def test_repeats_within_a_run_are_skipped(tmp_path):
+    seen = index(tmp_path)
+    urls = ['https://example.com/a', 'http://www.example.com/a/', 'https://example.com/b']
+    assert list(seen.unique(urls, 'first.txt')) == ['https://example.com/a', 'https://example.com/b']
+    assert seen.skipped == {'first.txt': 1}
+
+
+def test_unfiled_links_stay_open_to_other_sources(tmp_path):
+    seen = index(tmp_path)
+    assert list(seen.unique(['https://example.com/a', 'https://example.com/b'], 'first.txt'))
+    # Only /a was filed; /b failed or was dead-lettered
+    seen.settle(['https://example.com/a'], 'first.txt')
+    seen.flush()
+
+    later = index(tmp_path)
+    urls = ['https://example.com/a?utm_source=x', 'https://example.com/b']
+    assert list(later.unique(urls, 'classified_first.txt')) == ['https://example.com/b']
+    assert later.skipped == {'classified_first.txt': 1}
+
+
+def test_the_settling_source_keeps_its_links(tmp_path):
+    seen = index(tmp_path)
+    seen.settle(['https://example.com/a'], 'first.txt')
+    seen.flush()
+
+    rerun = index(tmp_path)
+    assert list(rerun.unique(['https://example.com/a'], 'first.txt')) == ['https://example.com/a']
+    # A second spelling in the same source is still a duplicate
+    assert not rerun.claim('https://www.example.com/a', 'first.txt')
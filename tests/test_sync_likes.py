@@ -0,0 +1,102 @@
+"""A likes sync stops at the last synced like, checkpoints its mark, and waits out rate limits."""
+import json
+import time
+
+import pytest
+import requests
+
+import twitter_auth
+
+
+def tweet(n):
+    return {'id': str(n), 'text': f'tweet {n}'}
+
+
+class FakeEndpoint:
+    """Liked tweets, newest first, served PAGE pages at a time."""
+
+    PAGE = 2
+
+    def __init__(self, ids, fail_on=None):
+        self.ids = ids
+        self.fail_on = fail_on
+        self.calls = 0
+
+    def __call__(self, url, params):
+        self.calls += 1
+        if self.calls == self.fail_on:
+            raise requests.ConnectionError('connection reset')
+        start = int(params.get('pagination_token', 0))
+        page = {'data': [tweet(n) for n in self.ids[start:start + self.PAGE]], 'meta': {}}
+        if start + self.PAGE < len(self.ids):
+            page['meta']['next_token'] = str(start + self.PAGE)
+        return page
+
+
+def stored(path):
+    with open(path) as f:
+        return [json.loads(line)['id'] for line in f]
+
+
+def test_sync_stops_at_the_newest_synced_like(tmp_path, monkeypatch):
+    store, state = str(tmp_path / 'likes.jsonl'), str(tmp_path / 'likes.state.json')
+    monkeypatch.setattr(twitter_auth, 'connect_to_endpoint', FakeEndpoint([3, 2, 1]))
+    assert twitter_auth.sync_likes('me', store, state) == 3
+    assert twitter_auth.load_sync_state(state) == {'newest_id': '3'}
+
+    endpoint = FakeEndpoint([7, 6, 5, 4, 3, 2, 1])
+    monkeypatch.setattr(twitter_auth, 'connect_to_endpoint', endpoint)
+    assert twitter_auth.sync_likes('me', store, state) == 4
+    # Pages past the one holding the last synced like are never requested
+    assert endpoint.calls == 3
+    assert stored(store) == ['3', '2', '1', '7', '6', '5', '4']
+    assert twitter_auth.load_sync_state(state) == {'newest_id': '7'}
+
+
+def test_interrupted_sync_keeps_its_mark(tmp_path, monkeypatch):
+    store, state = str(tmp_path / 'likes.jsonl'), str(tmp_path / 'likes.state.json')
+    twitter_auth.save_sync_state({'newest_id': '1'}, state)
+    monkeypatch.setattr(twitter_auth, 'connect_to_endpoint', FakeEndpoint([5, 4, 3, 2, 1], fail_on=2))
+    with pytest.raises(requests.ConnectionError):
+        twitter_auth.sync_likes('me', store, state)
+    # The first page is on disk, but the mark only moves once the sync reaches it
+    assert stored(store) == ['5', '4']
+    assert twitter_auth.load_sync_state(state) == {'newest_id': '1'}
+
+    monkeypatch.setattr(twitter_auth, 'connect_to_endpoint', FakeEndpoint([5, 4, 3, 2, 1]))
+    assert twitter_auth.sync_likes('me', store, state) == 2
+    assert stored(store) == ['5', '4', '3', '2']
+    assert twitter_auth.load_sync_state(state) == {'newest_id': '5'}
+
+
+class FakeResponse(requests.Response):
+    def __init__(self, status_code, headers=None, body=None):
+        super().__init__()
+        self.status_code = status_code
+        self.headers.update(headers or {})
+        self._content = json.dumps(body or {}).encode()
+
+
+def test_rate_limited_page_waits_for_the_reset(monkeypatch):
+    responses = [FakeResponse(429, {'x-rate-limit-reset': str(int(time.time()) + 30)}),
+                 FakeResponse(200, body={'data': [tweet(1)]})]
+    monkeypatch.setattr(twitter_auth.requests, 'request', lambda *args, **kwargs: responses.pop(0))
+    sleeps = []
+    monkeypatch.setattr(time, 'sleep', sleeps.append)
+
+    assert twitter_auth.connect_to_endpoint('https://api.twitter.com/2/users/me/liked_tweets', {}) == {
+        'data': [tweet(1)]}
+    assert len(sleeps) == 1 and 29 <= sleeps[0] <= 31
+
+
+def test_client_errors_are_not_retried(monkeypatch):
+    calls = []
+
+    def request(*args, **kwargs):
+        calls.append(args)
+        return FakeResponse(401)
+
+    monkeypatch.setattr(twitter_auth.requests, 'request', request)
+    with pytest.raises(requests.HTTPError):
+        twitter_auth.connect_to_endpoint('https://api.twitter.com/2/users/me/liked_tweets', {})
+    assert len(calls) == 1
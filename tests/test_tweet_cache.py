@@ -0,0 +1,57 @@
+"""Tweets are looked up LOOKUP_CHUNK IDs at a time, and only when the cache can't answer."""
+from types import SimpleNamespace
+
+import tweepy
+
+from pipeline.tweet_cache import LOOKUP_CHUNK, TweetCache, hydrate_tweets
+
+# Tweets the fake API reports as deleted
+DELETED = {'7', '150'}
+
+
+class FakeClient:
+    """tweepy.Client stand-in answering get_tweets from IDs alone, recording each lookup."""
+
+    def __init__(self):
+        self.lookups = []
+
+    def get_tweets(self, ids, **kwargs):
+        self.lookups.append(list(ids))
+        tweets = [SimpleNamespace(id=int(tweet_id), text=f'tweet {tweet_id}', author_id=1, context_annotations=None)
+                  for tweet_id in ids if tweet_id not in DELETED]
+        errors = [{'resource_id': tweet_id, 'title': 'Not Found Error'} for tweet_id in ids if tweet_id in DELETED]
+        return tweepy.Response(data=tweets, includes={'users': [SimpleNamespace(id=1, username='author')]},
+                               errors=errors, meta={})
+
+
+def test_lookups_are_chunked_and_cached(tmp_path):
+    cache = TweetCache(str(tmp_path / 'tweets.sqlite3'))
+    client = FakeClient()
+    ids = [str(n) for n in range(1, 251)]
+    hydrate_tweets(client, ids + ids[:10], cache)
+
+    assert [len(chunk) for chunk in client.lookups] == [LOOKUP_CHUNK, LOOKUP_CHUNK, 50]
+    assert cache.get('1') == {'id': '1', 'text': 'tweet 1', 'author_id': '1', 'author': 'author',
+                              'context_annotations': []}
+    assert cache.get('7') == {'error': 'Not Found Error'}
+
+    # Everything is cached now, unavailable tweets included, so nothing is looked up again
+    hydrate_tweets(client, ids, cache)
+    assert len(client.lookups) == 3
+
+
+def test_only_uncached_tweets_are_looked_up(tmp_path):
+    cache = TweetCache(str(tmp_path / 'tweets.sqlite3'))
+    cache.put_many([{'id': '1', 'text': 'cached'}], {'2': 'gone'})
+    client = FakeClient()
+    hydrate_tweets(client, ['1', '2', '3'], cache)
+    assert client.lookups == [['3']]
+    assert cache.get('1') == {'id': '1', 'text': 'cached'}
+
+
+def test_unavailable_tweets_are_retried_after_a_while(tmp_path):
+    cache = TweetCache(str(tmp_path / 'tweets.sqlite3'), retry_unavailable_after=-1)
+    client = FakeClient()
+    hydrate_tweets(client, ['7', '8'], cache)
+    hydrate_tweets(client, ['7', '8'], cache)
+    assert client.lookups == [['7', '8'], ['7']]
@@ -0,0 +1,47 @@
+"""Links spelled differently for the same item share a key; links to different items never do."""
+import pytest
+
+from pipeline.urls import canonical_url, url_key
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('HTTPS://Example.COM:443/Page#section', 'https://example.com/Page'),
+    ('http://example.com:80', 'http://example.com/'),
+    ('https://x.com/user/status/1', 'https://twitter.com/user/status/1'),
+    ('https://mobile.twitter.com/user/status/1', 'https://twitter.com/user/status/1'),
+    ('https://m.youtube.com/watch?v=abc', 'https://www.youtube.com/watch?v=abc'),
+    ('https://example.com/a?utm_source=x&id=7&UTM_Medium=y&fbclid=z', 'https://example.com/a?id=7'),
+    ('https://example.com/a?q=a%20b&gclid=1', 'https://example.com/a?q=a%20b'),
+    ('https://twitter.com/user/status/1?s=20&t=abc', 'https://twitter.com/user/status/1'),
+])
+def test_canonical_url(url, expected):
+    assert canonical_url(url) == expected
+
+
+def test_share_parameters_are_only_dropped_for_twitter():
+    assert canonical_url('https://example.com/search?s=welding&t=2') == 'https://example.com/search?s=welding&t=2'
+
+
+@pytest.mark.parametrize('spellings', [
+    ['https://example.com/page', 'http://www.example.com/page/', 'example.com/page', 'https://example.com/page?utm_campaign=x'],
+    ['https://twitter.com/alice/status/123', 'https://x.com/bob/status/123?s=20', 'https://twitter.com/i/statuses/123',
+     'mobile.twitter.com/alice/status/123/'],
+    ['https://youtube.com/watch?v=abc', 'https://www.youtube.com/watch?v=abc', 'https://m.youtube.com/watch?v=abc&utm_source=x'],
+])
+def test_spellings_of_one_item_share_a_key(spellings):
+    assert len({url_key(url) for url in spellings}) == 1
+
+
+@pytest.mark.parametrize('first, second', [
+    ('https://twitter.com/alice/status/123', 'https://twitter.com/alice/status/124'),
+    ('https://twitter.com/alice', 'https://twitter.com/bob'),
+    ('https://example.com/watch?v=abc', 'https://example.com/watch?v=abd'),
+    ('https://example.com/Page', 'https://example.com/page'),
+    ('https://example.com/search?s=a', 'https://example.com/search?s=b'),
+])
+def test_different_items_have_different_keys(first, second):
+    assert url_key(first) != url_key(second)
+
+
+def test_tweet_key_is_the_id():
+    assert url_key('https://x.com/alice/status/123?t=xyz') == 'twitter.com/status/123'
@@ -1,9 +1,14 @@
 import tweepy
 import csv
+import logging
 import os
 import requests
 import json
-from tenacity import retry, stop_after_attempt, wait_fixed
+import time
+
+from pipeline.retry import status_of, with_retries
+
+logger = logging.getLogger(__name__)
 
 # Get Twitter API credentials from environment variables
 consumer_key = os.environ.get('TWITTER_API_KEY')
@@ -12,7 +17,16 @@ bearer_token = os.environ.get('TWITTER_BEARER_TOKEN')
 access_token = os.environ.get('TWITTER_ACCESS_TOKEN')
 access_token_secret = os.environ.get('TWITTER_ACCESS_TOKEN_SECRET')
 
-def create_url():
+# Append-only store of every liked tweet synced so far, and the high-water mark of the last sync
+LIKES_STORE = 'liked_tweets.jsonl'
+SYNC_STATE = 'liked_tweets.state.json'
+
+# Most likes the endpoint returns per page
+PAGE_SIZE = 100
+MAX_ATTEMPTS = 5
+
+
+def create_url(user_id=None):
     # Tweet fields are adjustable.
     # Options include:
     # attachments, author_id, context_annotations,
@@ -20,14 +34,12 @@ def create_url():
     # in_reply_to_user_id, lang, non_public_metrics, organic_metrics,
     # possibly_sensitive, promoted_metrics, public_metrics, referenced_tweets,
     # source, text, and withheld
-    tweet_fields = "tweet.fields=lang,author_id"
-    # Be sure to replace your-user-id with your own user ID or one of an authenticating user
+    params = {"tweet.fields": "lang,author_id,created_at", "max_results": PAGE_SIZE}
+    # Be sure to set TWITTER_USER_ID to your own user ID or one of an authenticating user
     # You can find a user ID by using the user lookup endpoint
-    id = "your-user-id"
-    # You can adjust ids to include a single Tweets.
-    # Or you can add to up to 100 comma-separated IDs
+    id = user_id or os.environ.get('TWITTER_USER_ID', "your-user-id")
     url = "https://api.twitter.com/2/users/{}/liked_tweets".format(id)
-    return url, tweet_fields
+    return url, params
 
 
 def bearer_oauth(r):
@@ -40,26 +52,101 @@ def bearer_oauth(r):
     return r
 
 
-def connect_to_endpoint(url, tweet_fields):
+def retry_delay(retry_state):
+    # Rate-limited responses say when the window resets; otherwise back off exponentially
+    error = retry_state.outcome.exception()
+    reset = error.response.headers.get('x-rate-limit-reset') if getattr(error, 'response', None) is not None else None
+    if status_of(error) == 429 and reset:
+        try:
+            return max(0, int(reset) - time.time()) + 1
+        except ValueError:
+            pass
+    return min(5 * 2 ** retry_state.attempt_number, 900)
+
+
+def get_page(url, params):
     response = requests.request(
-        "GET", url, auth=bearer_oauth, params=tweet_fields)
-    print(response.status_code)
-    if response.status_code != 200:
-        raise Exception(
-            "Request returned an error: {} {}".format(
-                response.status_code, response.text
-            )
-        )
+        "GET", url, auth=bearer_oauth, params=params, timeout=30)
+    # 429s and 5xx responses are retried by connect_to_endpoint; other errors are raised as they are
+    response.raise_for_status()
     return response.json()
 
 
+connect_to_endpoint = with_retries(get_page, attempts=MAX_ATTEMPTS, wait=retry_delay)
+
+
+def load_sync_state(path=SYNC_STATE):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_sync_state(state, path=SYNC_STATE):
+    # Written to a temp file and renamed so a crash never leaves a half-written mark
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(path + '.tmp', path)
+
+
+def stored_ids(path=LIKES_STORE):
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {json.loads(line)['id'] for line in f if line.strip()}
+
+
+def sync_likes(user_id=None, store=LIKES_STORE, state_path=SYNC_STATE):
+    """Page through the user's likes, newest first, appending new ones to store until the last synced one.
+
+    The high-water mark (the newest like of the last complete sync) is only
+    moved once this sync reaches it or runs out of pages, so an interrupted sync
+    is simply picked up from the top next time; likes already in the store are
+    never appended twice. Returns the number of likes added.
+    """
+    url, params = create_url(user_id)
+    state = load_sync_state(state_path)
+    last_synced = state.get('newest_id')
+    known = stored_ids(store)
+    newest = None
+    added = 0
+    pages = 0
+    with open(store, 'a') as f:
+        while True:
+            json_response = connect_to_endpoint(url, params)
+            pages += 1
+            tweets = json_response.get('data', [])
+            reached = False
+            for tweet in tweets:
+                newest = newest or tweet['id']
+                if tweet['id'] == last_synced:
+                    reached = True
+                    break
+                if tweet['id'] in known:
+                    continue
+                f.write(json.dumps(tweet) + '\n')
+                known.add(tweet['id'])
+                added += 1
+            # Each page is on disk before the next one is requested
+            f.flush()
+            os.fsync(f.fileno())
+            next_token = json_response.get('meta', {}).get('next_token')
+            if reached or not next_token:
+                break
+            params = dict(params, pagination_token=next_token)
+
+    if newest is not None:
+        save_sync_state(dict(state, newest_id=newest), state_path)
+    logger.info(f"Synced {added} new liked tweets in {pages} pages to {store}")
+    return added
+
+
 def main():
-    url, tweet_fields = create_url()
-    json_response = connect_to_endpoint(url, tweet_fields)
-    print(json.dumps(json_response, indent=4, sort_keys=True))
+    sync_likes()
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     main()
 
 # # Authenticate with Twitter API using bearer token